@@ -1,8 +1,14 @@
 import google.generativeai as genai
 import json
 import os
+import random
+import threading
+import time
+from collections import deque
 from datetime import datetime, timedelta, timezone
+import pytz
 from dotenv import load_dotenv
+from google.api_core import exceptions as google_exceptions
 
 load_dotenv()
 
@@ -13,47 +19,156 @@ if GEMINI_API_KEY:
 else:
     print("Warning: GEMINI_API_KEY not found")
 
-# ====== THÊM HÀM HELPER ĐỂ FIX CONFLICT CHECK ======
-def normalize_teacher_name(teacher_name):
-    """Chuẩn hóa tên giáo viên để so sánh"""
-    if not teacher_name:
-        return ""
-    return ' '.join(teacher_name.strip().lower().split())
-
-def parse_iso_datetime_flexible(dt_str):
-    """Parse datetime linh hoạt, xử lý cả với và không có timezone"""
-    if not dt_str:
-        return None
-    
-    try:
-        # Xử lý string có Z
-        if dt_str.endswith('Z'):
-            dt_str = dt_str.replace('Z', '+00:00')
-        
-        # Nếu không có timezone, thêm timezone mặc định (Vietnam)
-        if 'T' in dt_str and '+' not in dt_str and '-' not in dt_str.split('T')[1]:
-            dt_str = dt_str + '+07:00'
-        
-        return datetime.fromisoformat(dt_str)
-    except ValueError as e:
-        print(f"❌ Error parsing datetime {dt_str}: {e}")
-        return None
-
-def extract_teacher_from_event(cls):
-    """Trích xuất teacher từ event - ưu tiên field teacher trước"""
-    # Ưu tiên field teacher
-    cls_teacher = cls.get('teacher', '')
-    if cls_teacher:
-        return cls_teacher
-    
-    # Fallback: extract từ summary
-    summary = cls.get('summary', '')
-    if ' - ' in summary:
-        parts = summary.split(' - ')
-        if len(parts) >= 2:
-            return parts[1].strip()
-    
-    return ""
+# ====== HELPER CHUẨN HÓA (dùng chung với conflict_engine, giữ import từ ai_agent như cũ) ======
+from schedule_utils import normalize_teacher_name, parse_iso_datetime_flexible, extract_teacher_from_event
+from conflict_engine import TeacherIntervalIndex
+from slot_finder import find_free_slots, DEFAULT_TOP_N, SEARCH_DAYS
+from ai_cache import ai_response_cache, fingerprint, ALL_TAG
+from prompt_builder import build_schedule_table, horizon_window, report_prompt, PROMPT_TIMEZONE
+from event_mirror import add_change_listener
+
+GEMINI_MODEL_NAME = 'gemini-2.5-flash'
+# Timeout của 1 lời gọi Gemini (trước đây không có timeout)
+AI_REQUEST_TIMEOUT_SECONDS = float(os.getenv("AI_REQUEST_TIMEOUT_SECONDS", "30"))
+# Số lời gọi Gemini chạy cùng lúc; các lời gọi khác xếp hàng chờ
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "2"))
+# Chờ trong hàng đợi tối đa N giây rồi báo lỗi (không dồn request vô hạn)
+AI_QUEUE_TIMEOUT_SECONDS = float(os.getenv("AI_QUEUE_TIMEOUT_SECONDS", "30"))
+AI_MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", "2"))
+AI_RETRY_BASE_SECONDS = 1.0
+AI_RETRY_MAX_SECONDS = 8.0
+LATENCY_WINDOW = 200
+
+# Lỗi tạm thời (rate limit / quá tải / timeout) -> thử lại
+RETRYABLE_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+)
+
+
+class GeminiClient:
+    """
+    Giữ 1 GenerativeModel dùng chung cho mọi request (trước đây mỗi lời gọi tạo model mới)
+    Semaphore giới hạn số lời gọi đồng thời - các lời gọi khác xếp hàng; lỗi tạm thời được
+    thử lại với backoff + jitter; ghi lại latency để xem qua /health
+    """
+
+    def __init__(self, model_name=GEMINI_MODEL_NAME, max_concurrency=AI_MAX_CONCURRENCY,
+                 queue_timeout=AI_QUEUE_TIMEOUT_SECONDS, max_retries=AI_MAX_RETRIES):
+        self.model_name = model_name
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._model = None
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.queued = 0
+        self.in_flight = 0
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+    def generate(self, prompt, kind='gemini'):
+        """Gọi generate_content qua pool -> text của response"""
+        queued_at = time.perf_counter()
+        with self._lock:
+            self.queued += 1
+        acquired = self._slots.acquire(timeout=self.queue_timeout)
+        with self._lock:
+            self.queued -= 1
+            if acquired:
+                self.in_flight += 1
+        if not acquired:
+            with self._lock:
+                self.errors += 1
+            raise TimeoutError(f"Gemini queue full: waited {self.queue_timeout}s")
+
+        wait_seconds = time.perf_counter() - queued_at
+        try:
+            attempt = 0
+            while True:
+                started = time.perf_counter()
+                try:
+                    response = self.model.generate_content(
+                        prompt, request_options={'timeout': AI_REQUEST_TIMEOUT_SECONDS}
+                    )
+                    text = response.text
+                except RETRYABLE_ERRORS as e:
+                    if attempt >= self.max_retries:
+                        with self._lock:
+                            self.errors += 1
+                        raise
+                    # Full jitter: tránh các request bị rate limit cùng lúc thử lại cùng lúc
+                    delay = random.uniform(0, min(AI_RETRY_MAX_SECONDS, AI_RETRY_BASE_SECONDS * 2 ** attempt))
+                    attempt += 1
+                    with self._lock:
+                        self.retries += 1
+                    print(f"🔁 Gemini {kind} retry {attempt}/{self.max_retries} in {delay:.2f}s: {e}")
+                    time.sleep(delay)
+                    continue
+                except Exception:
+                    with self._lock:
+                        self.errors += 1
+                    raise
+
+                latency = time.perf_counter() - started
+                with self._lock:
+                    self.calls += 1
+                    self._latencies.append(latency)
+                print(f"⏱️ Gemini {kind}: {latency:.2f}s (queue {wait_seconds:.2f}s, retries {attempt})")
+                return text
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = {
+                'model': self.model_name,
+                'max_concurrency': self.max_concurrency,
+                'in_flight': self.in_flight,
+                'queued': self.queued,
+                'calls': self.calls,
+                'errors': self.errors,
+                'retries': self.retries,
+            }
+        if latencies:
+            stats['latency_p50_seconds'] = round(latencies[len(latencies) // 2], 3)
+            stats['latency_p95_seconds'] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3)
+        return stats
+
+
+gemini_client = GeminiClient()
+
+def _cache_tags(teacher):
+    return (normalize_teacher_name(teacher),) if teacher else (ALL_TAG,)
+
+def _invalidate_ai_cache(calendar_id, upserted, removed_ids, reset=False):
+    """
+    Lịch thay đổi -> bỏ các entry trong bộ nhớ của giáo viên liên quan
+    Tầng đĩa không cần xoá: key chứa hash của chính phần lịch trong prompt nên entry cũ không bao giờ khớp lại
+    (nhờ vậy lần full sync khi khởi động không làm mất cache trên đĩa)
+    """
+    if removed_ids:
+        ai_response_cache.invalidate(include_disk=False)
+    elif upserted:
+        ai_response_cache.invalidate({r.teacher for r in upserted}, include_disk=False)
+
+add_change_listener(_invalidate_ai_cache)
 
 # ====== GIỮ NGUYÊN CÁC HÀM CŨ ======
 def suggest_schedule(existing_classes, teacher=None, duration_hours=1, preferred_times=None):
@@ -64,22 +179,18 @@ def suggest_schedule(existing_classes, teacher=None, duration_hours=1, preferred
         return {"error": "Gemini API key not configured"}
     
     try:
-        # Chuyển lịch hiện tại thành text
-        schedule_text = ""
-        for c in existing_classes:
-            summary = c.get('summary', 'No title')
-            description = c.get('description', '')
-            start = c.get('start', {}).get('dateTime', 'Unknown')
-            end = c.get('end', {}).get('dateTime', 'Unknown')
-            schedule_text += f"- {summary}: {start} to {end}\n"
-            if description:
-                schedule_text += f"  Details: {description}\n"
+        # Chỉ lịch liên quan (giáo viên + khoảng thời gian tới), dạng bảng gọn trong ngân sách token
+        today = datetime.now(PROMPT_TIMEZONE)
+        schedule_text, schedule_stats = build_schedule_table(
+            existing_classes, teacher, *horizon_window(today), focus=today
+        )
 
         # Build prompt cho Gemini
         prompt = f"""
 Bạn là trợ lý AI sắp xếp lịch học. Hãy phân tích lịch hiện tại và gợi ý khung giờ trống.
+Hôm nay: {today.strftime('%Y-%m-%d %a')}
 
-LỊCH HIỆN TẠI:
+LỊCH HIỆN TẠI ({'giáo viên ' + teacher if teacher else 'mọi giáo viên'}, giờ Việt Nam):
 {schedule_text}
 
 YÊU CẦU:
@@ -91,14 +202,17 @@ YÊU CẦU:
 
 Hãy phân tích kỹ và đề xuất khung giờ hợp lý, tránh xung đột.
 """
+        prompt_stats = report_prompt('suggest_schedule', prompt, schedule_stats)
 
-        # Initialize Gemini model
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        
-        response = model.generate_content(prompt)
-        
-        # Extract text from response
-        text = response.text.strip()
+        # Cache theo hash của prompt (= phần lịch + tham số): lịch không đổi thì không gọi lại Gemini
+        cache_key = fingerprint('suggest_schedule', GEMINI_MODEL_NAME, prompt)
+        cached = ai_response_cache.get(cache_key)
+        if cached is not None:
+            print(f"💾 AI suggestion cache hit")
+            return dict(cached, cached=True)
+
+        # Model dùng chung + giới hạn số lời gọi đồng thời
+        text = gemini_client.generate(prompt, kind='suggest_schedule').strip()
         
         # Clean response - remove markdown code blocks if any
         text = text.replace('```json', '').replace('```', '').strip()
@@ -108,6 +222,8 @@ Hãy phân tích kỹ và đề xuất khung giờ hợp lý, tránh xung đột
             
             # Validate result
             if 'start' in result and 'end' in result:
+                result['prompt_stats'] = prompt_stats
+                ai_response_cache.set(cache_key, result, tags=_cache_tags(teacher))
                 return result
             else:
                 return {"error": "Gemini response missing required fields", "raw_response": text}
@@ -121,37 +237,80 @@ Hãy phân tích kỹ và đề xuất khung giờ hợp lý, tránh xung đột
         print(f"Gemini API error: {e}")
         return {"error": f"Gemini service error: {str(e)}"}
 
-def suggest_schedule_fallback(existing_classes, teacher=None, duration_hours=1):
+def suggest_schedule_fallback(existing_classes, teacher=None, duration_hours=1, preferred_times=None,
+                              timezone_name='Asia/Ho_Chi_Minh', top_n=DEFAULT_TOP_N):
     """
-    Fallback logic khi Gemini không hoạt động
+    Gợi ý lịch KHÔNG cần Gemini: tìm khung giờ trống thật trong lịch hiện tại (slot_finder)
     """
     try:
-        # Tìm slot trống đơn giản: ngày mai 9:00 AM
-        from datetime import datetime, timedelta
-        
-        tomorrow = datetime.now() + timedelta(days=1)
-        start_time = tomorrow.replace(hour=9, minute=0, second=0, microsecond=0)
-        end_time = start_time + timedelta(hours=duration_hours)
+        slots = find_free_slots(
+            existing_classes, teacher, duration_hours, preferred_times,
+            timezone_name=timezone_name, top_n=top_n
+        )
+        if not slots:
+            return {"error": f"Không tìm thấy khung giờ trống trong {SEARCH_DAYS} ngày tới", "slots": []}
         
         return {
-            "start": start_time.isoformat(),
-            "end": end_time.isoformat(),
-            "note": "Using fallback scheduling"
+            "start": slots[0]['start'],
+            "end": slots[0]['end'],
+            "slots": slots,
+            "source": "local",
+            "note": "Khung giờ trống tìm từ lịch hiện tại (giờ làm việc 8h-18h)"
         }
     except Exception as e:
         return {"error": f"Fallback failed: {str(e)}"}
 
+def local_conflict_alternatives(existing_classes, teacher, new_start, new_end,
+                                timezone_name='Asia/Ho_Chi_Minh', top_n=2):
+    """
+    Khung giờ thay thế tính cục bộ khi bị trùng lịch (trả về ngay, không chờ Gemini):
+    cùng thời lượng, ưu tiên đúng giờ đã chọn ở các ngày khác, từ ngày muốn tạo trở đi
+    """
+    try:
+        start_dt = parse_iso_datetime_flexible(new_start)
+        end_dt = parse_iso_datetime_flexible(new_end)
+        if not start_dt or not end_dt:
+            return []
+        tz = pytz.timezone(timezone_name)
+        local_start = start_dt.astimezone(tz)
+        search_from = max(datetime.now(tz), local_start.replace(hour=0, minute=0, second=0, microsecond=0))
+        slots = find_free_slots(
+            existing_classes, teacher, (end_dt - start_dt).total_seconds() / 3600,
+            preferred_times=[local_start.strftime('%H:%M')], timezone_name=timezone_name,
+            start_from=search_from, top_n=top_n
+        )
+        return [
+            {
+                'start': slot['start'],
+                'end': slot['end'],
+                'description': 'Khung giờ trống (cùng giờ)' if slot['preferred'] else 'Khung giờ trống gần nhất'
+            }
+            for slot in slots
+        ]
+    except Exception as e:
+        print(f"⚠️ Local alternatives error: {e}")
+        return []
+
 # Function chính với fallback
-def get_schedule_suggestion(existing_classes, teacher=None, duration_hours=1, preferred_times=None):
+def get_schedule_suggestion(existing_classes, teacher=None, duration_hours=1, preferred_times=None,
+                            use_ai=False, timezone_name='Asia/Ho_Chi_Minh', top_n=DEFAULT_TOP_N):
     """
-    Main function với fallback mechanism
+    Main function: tìm slot trống cục bộ trước; chỉ gọi Gemini khi use_ai=True
     """
+    local_result = suggest_schedule_fallback(
+        existing_classes, teacher, duration_hours, preferred_times, timezone_name, top_n
+    )
+    if not use_ai:
+        return local_result
+    
     result = suggest_schedule(existing_classes, teacher, duration_hours, preferred_times)
     
     if 'error' in result:
-        print(f"Gemini failed: {result['error']}, using fallback")
-        return suggest_schedule_fallback(existing_classes, teacher, duration_hours)
+        print(f"Gemini failed: {result['error']}, using local slots")
+        return local_result
     
+    result['source'] = 'gemini'
+    result['slots'] = local_result.get('slots', [])
     return result
 
 # ====== AI-POWERED CONFLICT CHECK - ĐÃ SỬA LỖI ======
@@ -166,33 +325,18 @@ def ai_check_schedule_conflict(existing_classes, teacher, new_start, new_end, ex
     try:
         print(f"🤖 AI đang phân tích xung đột cho giáo viên: {teacher}")
         
-        # Format lịch hiện tại cho AI
-        schedule_text = ""
-        teacher_events_count = 0
-        
-        for cls in existing_classes:
-            # Bỏ qua event hiện tại nếu đang edit
-            if exclude_event_id and cls.get('id') == exclude_event_id:
-                continue
-                
-            summary = cls.get('summary', 'No title')
-            start = cls.get('start', {}).get('dateTime', 'Unknown')
-            end = cls.get('end', {}).get('dateTime', 'Unknown')
-            
-            # Parse teacher từ event - DÙNG HÀM MỚI
-            cls_teacher = extract_teacher_from_event(cls)
-            
-            schedule_text += f"- {summary} (GV: {cls_teacher}): {start} to {end}\n"
-            
-            # Đếm số event của giáo viên này - DÙNG SO SÁNH CHUẨN HÓA
-            if cls_teacher and normalize_teacher_name(teacher) == normalize_teacher_name(cls_teacher):
-                teacher_events_count += 1
-
         # Tính thời lượng - DÙNG HÀM PARSE MỚI
         new_start_dt = parse_iso_datetime_flexible(new_start)
         new_end_dt = parse_iso_datetime_flexible(new_end)
         duration_hours = (new_end_dt - new_start_dt).total_seconds() / 3600 if new_start_dt and new_end_dt else 0
 
+        # Chỉ lịch của giáo viên này quanh thời gian muốn tạo, dạng bảng gọn trong ngân sách token
+        schedule_text, schedule_stats = build_schedule_table(
+            existing_classes, teacher, *horizon_window(new_start_dt),
+            focus=new_start_dt, exclude_event_id=exclude_event_id
+        )
+        teacher_events_count = schedule_stats['events_in_window']
+
         # Build prompt cho AI
         prompt = f"""
 Bạn là trợ lý AI kiểm tra xung đột lịch học THÔNG MINH.
@@ -201,9 +345,9 @@ THÔNG TIN KIỂM TRA:
 - Giáo viên: {teacher}
 - Thời gian muốn tạo: {new_start} to {new_end} 
 - Thời lượng: {duration_hours:.1f} giờ
-- Giáo viên này hiện có {teacher_events_count} sự kiện
+- Giáo viên này có {teacher_events_count} sự kiện trong khoảng đang xét
 
-LỊCH HIỆN TẠI:
+LỊCH HIỆN TẠI CỦA GIÁO VIÊN (giờ Việt Nam):
 {schedule_text}
 
 HÃY PHÂN TÍCH VÀ TRẢ LỜI:
@@ -236,11 +380,15 @@ TRẢ VỀ ĐỊNH DẠNG JSON SAU:
 Chú ý: Chỉ kiểm tra xung đột trực tiếp, đề xuất thời gian hợp lý.
 """
 
-        # Gọi Gemini
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        response = model.generate_content(prompt)
+        prompt_stats = report_prompt('ai_check_schedule_conflict', prompt, schedule_stats)
+        cache_key = fingerprint('ai_check_schedule_conflict', GEMINI_MODEL_NAME, prompt)
+        cached = ai_response_cache.get(cache_key)
+        if cached is not None:
+            print(f"💾 AI conflict analysis cache hit")
+            return dict(cached, cached=True)
         
-        text = response.text.strip()
+        # Gọi Gemini
+        text = gemini_client.generate(prompt, kind='ai_check_schedule_conflict').strip()
         text = text.replace('```json', '').replace('```', '').strip()
         
         print(f"🤖 AI Response: {text}")
@@ -248,107 +396,57 @@ Chú ý: Chỉ kiểm tra xung đột trực tiếp, đề xuất thời gian h
         try:
             result = json.loads(text)
             print(f"✅ AI Conflict check completed: {result.get('has_conflict')}")
+            result['prompt_stats'] = prompt_stats
+            ai_response_cache.set(cache_key, result, tags=_cache_tags(teacher))
             return result
             
         except json.JSONDecodeError as e:
             print(f"❌ AI JSON parse error: {e}")
-            # Fallback về logic thông thường
-            return traditional_conflict_check(existing_classes, teacher, new_start, new_end, exclude_event_id)
+            # Không chạy lại traditional check - caller đã có kết quả traditional
+            return {"error": f"Failed to parse Gemini response: {str(e)}", "raw_response": text}
             
     except Exception as e:
         print(f"❌ AI conflict check error: {e}")
-        # Fallback về logic thông thường
-        return traditional_conflict_check(existing_classes, teacher, new_start, new_end, exclude_event_id)
+        return {"error": f"Gemini service error: {str(e)}"}
 
-def traditional_conflict_check(existing_classes, teacher, new_start, new_end, exclude_event_id=None):
+def traditional_conflict_check(existing_classes, teacher, new_start, new_end, exclude_event_id=None, index=None):
     """
-    Traditional check TỐI ƯU - ĐÃ SỬA LỖI TIMEZONE
+    Traditional check TỐI ƯU - dùng chỉ mục khoảng thời gian theo giáo viên
+    index: TeacherIntervalIndex có sẵn (từ mirror); nếu không có thì build từ existing_classes
     """
     try:
         print(f"⚡ FAST traditional check for: {teacher}")
         print(f"📅 New event: {new_start} to {new_end}")
         
-        # DÙNG HÀM PARSE MỚI - linh hoạt timezone
-        new_start_dt = parse_iso_datetime_flexible(new_start)
-        new_end_dt = parse_iso_datetime_flexible(new_end)
-        
-        if not new_start_dt or not new_end_dt:
-            print(f"❌ Invalid datetime: new_start={new_start}, new_end={new_end}")
-            return {'has_conflict': False, 'error': 'Invalid datetime format'}
-        
-        # ✅ CHUYỂN TẤT CẢ VỀ UTC ĐỂ SO SÁNH CHUẨN
-        new_start_utc = new_start_dt.astimezone(timezone.utc)
-        new_end_utc = new_end_dt.astimezone(timezone.utc)
-        
-        print(f"🌍 UTC Time: {new_start_utc} to {new_end_utc}")
+        if index is None:
+            # Chỉ index events của giáo viên này - không parse thời gian của giáo viên khác
+            index = TeacherIntervalIndex.from_events(
+                existing_classes, only_teacher=normalize_teacher_name(teacher)
+            )
+            print(f"🔍 Indexed {len(index)} events for teacher: '{teacher}'")
         
-        conflicts = []
-        normalized_teacher = normalize_teacher_name(teacher)
+        return index.check(teacher, new_start, new_end, exclude_event_id)
         
-        print(f"🔍 Checking {len(existing_classes)} events for teacher: '{teacher}'")
-        
-        teacher_match_count = 0
-        
-        for cls in existing_classes:
-            # Bỏ qua event hiện tại nếu đang edit
-            if exclude_event_id and cls.get('id') == exclude_event_id:
-                continue
-            
-            # DÙNG HÀM EXTRACT MỚI - ưu tiên field teacher
-            cls_teacher = extract_teacher_from_event(cls)
-            
-            if not cls_teacher:
-                continue
-                
-            # SO SÁNH CHUẨN HÓA - chính xác hơn
-            cls_normalized = normalize_teacher_name(cls_teacher)
-            teacher_match = (cls_normalized == normalized_teacher)
-            
-            if teacher_match:
-                teacher_match_count += 1
-                
-                cls_start_str = cls.get('start', {}).get('dateTime', '')
-                cls_end_str = cls.get('end', {}).get('dateTime', '')
-                
-                if cls_start_str and cls_end_str:
-                    # DÙNG HÀM PARSE MỚI
-                    cls_start = parse_iso_datetime_flexible(cls_start_str)
-                    cls_end = parse_iso_datetime_flexible(cls_end_str)
-                    
-                    if cls_start and cls_end:
-                        # ✅ CHUYỂN SANG UTC ĐỂ SO SÁNH
-                        cls_start_utc = cls_start.astimezone(timezone.utc)
-                        cls_end_utc = cls_end.astimezone(timezone.utc)
-                        
-                        print(f"  🔍 Comparing with: {cls.get('summary')}")
-                        print(f"     Local: {cls_start} to {cls_end}")
-                        print(f"     UTC: {cls_start_utc} to {cls_end_utc}")
-                        
-                        # Kiểm tra overlap TRONG UTC
-                        time_conflict = (new_start_utc < cls_end_utc) and (new_end_utc > cls_start_utc)
-                        
-                        if time_conflict:
-                            conflicts.append({
-                                'event_summary': cls.get('summary', 'No title'),
-                                'event_teacher': cls_teacher,
-                                'event_start': cls_start_str,
-                                'event_end': cls_end_str,
-                                'conflict_type': 'teacher_schedule_conflict',
-                                'timezone_note': f"Conflict detected in UTC time (same actual time)"
-                            })
-                            print(f"     🚨 CONFLICT DETECTED - Same actual time!")
-                        else:
-                            print(f"     ✅ No conflict - Different timezones")
+    except Exception as e:
+        print(f"❌ Traditional conflict check error: {e}")
+        return {'has_conflict': False, 'error': str(e)}
+
+def traditional_series_conflict_check(existing_classes, teacher, occurrences, exclude_event_id=None, index=None):
+    """
+    Traditional check cho lớp lặp lại - kiểm tra MỌI buổi đề xuất trong 1 lượt quét
+    occurrences: [(start, end)] datetime có tz (từ recurrence_engine.expand_series)
+    """
+    try:
+        print(f"⚡ FAST series check for: {teacher} ({len(occurrences)} occurrences)")
         
-        print(f"📊 Checked {teacher_match_count} events with teacher '{teacher}', found {len(conflicts)} conflicts")
+        if index is None:
+            index = TeacherIntervalIndex.from_events(
+                existing_classes, only_teacher=normalize_teacher_name(teacher)
+            )
+            print(f"🔍 Indexed {len(index)} events for teacher: '{teacher}'")
         
-        return {
-            'has_conflict': len(conflicts) > 0,
-            'conflicts': conflicts,
-            'conflict_count': len(conflicts),
-            'ai_analysis': f'Kiểm tra nhanh: {len(conflicts)} xung đột' if conflicts else 'Không có xung đột'
-        }
+        return index.check_series(teacher, occurrences, exclude_event_id)
         
     except Exception as e:
-        print(f"❌ Traditional conflict check error: {e}")
-        return {'has_conflict': False, 'error': str(e)}
\ No newline at end of file
+        print(f"❌ Traditional series check error: {e}")
+        return {'has_conflict': False, 'error': str(e)}
@@ -0,0 +1,166 @@
+# backend/ai_cache.py
+"""
+Cache kết quả Gemini (gợi ý lịch, phân tích xung đột).
+
+Key = hash của phần lịch đưa vào prompt + tham số request, nên lịch không đổi
+thì không gọi lại Gemini. Tầng bộ nhớ có TTL + LRU; tầng đĩa (SQLite, tuỳ chọn)
+giữ kết quả qua các lần restart. Mỗi entry gắn tag giáo viên để mirror xoá
+đúng các entry bị ảnh hưởng khi lịch thay đổi.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+AI_CACHE_TTL_SECONDS = float(os.getenv("AI_CACHE_TTL_SECONDS", "1800"))
+AI_CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", "256"))
+# Để trống = chỉ cache trong bộ nhớ
+AI_CACHE_DISK_PATH = os.getenv("AI_CACHE_DISK_PATH", "")
+
+# Tag cho entry phụ thuộc toàn bộ lịch (không gắn với 1 giáo viên)
+ALL_TAG = "*"
+
+
+def fingerprint(*parts):
+    """Hash ổn định của các phần (dict/list/str...) dùng làm cache key"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, ttl_seconds=AI_CACHE_TTL_SECONDS, max_entries=AI_CACHE_MAX_ENTRIES,
+                 disk_path=AI_CACHE_DISK_PATH):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.disk_path = Path(disk_path) if disk_path else None
+        # key -> (expires_at, tags, value)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+
+    # ---------------- Memory + disk ----------------
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[2]
+                del self._entries[key]
+
+        entry = self._disk_get(key, now)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._store_locked(key, entry)
+        return entry[2]
+
+    def set(self, key, value, tags=(ALL_TAG,)):
+        entry = (time.time() + self.ttl_seconds, frozenset(tags), value)
+        with self._lock:
+            self._store_locked(key, entry)
+        self._disk_set(key, entry)
+
+    def invalidate(self, tags=None, include_disk=True):
+        """Xoá entry có tag trùng (hoặc gắn ALL_TAG); tags=None: xoá hết"""
+        tags = None if tags is None else set(tags)
+        with self._lock:
+            if tags is None:
+                removed = len(self._entries)
+                self._entries.clear()
+            else:
+                stale = [k for k, e in self._entries.items() if ALL_TAG in e[1] or e[1] & tags]
+                for key in stale:
+                    del self._entries[key]
+                removed = len(stale)
+        if include_disk:
+            self._disk_invalidate(tags)
+        return removed
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'disk': str(self.disk_path) if self.disk_path else None
+            }
+
+    def _store_locked(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    # ---------------- Disk tier (SQLite) ----------------
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            self.disk_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.disk_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ai_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    tags TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            self._local.conn = conn
+        return conn
+
+    def _disk_get(self, key, now):
+        if not self.disk_path:
+            return None
+        try:
+            row = self._connect().execute(
+                "SELECT value, tags, expires_at FROM ai_cache WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"⚠️ AI cache disk read error: {e}")
+            return None
+        if row is None:
+            return None
+        tags = frozenset(t for t in row[1].split(",") if t)
+        return (row[2], tags, json.loads(row[0]))
+
+    def _disk_set(self, key, entry):
+        if not self.disk_path:
+            return
+        expires_at, tags, value = entry
+        try:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO ai_cache (key, value, tags, expires_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), f",{','.join(sorted(tags))},", expires_at)
+            )
+            conn.execute("DELETE FROM ai_cache WHERE expires_at <= ?", (time.time(),))
+        except sqlite3.Error as e:
+            print(f"⚠️ AI cache disk write error: {e}")
+
+    def _disk_invalidate(self, tags):
+        if not self.disk_path:
+            return
+        try:
+            conn = self._connect()
+            if tags is None:
+                conn.execute("DELETE FROM ai_cache")
+                return
+            for tag in set(tags) | {ALL_TAG}:
+                conn.execute("DELETE FROM ai_cache WHERE tags LIKE ?", (f"%,{tag},%",))
+        except sqlite3.Error as e:
+            print(f"⚠️ AI cache disk invalidate error: {e}")
+
+
+ai_response_cache = ResponseCache()
@@ -0,0 +1,84 @@
+# backend/ai_jobs.py
+"""
+Chạy các lời gọi Gemini chậm ở nền với deadline.
+
+Request chỉ chờ tối đa `deadline` giây; quá hạn thì trả kết quả cục bộ ngay
+kèm job_id, client lấy kết quả AI sau qua GET /check-conflict/ai/{job_id}.
+"""
+import asyncio
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+AI_CONFLICT_DEADLINE_SECONDS = float(os.getenv("AI_CONFLICT_DEADLINE_SECONDS", "4"))
+AI_JOB_WORKERS = int(os.getenv("AI_JOB_WORKERS", "4"))
+# Giữ kết quả job bao lâu sau khi xong (giây)
+AI_JOB_TTL_SECONDS = 600
+MAX_JOBS = 1000
+
+
+class AIJobRegistry:
+    def __init__(self, workers=AI_JOB_WORKERS, ttl_seconds=AI_JOB_TTL_SECONDS):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ai-jobs")
+        self.ttl_seconds = ttl_seconds
+        # job_id -> (created_at, future)
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        job_id = uuid.uuid4().hex
+        future = self._executor.submit(func, *args, **kwargs)
+        with self._lock:
+            self._prune_locked()
+            self._jobs[job_id] = (time.time(), future)
+        return job_id, future
+
+    def wait(self, future, deadline):
+        """Chờ kết quả tối đa deadline giây -> (done, result, error)"""
+        try:
+            return True, future.result(timeout=deadline), None
+        except FutureTimeout:
+            return False, None, None
+        except Exception as e:
+            return True, None, e
+
+    async def wait_async(self, future, deadline):
+        """Như wait() nhưng không chặn event loop; quá deadline thì job vẫn chạy tiếp (shield)"""
+        try:
+            result = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), deadline)
+            return True, result, None
+        except asyncio.TimeoutError:
+            return False, None, None
+        except Exception as e:
+            return True, None, e
+
+    def status(self, job_id):
+        """{'status': pending|done|error, 'result'|'error'}; None nếu không có job"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        created_at, future = job
+        if not future.done():
+            return {'status': 'pending', 'elapsed_seconds': round(time.time() - created_at, 2)}
+        error = future.exception()
+        if error is not None:
+            return {'status': 'error', 'error': str(error)}
+        return {'status': 'done', 'result': future.result()}
+
+    def _prune_locked(self):
+        now = time.time()
+        expired = [
+            job_id for job_id, (created_at, future) in self._jobs.items()
+            if future.done() and now - created_at > self.ttl_seconds
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+        # Giới hạn số job giữ lại (bỏ job cũ nhất)
+        while len(self._jobs) >= MAX_JOBS:
+            del self._jobs[next(iter(self._jobs))]
+
+
+ai_jobs = AIJobRegistry()
@@ -1,15 +1,34 @@
 # main.py
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from pydantic import BaseModel, validator
-from calendar_crud import list_events, create_event, update_event, delete_event, get_event
+from calendar_crud import list_records, create_event, update_event, delete_event, get_event
+from calendar_crud import bulk_create_events, bulk_delete_events, open_records, open_events, open_conflict_index
+from calendar_crud import open_changes
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, JSONResponse
 from ai_agent import get_schedule_suggestion
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Optional, List
 from recurrence_helper import build_recurrence_rule
-from ai_agent import get_schedule_suggestion, ai_check_schedule_conflict
+from ai_agent import get_schedule_suggestion, ai_check_schedule_conflict, gemini_client
 import pytz
 from recurrence_helper import build_recurrence_description
+import json
+import asyncio
+from recurrence_engine import expand_series
+from slot_finder import SEARCH_DAYS
+from ai_cache import ai_response_cache
+from ai_jobs import ai_jobs, AI_CONFLICT_DEADLINE_SECONDS
+from prompt_builder import horizon_window, AI_PROMPT_HORIZON_DAYS
+from schedule_utils import parse_iso_datetime_flexible
+from io_executor import run_io, iterate_io_chunks
+import io_executor
+from read_coalescer import calendar_reads
+from circuit_breaker import CalendarUnavailableError, CALENDAR_BREAKER_RESET_SECONDS, breaker_stats
+from call_scheduler import calendar_calls
+from shard_router import shard_router
+from change_log import change_log, TooManySubscribersError, CALENDAR_STREAM_HEARTBEAT_SECONDS
+from event_mirror import MIRROR_ENABLED
 
 app = FastAPI()
 
@@ -18,9 +37,20 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_methods=["*"],
-    allow_headers=["*"]
+    allow_headers=["*"],
+    expose_headers=["X-Data-Age-Seconds", "X-Data-Stale", "X-Data-Source", "X-Change-Version"]
 )
 
+@app.exception_handler(CalendarUnavailableError)
+async def calendar_unavailable_handler(request: Request, exc: CalendarUnavailableError):
+    """Không đọc được Google và không có snapshot -> 503 (không trả lịch rỗng)"""
+    print(f"❌ Calendar unavailable: {exc}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"Calendar unavailable: {exc}"},
+        headers={"Retry-After": str(int(CALENDAR_BREAKER_RESET_SECONDS))}
+    )
+
 # ---------------- Pydantic Model ----------------
 class ClassInfo(BaseModel):
     name: str
@@ -59,47 +89,239 @@ def validate_iso_format(cls, v, values):
     except ValueError:
         raise ValueError(f"Invalid ISO datetime format: {v}")
         
+class BulkCreateRequest(BaseModel):
+    classes: List[ClassInfo]
+
+class BulkDeleteRequest(BaseModel):
+    event_ids: List[str]
+
 class ConflictCheckRequest(BaseModel):
     teacher: str
     start: str
     end: str
     exclude_event_id: Optional[str] = None
+    # Giống ClassInfo - có recurrence thì kiểm tra MỌI buổi của lớp lặp lại
+    recurrence: Optional[str] = ""
+    repeat_count: int = 1
+    byday: List[str] = []
+    bymonthday: List[int] = []
+    bymonth: List[int] = []
+    timezone: str = "Asia/Ho_Chi_Minh"
 
 # ---------------- Routes ----------------
+def _stream_json_array(events):
+    """Stream JSON array: mở '[' ngay, mỗi event được ghi ra khi có"""
+    yield "["
+    first = True
+    count = 0
+    for event in events:
+        yield ("" if first else ",") + json.dumps(event, ensure_ascii=False, default=str)
+        first = False
+        count += 1
+    yield "]"
+    print(f"📊 Streamed {count} events")
+
+def _stream_ndjson(events):
+    """Stream NDJSON: mỗi dòng 1 event"""
+    for event in events:
+        yield json.dumps(event, ensure_ascii=False, default=str) + "\n"
+
+def _freshness_headers(freshness):
+    """Header cho biết dữ liệu lịch cũ bao lâu / có phải snapshot cũ không"""
+    if not freshness:
+        return {}
+    return {
+        "X-Data-Age-Seconds": str(max(f['age_seconds'] for f in freshness)),
+        "X-Data-Stale": "true" if any(f['stale'] for f in freshness) else "false",
+        "X-Data-Source": ",".join(f"{f['calendar']}:{f['source']}" for f in freshness)
+    }
+
+async def _stream_in_executor(parts):
+    """Đọc Google + serialize trên executor I/O theo từng chunk, event loop chỉ gửi dữ liệu"""
+    async for chunk in iterate_io_chunks('calendar', parts):
+        yield "".join(chunk)
+
+def _validate_window(start, end):
+    """start/end của /classes (và delta của nó) phải là ISO datetime -> 400"""
+    for value in (start, end):
+        if value:
+            try:
+                datetime.fromisoformat(value.replace('Z', '+00:00'))
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"Invalid ISO datetime: {value}")
+
 @app.get("/classes")
-def get_classes(calendar_type: str = "both"):
+async def get_classes(calendar_type: str = "both", format: str = "json",
+                start: Optional[str] = None, end: Optional[str] = None,
+                fields: Optional[str] = None):
     """
-    Lấy classes từ các calendar
-    calendar_type: odd, even, both
+    Lấy classes từ các calendar - STREAM kết quả ngay khi có
+    calendar_type: both (mọi shard) hoặc tên shard, vd odd, even, odd,s2
+    format: json (JSON array) hoặc ndjson (mỗi dòng 1 event)
+    start/end: khoảng thời gian (ISO) -> timeMin/timeMax của Google
+    fields: các field cần lấy, cách nhau bởi dấu phẩy (vd: id,summary,start,end)
     """
     try:
-        events = list_events(calendar_type)
-        print(f"📊 Returning {len(events)} events from calendar: {calendar_type}")
-        
-        # ✅ THÊM DEBUG ĐỂ KIỂM TRA RECURRENCE DATA
-        recurring_events = [e for e in events if e.get('recurrence')]
-        recurring_instances = [e for e in events if e.get('recurringEventId')]
-        
-        print(f"🔄 Recurrence Stats: {len(recurring_events)} master events, {len(recurring_instances)} instances")
+        # Validate khoảng thời gian trước khi bắt đầu stream
+        _validate_window(start, end)
+        field_list = [f.strip() for f in fields.split(',') if f.strip()] if fields else None
         
-        if recurring_events:
-            sample_event = recurring_events[0]
-            print(f"🔍 Sample recurring event: {sample_event.get('id')} - {sample_event.get('recurrence')}")
+        # Mở luồng trước khi stream: lỗi calendar -> 503 thay vì mảng rỗng
+        events, freshness = await run_io('calendar', open_events, calendar_type,
+                                         time_min=start, time_max=end, fields=field_list)
+        headers = _freshness_headers(freshness)
+        if MIRROR_ENABLED:
+            # Mốc cho GET /classes/changes?since= (thay đổi sau lúc mở luồng có thể được gửi lại - vô hại)
+            headers["X-Change-Version"] = change_log.token()
+        print(f"📊 Streaming events from calendar: {calendar_type} ({format}), window: {start} -> {end}")
         
-        return events
+        if format == "ndjson":
+            return StreamingResponse(_stream_in_executor(_stream_ndjson(events)),
+                                     media_type="application/x-ndjson", headers=headers)
+        return StreamingResponse(_stream_in_executor(_stream_json_array(events)),
+                                 media_type="application/json", headers=headers)
+    except (HTTPException, CalendarUnavailableError):
+        raise
     except Exception as e:
         print(f"❌ Error in get_classes: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _build_class_data(class_info):
+    """ClassInfo -> dict cho calendar_crud (kèm rrule + recurrence description)"""
+    data = class_info.dict()
+    recurrence_rule = build_recurrence_rule(data)
+    data["rrule"] = [recurrence_rule] if recurrence_rule else None
+    if recurrence_rule:
+        data["recurrence_description"] = build_recurrence_description(data)
+    return data
+
+# ⚠️ Các route /classes/bulk phải khai báo TRƯỚC /classes/{event_id}
+@app.post("/classes/bulk")
+async def add_classes_bulk(request: BulkCreateRequest):
+    """Tạo nhiều class 1 lần - gộp insert thành Google batch request"""
+    try:
+        print(f"📥 Bulk adding {len(request.classes)} classes")
+        items = [_build_class_data(class_info) for class_info in request.classes]
+        results = await run_io('calendar', bulk_create_events, items)
+        return {
+            "created": sum(1 for r in results if r['status'] == 'created'),
+            "failed": sum(1 for r in results if r['status'] == 'error'),
+            "results": results
+        }
+    except Exception as e:
+        print(f"❌ Error in add_classes_bulk: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/classes/bulk")
+async def remove_classes_bulk(request: BulkDeleteRequest):
+    """Xoá nhiều class 1 lần - gộp delete thành Google batch request"""
+    try:
+        print(f"🗑️ Bulk deleting {len(request.event_ids)} classes")
+        results = await run_io('calendar', bulk_delete_events, request.event_ids)
+        return {
+            "deleted": sum(1 for r in results if r['status'] == 'deleted'),
+            "failed": sum(1 for r in results if r['status'] == 'error'),
+            "results": results
+        }
+    except Exception as e:
+        print(f"❌ Error in remove_classes_bulk: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ⚠️ Cũng phải khai báo TRƯỚC /classes/{event_id}
+@app.get("/classes/changes")
+async def get_class_changes(since: str, calendar_type: str = "both", fields: Optional[str] = None,
+                            start: Optional[str] = None, end: Optional[str] = None):
+    """
+    Chỉ các event thay đổi sau since (header X-Change-Version của /classes hoặc version của lần gọi trước)
+    -> {version, reset, upserted: [event như /classes], deleted: [id]}
+    calendar_type/start/end: giống lần gọi /classes (event dời ra ngoài khoảng thời gian nằm trong deleted)
+    reset=true: since đã hết hạn (API khởi động lại / quá cũ / calendar vừa full sync) -> tải lại /classes
+    """
+    if not MIRROR_ENABLED:
+        raise HTTPException(status_code=501, detail="Change feed requires CALENDAR_MIRROR=1")
+    try:
+        _validate_window(start, end)
+        field_list = [f.strip() for f in fields.split(',') if f.strip()] if fields else None
+        changes, freshness = await run_io('calendar', open_changes, since, calendar_type, field_list, start, end)
+        return Response(json.dumps(changes, ensure_ascii=False, default=str),
+                        media_type="application/json", headers=_freshness_headers(freshness))
+    except (HTTPException, CalendarUnavailableError):
+        raise
+    except Exception as e:
+        print(f"❌ Error in get_class_changes: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _sse(event, data, event_id=None):
+    """1 message Server-Sent Events (id = version token để EventSource gửi lại qua Last-Event-ID)"""
+    lines = [f"id: {event_id}"] if event_id else []
+    lines += [f"event: {event}", f"data: {json.dumps(data, ensure_ascii=False, default=str)}"]
+    return "\n".join(lines) + "\n\n"
+
+async def _class_change_events(request, subscription, version, calendar_type, fields, window, resume):
+    """
+    Đẩy delta cho 1 client: chờ thay đổi (hoặc heartbeat) rồi lấy phần đổi sau version của client
+    Client chậm: các thông báo gộp lại, lần gửi sau chứa mọi thay đổi từ version của nó
+    """
+    try:
+        yield _sse("ready", {"version": version}, version)
+        # Resume: gửi ngay phần đã lỡ trong lúc mất kết nối
+        pending = resume
+        while not await request.is_disconnected():
+            if not pending:
+                await subscription.wait(CALENDAR_STREAM_HEARTBEAT_SECONDS)
+            pending = False
+            try:
+                # Kể cả khi chỉ là heartbeat: open_changes poll mirror -> thấy thay đổi làm trực tiếp trên Google
+                changes, _ = await run_io('calendar', open_changes, version, calendar_type, fields, *window)
+            except CalendarUnavailableError as e:
+                yield f": calendar unavailable ({e})\n\n"
+                continue
+            version = changes['version']
+            if changes['reset']:
+                yield _sse("reset", {"version": version}, version)
+            elif changes['upserted'] or changes['deleted']:
+                yield _sse("changes", changes, version)
+            else:
+                yield ": ping\n\n"
+    finally:
+        change_log.unsubscribe(subscription)
+        print(f"📡 Change stream closed ({change_log.stats()['stream_clients']} clients)")
+
+@app.get("/classes/stream")
+async def stream_class_changes(request: Request, since: Optional[str] = None,
+                               calendar_type: str = "both", fields: Optional[str] = None,
+                               start: Optional[str] = None, end: Optional[str] = None):
+    """
+    Server-Sent Events: đẩy delta (như /classes/changes) mỗi khi lịch thay đổi
+    event: ready {version} | changes {version, upserted, deleted} | reset {version} (tải lại /classes)
+    since: X-Change-Version của /classes; khi kết nối lại, Last-Event-ID được ưu tiên
+    """
+    if not MIRROR_ENABLED:
+        raise HTTPException(status_code=501, detail="Change stream requires CALENDAR_MIRROR=1")
+    _validate_window(start, end)
+    resume_token = request.headers.get("last-event-id") or since
+    field_list = [f.strip() for f in fields.split(',') if f.strip()] if fields else None
+    try:
+        subscription = change_log.subscribe(asyncio.get_running_loop())
+    except TooManySubscribersError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    print(f"📡 Change stream opened ({calendar_type}, resume: {resume_token})")
+    return StreamingResponse(
+        _class_change_events(request, subscription, resume_token or change_log.token(),
+                             calendar_type, field_list, (start, end), resume=bool(resume_token)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # ✅ THÊM ENDPOINT MỚI: Lấy single event bằng ID
 @app.get("/classes/{event_id}")
-def get_single_event(event_id: str):
+async def get_single_event(event_id: str):
     try:
         if not event_id or event_id == "undefined":
             raise HTTPException(status_code=400, detail="Invalid event ID")
             
         print(f"🔍 Fetching single event: {event_id}")
-        event = get_event(event_id)
+        event = await run_io('calendar', get_event, event_id)
         
         if event:
             print(f"✅ Found event: {event.get('summary')}")
@@ -115,7 +337,7 @@ def get_single_event(event_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/classes")
-def add_class(class_info: ClassInfo):
+async def add_class(class_info: ClassInfo):
     try:
         # 🔍 DEBUG REQUEST BODY RAW
         import json
@@ -164,13 +386,13 @@ def add_class(class_info: ClassInfo):
             print(f"📦 Final data with rrule: {data['rrule']}")
             print(f"📝 Recurrence description: {data['recurrence_description']}")
         
-        return create_event(data)
+        return await run_io('calendar', create_event, data)
     except Exception as e:
         print(f"❌ Error in add_class: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.put("/classes/{event_id}")
-def edit_class(event_id: str, class_info: ClassInfo):
+async def edit_class(event_id: str, class_info: ClassInfo):
     try:
         if not event_id or event_id == "undefined":
             raise HTTPException(status_code=400, detail="Invalid event ID")
@@ -198,71 +420,156 @@ def edit_class(event_id: str, class_info: ClassInfo):
         data["rrule"] = [recurrence_rule] if recurrence_rule else None
         data["recurrence_description"] = recurrence_description
         
-        return update_event(event_id, data)
+        return await run_io('calendar', update_event, event_id, data)
     except Exception as e:
         print(f"❌ Error in edit_class: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/classes/{event_id}")
-def remove_class(event_id: str, delete_mode: str = 'this'):
+async def remove_class(event_id: str, delete_mode: str = 'this'):
     try:
         if not event_id or event_id == "undefined":
             raise HTTPException(status_code=400, detail="Invalid event ID")
         print(f"🗑️ Deleting class ID: {event_id}, mode: {delete_mode}")
-        return delete_event(event_id, delete_mode)
+        return await run_io('calendar', delete_event, event_id, delete_mode)
     except Exception as e:
         print(f"❌ Error in remove_class: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/ai/suggest")
-def ai_suggest(teacher: str = None, duration_hours: int = 1):
+async def ai_suggest(response: Response, teacher: str = None, duration_hours: float = 1,
+                     preferred_times: Optional[str] = None, top_n: int = 3,
+                     timezone: str = "Asia/Ho_Chi_Minh", use_ai: bool = False):
+    """
+    Gợi ý khung giờ trống - tìm cục bộ trong lịch (nhanh), use_ai=true để hỏi thêm Gemini
+    preferred_times: "09:00,14:00" hoặc "09:00-11:00"
+    """
     try:
-        classes = list_events('both')  # Lấy từ cả 2 calendars
-        return get_schedule_suggestion(classes, teacher, duration_hours)
+        # Chỉ cần lịch trong khoảng tìm kiếm (từ bây giờ), lấy từ cả 2 calendars
+        now = datetime.now(pytz.timezone('Asia/Ho_Chi_Minh'))
+        records, freshness = await run_io(
+            'calendar', open_records,
+            'both', time_min=now.isoformat(), time_max=(now + timedelta(days=SEARCH_DAYS + 1)).isoformat()
+        )
+        classes = await run_io('calendar', list, records)
+        response.headers.update(_freshness_headers(freshness))
+        return await run_io(
+            'gemini' if use_ai else 'calendar', get_schedule_suggestion,
+            classes, teacher, duration_hours, preferred_times,
+            use_ai=use_ai, timezone_name=timezone, top_n=top_n
+        )
+    except CalendarUnavailableError:
+        raise
     except Exception as e:
         print(f"❌ Error in ai_suggest: {e}")
         raise HTTPException(status_code=500, detail=str(e))
     
-@app.post("/check-conflict")
-def api_check_conflict(request: ConflictCheckRequest):
-    """API endpoint kiểm tra xung đột - DÙNG AI CHỈ KHI CẦN"""
-    try:
-        print(f"🔄 Smart conflict check for: {request.teacher}")
-        
-        # Lấy tất cả classes hiện có từ cả 2 calendars
-        all_classes = list_events('both')
-        
-        # 1. TRADITIONAL CHECK NHANH TRƯỚC
-        from ai_agent import traditional_conflict_check
+def _traditional_check(request):
+    """
+    Bước 1 của /check-conflict (chạy trên executor I/O): traditional check bằng chỉ mục theo giáo viên
+    -> (traditional_result, all_classes, ai_start, ai_end, freshness); khi có conflict all_classes đã có lịch quanh thời gian cần xét
+    """
+    from ai_agent import traditional_conflict_check, traditional_series_conflict_check
+    conflict_index, freshness = open_conflict_index()
+    all_classes = None
+    if conflict_index is None:
+        # Mirror tắt -> lấy tất cả classes hiện có từ cả 2 calendars
+        records, freshness = open_records('both')
+        all_classes = list(records)
+    
+    ai_start, ai_end = request.start, request.end
+    if request.recurrence:
+        # Lớp lặp lại: expand mọi buổi đề xuất (cùng RRULE sẽ gửi lên Google) rồi quét 1 lượt
+        try:
+            rrule = build_recurrence_rule(request.dict())
+            occurrences = expand_series(request.start, request.end, request.timezone, [rrule] if rrule else [])
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid recurrence: {e}")
+        if not occurrences:
+            raise HTTPException(status_code=400, detail=f"Recurrence has no occurrences: {rrule}")
+        traditional_result = traditional_series_conflict_check(
+            existing_classes=all_classes,
+            teacher=request.teacher,
+            occurrences=occurrences,
+            exclude_event_id=request.exclude_event_id,
+            index=conflict_index
+        )
+        if traditional_result.get('conflicting_occurrences'):
+            # AI gợi ý thời gian thay thế cho buổi trùng đầu tiên
+            first = traditional_result['conflicting_occurrences'][0]
+            ai_start, ai_end = first['occurrence_start'], first['occurrence_end']
+    else:
         traditional_result = traditional_conflict_check(
             existing_classes=all_classes,
             teacher=request.teacher,
             new_start=request.start,
             new_end=request.end,
-            exclude_event_id=request.exclude_event_id
+            exclude_event_id=request.exclude_event_id,
+            index=conflict_index
+        )
+    
+    if traditional_result.get('has_conflict') and traditional_result.get('conflicts') and all_classes is None:
+        # Chỉ lấy lịch quanh thời gian cần xét (đủ cho prompt AI và tìm slot trống)
+        window_start, window_end = horizon_window(parse_iso_datetime_flexible(ai_start),
+                                                  days=max(AI_PROMPT_HORIZON_DAYS, SEARCH_DAYS) + 1)
+        records, _ = open_records('both', time_min=window_start.isoformat(), time_max=window_end.isoformat())
+        all_classes = list(records)
+    return traditional_result, all_classes, ai_start, ai_end, freshness
+
+@app.post("/check-conflict")
+async def api_check_conflict(request: ConflictCheckRequest, response: Response):
+    """API endpoint kiểm tra xung đột - DÙNG AI CHỈ KHI CẦN"""
+    try:
+        print(f"🔄 Smart conflict check for: {request.teacher}")
+        
+        # 1. TRADITIONAL CHECK NHANH TRƯỚC - dùng chỉ mục theo giáo viên (không tải lại lịch)
+        traditional_result, all_classes, ai_start, ai_end, freshness = await run_io(
+            'calendar', _traditional_check, request
         )
+        response.headers.update(_freshness_headers(freshness))
         
-        # 2. CHỈ GỌI AI KHI CÓ CONFLICT (để có suggestions)
+        # 2. CÓ CONFLICT: trả khung giờ trống tính cục bộ ngay, AI chạy nền với deadline
         if traditional_result.get('has_conflict') and traditional_result.get('conflicts'):
-            print(f"🤖 Conflict detected - calling AI for smart suggestions...")
-            
-            from ai_agent import ai_check_schedule_conflict
-            ai_result = ai_check_schedule_conflict(
-                existing_classes=all_classes,
-                teacher=request.teacher,
-                new_start=request.start,
-                new_end=request.end,
-                exclude_event_id=request.exclude_event_id
-            )
+            from ai_agent import ai_check_schedule_conflict, local_conflict_alternatives, GEMINI_API_KEY
             
-            # Kết hợp kết quả: conflicts từ traditional + suggestions từ AI
             result = {
                 'has_conflict': True,
                 'conflicts': traditional_result['conflicts'],
-                'suggestions': ai_result.get('suggestions', []),
-                'ai_analysis': ai_result.get('ai_analysis', 'AI đề xuất thời gian thay thế'),
-                'check_type': 'ai_suggestions'
+                'suggestions': local_conflict_alternatives(
+                    all_classes, request.teacher, ai_start, ai_end, request.timezone
+                ),
+                'ai_analysis': traditional_result.get('ai_analysis', ''),
+                'check_type': 'local_suggestions'
             }
+            if 'conflicting_occurrences' in traditional_result:
+                result['occurrence_count'] = traditional_result['occurrence_count']
+                result['conflicting_occurrences'] = traditional_result['conflicting_occurrences']
+            
+            if not GEMINI_API_KEY:
+                result['ai_status'] = 'unavailable'
+            else:
+                print(f"🤖 Conflict detected - calling AI for smart suggestions (deadline {AI_CONFLICT_DEADLINE_SECONDS}s)...")
+                job_id, future = ai_jobs.submit(
+                    ai_check_schedule_conflict,
+                    existing_classes=all_classes,
+                    teacher=request.teacher,
+                    new_start=ai_start,
+                    new_end=ai_end,
+                    exclude_event_id=request.exclude_event_id
+                )
+                done, ai_result, ai_error = await ai_jobs.wait_async(future, AI_CONFLICT_DEADLINE_SECONDS)
+                if not done:
+                    # Quá deadline: trả kết quả cục bộ, client lấy gợi ý AI sau qua job_id
+                    result['ai_status'] = 'pending'
+                    result['ai_job_id'] = job_id
+                elif ai_error is not None or not ai_result or 'error' in ai_result:
+                    result['ai_status'] = 'error'
+                else:
+                    # Kết hợp kết quả: conflicts từ traditional + suggestions từ AI
+                    result['ai_status'] = 'done'
+                    result['suggestions'] = ai_result.get('suggestions') or result['suggestions']
+                    result['ai_analysis'] = ai_result.get('ai_analysis', 'AI đề xuất thời gian thay thế')
+                    result['check_type'] = 'ai_suggestions'
             
         else:
             # KHÔNG CÓ CONFLICT - chỉ dùng traditional (siêu nhanh)
@@ -273,19 +580,43 @@ def api_check_conflict(request: ConflictCheckRequest):
         print(f"✅ Smart check result: {result.get('has_conflict')} | Type: {result.get('check_type')}")
         return result
         
+    except (HTTPException, CalendarUnavailableError):
+        # Recurrence sai -> 400; không có dữ liệu lịch -> 503, không được trả "không xung đột"
+        raise
     except Exception as e:
         print(f"❌ Smart conflict check error: {e}")
+        if request.recurrence:
+            # Fallback chỉ kiểm tra được 1 buổi - không được trả như kết quả của cả chuỗi
+            raise HTTPException(status_code=500, detail=f"Series conflict check failed: {e}")
         # Fallback về traditional
         from ai_agent import traditional_conflict_check
-        return traditional_conflict_check(
-            list_events('both'),
+        return await run_io('calendar', lambda: traditional_conflict_check(
+            list(list_records('both')),
             request.teacher, 
             request.start, 
             request.end
-        )
+        ))
+
+@app.get("/check-conflict/ai/{job_id}")
+async def api_check_conflict_ai_result(job_id: str):
+    """Kết quả AI của 1 lần /check-conflict đã quá deadline (status: pending | done | error)"""
+    status = ai_jobs.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="AI job not found or expired")
+    if status['status'] != 'done':
+        return status
+    ai_result = status['result'] or {}
+    if 'error' in ai_result:
+        return {'status': 'error', 'error': ai_result['error']}
+    return {
+        'status': 'done',
+        'suggestions': ai_result.get('suggestions', []),
+        'ai_analysis': ai_result.get('ai_analysis', 'AI đề xuất thời gian thay thế'),
+        'check_type': 'ai_suggestions'
+    }
 
 @app.get("/timezones")
-def get_timezones():
+async def get_timezones():
     """API lấy danh sách múi giờ hỗ trợ"""
     return {
         "timezones": [
@@ -309,13 +640,17 @@ def get_timezones():
     }
 
 @app.get("/health")
-def health_check():
+async def health_check():
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
         "service": "ZenAI Tutor Admin API",
-        "calendars": {
-            "odd": "configured",
-            "even": "configured"
-        }
+        "calendars": shard_router.stats(),
+        "ai_cache": ai_response_cache.stats(),
+        "ai_client": gemini_client.stats(),
+        "io_executor": io_executor.stats(),
+        "calendar_reads": calendar_reads.stats(),
+        "calendar_breakers": breaker_stats(),
+        "calendar_calls": calendar_calls.stats(),
+        "change_log": change_log.stats()
     }
\ No newline at end of file
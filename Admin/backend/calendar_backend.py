@@ -0,0 +1,643 @@
+# backend/calendar_backend.py
+"""
+Backend lưu lịch cho calendar_crud / mirror: Google Calendar, in-memory hoặc SQLite.
+
+Mọi backend có cùng các thao tác list, get, insert, update, patch, delete, move
+(+ batch) và cùng cách trả về như googleapiclient: get_calendar_service() trả về
+service có events().<thao tác>(...).execute() và new_batch_http_request(), nên
+code phía trên không cần biết đang chạy backend nào.
+
+Chọn bằng CALENDAR_BACKEND:
+- google (mặc định): Google Calendar API, credentials chỉ được đọc khi gọi lần đầu
+- memory: giữ trong RAM - chạy admin API offline để load test
+- sqlite: lưu vào CALENDAR_SQLITE_PATH - deployment nhỏ không cần Google
+
+Backend memory/sqlite giữ đúng ngữ nghĩa Google mà app dựa vào: instance của lớp
+lặp lại có id <master>_YYYYMMDDTHHMMSSZ (sửa/xoá 1 buổi tạo exception), syncToken
+cho delta (kể cả buổi bị huỷ), phân trang, lỗi HttpError 404/409/410 như Google.
+"""
+import copy
+import json
+import os
+import re
+import sqlite3
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from urllib.parse import quote
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from google_calendar import get_google_service
+from recurrence_engine import materialize_instances, validate_recurrence
+
+CALENDAR_BACKEND = os.getenv("CALENDAR_BACKEND", "google").lower()
+CALENDAR_SQLITE_PATH = Path(os.getenv("CALENDAR_SQLITE_PATH", "data/calendar.db"))
+DEFAULT_PAGE_SIZE = 250
+MAX_PAGE_SIZE = 2500
+
+INSTANCE_ID = re.compile(r'^(.+)_(\d{8})(T\d{6}Z)?$')
+
+
+class CalendarBackend(ABC):
+    """Backend lịch: calendar_crud / mirror chỉ dùng service() kiểu googleapiclient"""
+    name = 'base'
+
+    @abstractmethod
+    def service(self):
+        """Service kiểu googleapiclient (events() + new_batch_http_request) cho thread hiện tại"""
+
+
+class EventBackend(CalendarBackend):
+    """Backend tự thực hiện từng thao tác - mỗi thao tác trả về dict giống Google, lỗi là HttpError"""
+
+    @abstractmethod
+    def list(self, calendar_id, **params):
+        pass
+
+    @abstractmethod
+    def get(self, calendar_id, event_id):
+        pass
+
+    @abstractmethod
+    def insert(self, calendar_id, body):
+        pass
+
+    @abstractmethod
+    def update(self, calendar_id, event_id, body):
+        pass
+
+    @abstractmethod
+    def patch(self, calendar_id, event_id, body):
+        pass
+
+    @abstractmethod
+    def delete(self, calendar_id, event_id):
+        pass
+
+    @abstractmethod
+    def move(self, calendar_id, event_id, destination):
+        pass
+
+    def service(self):
+        return BackendService(self)
+
+
+# ---------------- Google ----------------
+class GoogleCalendarBackend(CalendarBackend):
+    """Google Calendar API - calendar_crud gọi thẳng service của googleapiclient"""
+    name = 'google'
+
+    def service(self):
+        # httplib2 không thread-safe -> mỗi thread 1 service riêng
+        return get_google_service()
+
+
+# ---------------- Service kiểu googleapiclient cho backend local ----------------
+class BackendRequest:
+    def __init__(self, func, calendar_id):
+        self._func = func
+        # Giống URI của googleapiclient để call scheduler biết calendar đích
+        self.uri = f"local://calendar/v3/calendars/{quote(calendar_id or '', safe='')}/events"
+
+    def execute(self, num_retries=0):
+        return self._func()
+
+
+class _BackendEvents:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def list(self, calendarId, **params):
+        return BackendRequest(lambda: self.backend.list(calendarId, **params), calendarId)
+
+    def get(self, calendarId, eventId, **params):
+        return BackendRequest(lambda: self.backend.get(calendarId, eventId), calendarId)
+
+    def insert(self, calendarId, body, **params):
+        return BackendRequest(lambda: self.backend.insert(calendarId, body), calendarId)
+
+    def update(self, calendarId, eventId, body, **params):
+        return BackendRequest(lambda: self.backend.update(calendarId, eventId, body), calendarId)
+
+    def patch(self, calendarId, eventId, body, **params):
+        return BackendRequest(lambda: self.backend.patch(calendarId, eventId, body), calendarId)
+
+    def delete(self, calendarId, eventId, **params):
+        return BackendRequest(lambda: self.backend.delete(calendarId, eventId), calendarId)
+
+    def move(self, calendarId, eventId, destination, **params):
+        return BackendRequest(lambda: self.backend.move(calendarId, eventId, destination), calendarId)
+
+
+class _BackendBatch:
+    """Giống BatchHttpRequest: chạy lần lượt, mỗi request báo kết quả/lỗi riêng qua callback"""
+
+    def __init__(self, callback=None):
+        self._callback = callback
+        self._requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        request_id = request_id or str(len(self._requests) + 1)
+        self._requests.append((request_id, request, callback or self._callback))
+
+    def execute(self):
+        for request_id, request, callback in self._requests:
+            try:
+                response, error = request.execute(), None
+            except HttpError as e:
+                response, error = None, e
+            if callback:
+                callback(request_id, response, error)
+
+
+class BackendService:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def events(self):
+        return _BackendEvents(self.backend)
+
+    def new_batch_http_request(self, callback=None):
+        return _BackendBatch(callback)
+
+
+# ---------------- Helpers ----------------
+def _http_error(status, reason, message):
+    """HttpError cùng dạng Google trả về (call scheduler / calendar_crud đọc status + reason)"""
+    resp = httplib2.Response({'status': status})
+    resp.reason = message
+    content = json.dumps({'error': {
+        'errors': [{'domain': 'global', 'reason': reason, 'message': message}],
+        'code': status,
+        'message': message
+    }}).encode('utf-8')
+    return HttpError(resp, content)
+
+
+def _check_recurrence(event):
+    """Backend cục bộ tự expand RRULE -> rule không expand được thì trả 400 như Google trả lỗi rule sai"""
+    try:
+        validate_recurrence(event.get('recurrence'))
+    except ValueError as e:
+        raise _http_error(400, 'invalid', f"Invalid recurrence rule: {e}")
+
+
+def _not_found(event_id):
+    return _http_error(404, 'notFound', f"Not Found: {event_id}")
+
+
+def _now_rfc3339():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+
+def _parse_time(value):
+    """RFC3339 / YYYY-MM-DD -> datetime có tz (không có offset -> UTC)"""
+    if not value:
+        return None
+    dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def _event_span(event):
+    """(start_ts, end_ts) của event - dùng để lọc theo timeMin/timeMax"""
+    start, end = event.get('start') or {}, event.get('end') or {}
+    start_dt = _parse_time(start.get('dateTime') or start.get('date'))
+    end_dt = _parse_time(end.get('dateTime') or end.get('date')) or start_dt
+    if start_dt is None:
+        return 0.0, 0.0
+    return start_dt.timestamp(), end_dt.timestamp()
+
+
+def _is_master(event):
+    return bool(event.get('recurrence')) and not event.get('recurringEventId')
+
+
+def _cancelled_stub(event):
+    """Dạng Google trả về cho buổi/event bị huỷ trong delta"""
+    stub = {'kind': 'calendar#event', 'id': event['id'], 'status': 'cancelled'}
+    for key in ('recurringEventId', 'originalStartTime'):
+        if event.get(key):
+            stub[key] = event[key]
+    return stub
+
+
+def _instance_window(event_id):
+    """(master_id, start, end): khoảng thời gian chắc chắn chứa instance có id này - None nếu không phải id instance"""
+    match = INSTANCE_ID.match(event_id)
+    if not match:
+        return None
+    stamp = match.group(2) + (match.group(3) or '')
+    fmt = '%Y%m%dT%H%M%SZ' if match.group(3) else '%Y%m%d'
+    start = datetime.strptime(stamp, fmt).replace(tzinfo=timezone.utc)
+    return match.group(1), start - timedelta(days=2), start + timedelta(days=2)
+
+
+# ---------------- Store: in-memory / SQLite ----------------
+class MemoryEventStore:
+    """Mỗi calendar 1 dict id -> (seq, event), giữ theo thứ tự ghi để lấy delta nhanh"""
+
+    def __init__(self):
+        self._calendars = {}
+        self._exceptions = {}
+        self.seq = 0
+
+    def get(self, calendar_id, event_id):
+        entry = self._calendars.get(calendar_id, {}).get(event_id)
+        return copy.deepcopy(entry[1]) if entry else None
+
+    def put(self, calendar_id, event):
+        self.seq += 1
+        events = self._calendars.setdefault(calendar_id, {})
+        events.pop(event['id'], None)
+        events[event['id']] = (self.seq, copy.deepcopy(event))
+        master_id = event.get('recurringEventId')
+        if master_id:
+            self._exceptions.setdefault((calendar_id, master_id), set()).add(event['id'])
+
+    def scan(self, calendar_id, start_ts=None, end_ts=None):
+        """Master (luôn trả về) + event giao với [start_ts, end_ts)"""
+        result = []
+        for _, event in self._calendars.get(calendar_id, {}).values():
+            if not _is_master(event):
+                event_start, event_end = _event_span(event)
+                if start_ts is not None and event_end <= start_ts:
+                    continue
+                if end_ts is not None and event_start >= end_ts:
+                    continue
+            result.append(copy.deepcopy(event))
+        return result
+
+    def changed_since(self, calendar_id, seq):
+        changed = []
+        for entry_seq, event in reversed(self._calendars.get(calendar_id, {}).values()):
+            if entry_seq <= seq:
+                break
+            changed.append(copy.deepcopy(event))
+        changed.reverse()
+        return changed
+
+    def exceptions_of(self, calendar_id, master_id):
+        events = self._calendars.get(calendar_id, {})
+        ids = self._exceptions.get((calendar_id, master_id), ())
+        return [copy.deepcopy(events[i][1]) for i in ids if i in events]
+
+    def current_seq(self):
+        return self.seq
+
+    def transaction(self):
+        return _NoTransaction()
+
+
+class _NoTransaction:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class SqliteEventStore:
+    """Bảng calendar_events (WAL mode) - mỗi dòng 1 event/master/exception dạng JSON của Google"""
+
+    def __init__(self, db_path=CALENDAR_SQLITE_PATH):
+        self.db_path = Path(db_path)
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        """Mỗi thread 1 connection (sqlite3 connection không dùng chung giữa các thread)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        if not self._initialized:
+            self._initialize(conn)
+        return conn
+
+    def _initialize(self, conn):
+        with self._init_lock:
+            if self._initialized:
+                return
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS calendar_events (
+                    calendar_id TEXT NOT NULL,
+                    event_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    recurring_event_id TEXT,
+                    is_master INTEGER NOT NULL DEFAULT 0,
+                    start_ts REAL NOT NULL,
+                    end_ts REAL NOT NULL,
+                    body TEXT NOT NULL,
+                    PRIMARY KEY (calendar_id, event_id)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_calendar_events_seq ON calendar_events (calendar_id, seq)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_calendar_events_time ON calendar_events (calendar_id, start_ts)")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_calendar_events_master "
+                "ON calendar_events (calendar_id, recurring_event_id)"
+            )
+            # seq của syncToken nằm trong DB (không đếm trong RAM): nhiều worker dùng chung 1 file
+            # vẫn cấp seq tăng dần, không trùng
+            conn.execute("CREATE TABLE IF NOT EXISTS calendar_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute(
+                "INSERT OR IGNORE INTO calendar_meta (key, value) "
+                "SELECT 'seq', COALESCE(MAX(seq), 0) FROM calendar_events"
+            )
+            self._initialized = True
+
+    def get(self, calendar_id, event_id):
+        row = self._connect().execute(
+            "SELECT body FROM calendar_events WHERE calendar_id = ? AND event_id = ?", (calendar_id, event_id)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, calendar_id, event):
+        conn = self._connect()
+        start_ts, end_ts = _event_span(event)
+        # Cấp seq trong cùng transaction ghi (BEGIN IMMEDIATE giữ khoá ghi -> seq tăng đúng thứ tự commit)
+        with _NoTransaction() if conn.in_transaction else _transaction(conn):
+            conn.execute("UPDATE calendar_meta SET value = value + 1 WHERE key = 'seq'")
+            seq = conn.execute("SELECT value FROM calendar_meta WHERE key = 'seq'").fetchone()[0]
+            conn.execute(
+                """INSERT OR REPLACE INTO calendar_events
+                   (calendar_id, event_id, seq, recurring_event_id, is_master, start_ts, end_ts, body)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (calendar_id, event['id'], seq, event.get('recurringEventId'), int(_is_master(event)),
+                 start_ts, end_ts, json.dumps(event))
+            )
+
+    def scan(self, calendar_id, start_ts=None, end_ts=None):
+        rows = self._connect().execute(
+            """SELECT body FROM calendar_events
+               WHERE calendar_id = ? AND (is_master = 1 OR ((? IS NULL OR end_ts > ?) AND (? IS NULL OR start_ts < ?)))""",
+            (calendar_id, start_ts, start_ts, end_ts, end_ts)
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def changed_since(self, calendar_id, seq):
+        rows = self._connect().execute(
+            "SELECT body FROM calendar_events WHERE calendar_id = ? AND seq > ? ORDER BY seq", (calendar_id, seq)
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def exceptions_of(self, calendar_id, master_id):
+        rows = self._connect().execute(
+            "SELECT body FROM calendar_events WHERE calendar_id = ? AND recurring_event_id = ?",
+            (calendar_id, master_id)
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def current_seq(self):
+        """seq mới nhất đã commit (kể cả của tiến trình khác) - đọc trước khi quét nên delta sau chỉ có thể lặp lại, không mất"""
+        return self._connect().execute("SELECT value FROM calendar_meta WHERE key = 'seq'").fetchone()[0]
+
+    def transaction(self):
+        return _transaction(self._connect())
+
+
+class _transaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK (connection ở chế độ autocommit)"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+# ---------------- Backend local (ngữ nghĩa Google trên store) ----------------
+class LocalCalendarBackend(EventBackend):
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+        # Ghi tuần tự (seq của syncToken tăng đúng thứ tự), đọc memory cũng qua lock
+        self._lock = threading.RLock()
+
+    # ---------- Read ----------
+    def list(self, calendar_id, timeMin=None, timeMax=None, singleEvents=False, orderBy=None,
+             showDeleted=False, maxResults=None, pageToken=None, syncToken=None, **params):
+        with self._lock:
+            current_seq = self.store.current_seq()
+            if syncToken is not None:
+                items = self._list_changes(calendar_id, syncToken, singleEvents)
+            else:
+                items = self._list_window(calendar_id, _parse_time(timeMin), _parse_time(timeMax),
+                                          singleEvents, showDeleted)
+        if orderBy == 'startTime' or syncToken is None:
+            items.sort(key=lambda e: _event_span(e)[0])
+
+        page_size = min(int(maxResults or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE)
+        offset = int(pageToken or 0)
+        result = {'kind': 'calendar#events', 'items': items[offset:offset + page_size]}
+        if offset + page_size < len(items):
+            result['nextPageToken'] = str(offset + page_size)
+        else:
+            result['nextSyncToken'] = str(current_seq)
+        return result
+
+    def _list_window(self, calendar_id, window_start, window_end, single_events, show_deleted):
+        items = []
+        for event in self.store.scan(calendar_id,
+                                     window_start.timestamp() if window_start else None,
+                                     window_end.timestamp() if window_end else None):
+            cancelled = event.get('status') == 'cancelled'
+            if _is_master(event):
+                if cancelled and not show_deleted:
+                    continue
+                if not single_events:
+                    items.append(event)
+                elif not cancelled:
+                    exception_ids = {e['id'] for e in self.store.exceptions_of(calendar_id, event['id'])}
+                    items.extend(i for i in materialize_instances(event, window_start, window_end)
+                                 if i['id'] not in exception_ids)
+            elif event.get('recurringEventId'):
+                # singleEvents=False: Google trả cả exception bị huỷ để client ẩn buổi đó
+                if not cancelled or show_deleted or not single_events:
+                    items.append(event if not cancelled else _cancelled_stub(event))
+            elif not cancelled or show_deleted:
+                items.append(event)
+        return items
+
+    def _list_changes(self, calendar_id, sync_token, single_events):
+        try:
+            since = int(sync_token)
+        except ValueError:
+            since = -1
+        if since < 0 or since > self.store.current_seq():
+            raise _http_error(410, 'fullSyncRequired', "Sync token is no longer valid, a full sync is required.")
+
+        changed = {}
+        for event in self.store.changed_since(calendar_id, since):
+            cancelled = event.get('status') == 'cancelled'
+            if single_events and _is_master(event):
+                # singleEvents: thay master bằng các buổi của nó (exception giữ nguyên)
+                exceptions = {e['id']: e for e in self.store.exceptions_of(calendar_id, event['id'])}
+                for instance in materialize_instances(event):
+                    instance = exceptions.get(instance['id'], instance)
+                    if cancelled or instance.get('status') == 'cancelled':
+                        instance = _cancelled_stub(instance)
+                    changed[instance['id']] = instance
+                continue
+            changed[event['id']] = _cancelled_stub(event) if cancelled else event
+        return list(changed.values())
+
+    def get(self, calendar_id, event_id):
+        with self._lock:
+            event = self._current(calendar_id, event_id)
+        if event is None:
+            raise _not_found(event_id)
+        return event
+
+    def _current(self, calendar_id, event_id):
+        """Event/exception đang có, hoặc instance tự sinh từ master - None nếu không có/đã huỷ"""
+        event = self.store.get(calendar_id, event_id)
+        if event is not None:
+            return event if event.get('status') != 'cancelled' else None
+        window = _instance_window(event_id)
+        if window is None:
+            return None
+        master_id, window_start, window_end = window
+        master = self.store.get(calendar_id, master_id)
+        if master is None or master.get('status') == 'cancelled' or not _is_master(master):
+            return None
+        for instance in materialize_instances(master, window_start, window_end):
+            if instance['id'] == event_id:
+                return instance
+        return None
+
+    # ---------- Write ----------
+    def insert(self, calendar_id, body):
+        if not (body.get('start') and body.get('end')):
+            raise _http_error(400, 'required', "Missing end time.")
+        with self._lock, self.store.transaction():
+            event = {k: v for k, v in copy.deepcopy(body).items() if v is not None}
+            event['id'] = event.get('id') or uuid.uuid4().hex
+            _check_recurrence(event)
+            if self.store.get(calendar_id, event['id']) is not None:
+                raise _http_error(409, 'duplicate', "The requested identifier already exists.")
+            now = _now_rfc3339()
+            event.update({'kind': 'calendar#event', 'status': 'confirmed', 'created': now, 'updated': now})
+            self.store.put(calendar_id, event)
+            return event
+
+    def update(self, calendar_id, event_id, body):
+        return self._write(calendar_id, event_id, lambda current: copy.deepcopy(body))
+
+    def patch(self, calendar_id, event_id, body):
+        def merge(current):
+            merged = copy.deepcopy(current)
+            for key, value in body.items():
+                if value is None:
+                    merged.pop(key, None)
+                else:
+                    merged[key] = copy.deepcopy(value)
+            return merged
+        return self._write(calendar_id, event_id, merge)
+
+    def _write(self, calendar_id, event_id, build):
+        with self._lock, self.store.transaction():
+            current = self._current(calendar_id, event_id)
+            if current is None:
+                raise _not_found(event_id)
+            event = {k: v for k, v in build(current).items() if v is not None}
+            _check_recurrence(event)
+            # Sửa 1 buổi -> exception giữ id/master/giờ gốc của buổi đó
+            for key in ('id', 'recurringEventId', 'originalStartTime', 'created'):
+                if current.get(key):
+                    event[key] = current[key]
+            event.update({'kind': 'calendar#event', 'status': 'confirmed', 'updated': _now_rfc3339()})
+            if _is_master(current) or _is_master(event):
+                self._cancel_dropped_instances(calendar_id, current, event)
+            self.store.put(calendar_id, event)
+            return event
+
+    def _cancel_dropped_instances(self, calendar_id, old_master, new_master):
+        """Master đổi recurrence/giờ -> buổi cũ không còn trở thành exception bị huỷ (như Google báo trong delta)"""
+        new_ids = {i['id'] for i in materialize_instances(new_master)} if _is_master(new_master) else set()
+        existing = {e['id'] for e in self.store.exceptions_of(calendar_id, old_master['id'])}
+        now = _now_rfc3339()
+        for instance in materialize_instances(old_master) if _is_master(old_master) else []:
+            if instance['id'] not in new_ids and instance['id'] not in existing:
+                self.store.put(calendar_id, dict(_cancelled_stub(instance), updated=now))
+
+    def delete(self, calendar_id, event_id):
+        with self._lock, self.store.transaction():
+            stored = self.store.get(calendar_id, event_id)
+            if stored is not None and stored.get('status') == 'cancelled':
+                raise _http_error(410, 'deleted', "Resource has been deleted")
+            current = self._current(calendar_id, event_id)
+            if current is None:
+                raise _not_found(event_id)
+            now = _now_rfc3339()
+            if _is_master(current):
+                for exception in self.store.exceptions_of(calendar_id, event_id):
+                    if exception.get('status') != 'cancelled':
+                        self.store.put(calendar_id, dict(exception, status='cancelled', updated=now))
+            # Giữ nội dung để delta singleEvents còn sinh được các buổi bị huỷ
+            self.store.put(calendar_id, dict(current, status='cancelled', updated=now))
+        return ''
+
+    def move(self, calendar_id, event_id, destination):
+        with self._lock, self.store.transaction():
+            current = self._current(calendar_id, event_id)
+            if current is None:
+                raise _not_found(event_id)
+            if current.get('recurringEventId'):
+                raise _http_error(400, 'cannotChangeOrganizerOfInstance', "Cannot change the organizer of an instance.")
+            if destination == calendar_id:
+                return current
+            target = self.store.get(destination, event_id)
+            if target is not None and target.get('status') != 'cancelled':
+                raise _http_error(409, 'duplicate', "The requested identifier already exists.")
+
+            now = _now_rfc3339()
+            # Chuyển cả series: master + các exception
+            moving = [current] + (self.store.exceptions_of(calendar_id, event_id) if _is_master(current) else [])
+            for event in moving:
+                self.store.put(calendar_id, dict(event, status='cancelled', updated=now))
+            for event in moving:
+                self.store.put(destination, dict(event, updated=now))
+            return dict(current, updated=now)
+
+
+# ---------------- Chọn backend ----------------
+def _create_backend(name):
+    if name == 'google':
+        return GoogleCalendarBackend()
+    if name == 'memory':
+        return LocalCalendarBackend(MemoryEventStore(), 'memory')
+    if name == 'sqlite':
+        return LocalCalendarBackend(SqliteEventStore(CALENDAR_SQLITE_PATH), 'sqlite')
+    raise ValueError(f"Unknown CALENDAR_BACKEND: {name} (google | memory | sqlite)")
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = _create_backend(CALENDAR_BACKEND)
+            print(f"🗄️ Calendar backend: {_backend.name}")
+        return _backend
+
+
+def get_calendar_service():
+    """Service (kiểu googleapiclient) của backend đang dùng cho thread hiện tại"""
+    return get_backend().service()
@@ -1,12 +1,29 @@
 # backend/calendar_crud.py
-from google_calendar import calendar_service, CALENDARS
+from shard_router import shard_router
+from calendar_backend import get_calendar_service
 from googleapiclient.errors import HttpError
+import bisect
+import heapq
+import itertools
 import json
-from pathlib import Path
+import re
 from recurrence_helper import build_recurrence_rule
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
+from event_mirror import MIRROR_ENABLED, get_mirror, add_change_listener
+from event_locator import location_index
+from extra_store import extra_store
+from conflict_engine import TeacherIntervalIndex
+from event_record import EventRecord
+from calendar_pool import fan_out
+from read_coalescer import calendar_reads
+from circuit_breaker import get_breaker, CalendarUnavailableError
+from call_scheduler import calendar_calls, is_rate_limited
+from change_log import change_log
+from collections import OrderedDict
+import threading
+import time
+import uuid
 
-EXTRA_FILE = Path("data/classes_extra.json")
 
 try:
     from recurrence_utils import (
@@ -51,248 +68,561 @@ except ImportError as e:
         except:
             return master_event.get('recurrence', [])
 
-# ---------------- JSON Helper ----------------
+# ---------------- Extra data Helper (SQLite) ----------------
 def load_extra():
-    if EXTRA_FILE.exists():
-        with open(EXTRA_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {}
+    """Toàn bộ extra data {event_id: extra} - chỉ dùng khi thật sự cần tất cả"""
+    return extra_store.all()
 
-def save_extra(data):
-    EXTRA_FILE.parent.mkdir(parents=True, exist_ok=True)
-    with open(EXTRA_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+def get_extra_many(event_ids):
+    """Extra data cho 1 lô events (1 query thay vì đọc cả file)"""
+    return extra_store.get_many(event_ids)
 
 def add_extra(event_id, meeting_id, passcode, zoom_link="", classname="", calendar_id=""):
-    extra = load_extra()
-    extra[event_id] = {
+    extra_store.upsert(event_id, {
         "zoom_link": zoom_link,
         "meeting_id": meeting_id,
         "passcode": passcode,
         "classname": classname,
         "calendar_id": calendar_id
-    }
-    save_extra(extra)
+    })
+    location_index.remember(event_id, calendar_id)
     print(f"✅ Extra data saved for event {event_id} with calendar_id: {calendar_id}")
 
 def update_extra(event_id, meeting_id, passcode, zoom_link="", classname="", calendar_id=""):
-    extra = load_extra()
-    extra[event_id] = {
+    extra_store.upsert(event_id, {
         "zoom_link": zoom_link,
         "meeting_id": meeting_id,
         "passcode": passcode,
         "classname": classname,
         "calendar_id": calendar_id
-    }
-    save_extra(extra)
+    })
+    location_index.remember(event_id, calendar_id)
     print(f"✅ Extra data updated for event {event_id} with calendar_id: {calendar_id}")
 
 def remove_extra(event_id):
-    extra = load_extra()
-    if event_id in extra:
-        del extra[event_id]
-        save_extra(extra)
+    extra_store.delete(event_id)
 
 # ========== HÀM XÁC ĐỊNH CALENDAR ==========
-def determine_calendar_by_hour(start_datetime_str):
+def get_calendar_type_by_id(calendar_id):
+    """Tên shard của calendar_id (vd 'odd', 'even'), 'unknown' nếu không thuộc shard nào"""
+    return shard_router.name_of(calendar_id)
+
+def _record_write(calendar_id, event=None, deleted_ids=()):
+    """
+    Cập nhật chỉ mục vị trí + mirror ngay sau khi ghi lên Google,
+    lần đọc sau mirror sẽ poll delta để lấy instances
+    """
+    if event is not None:
+        location_index.remember(event.get('id'), calendar_id)
+    location_index.forget_many([i for i in deleted_ids if i])
+    # Lần đọc sau phải thấy thay đổi này (không dùng lại kết quả tải trước khi ghi)
+    calendar_reads.forget_all()
+    
+    if not MIRROR_ENABLED:
+        return
+    mirror = get_mirror(calendar_id, get_calendar_type_by_id(calendar_id))
+    if event is not None:
+        mirror.apply_write(event)
+    for deleted_id in deleted_ids:
+        if deleted_id:
+            mirror.apply_delete(deleted_id)
+    mirror.mark_dirty()
+
+def _index_mirror_changes(calendar_id, upserted, removed_ids, reset=False):
+    """Listener của mirror: giữ chỉ mục event_id -> calendar_id theo dữ liệu sync"""
+    location_index.remember_many((r.id, calendar_id) for r in upserted)
+    location_index.forget_many(removed_ids)
+
+add_change_listener(_index_mirror_changes)
+
+# Chỉ mục xung đột theo giáo viên - build từ lần full sync đầu, cập nhật theo từng thay đổi
+conflict_index = TeacherIntervalIndex()
+
+def _index_conflict_changes(calendar_id, upserted, removed_ids, reset=False):
+    """Listener của mirror: cập nhật chỉ mục xung đột khi event được tạo/sửa/xoá/sync"""
+    for record in upserted:
+        conflict_index.upsert(record)
+    for event_id in removed_ids:
+        conflict_index.remove(event_id)
+
+add_change_listener(_index_conflict_changes)
+
+def open_conflict_index():
     """
-    Xác định calendar dựa trên giờ bắt đầu
-    Giờ chẵn (0, 2, 4, ...) -> calendar chẵn
-    Giờ lẻ (1, 3, 5, ...) -> calendar lẻ
+    Chỉ mục xung đột đã đồng bộ với Google (stale-while-revalidate như list_events)
+    -> (index, độ mới dữ liệu của từng calendar); index None khi tắt mirror - khi đó dùng traditional check trên list_records
     """
+    if not MIRROR_ENABLED:
+        return None, []
+    calendar_ids = shard_router.calendar_ids()
+    refreshed = fan_out(
+        lambda service, cid: get_mirror(cid, get_calendar_type_by_id(cid)).read(),
+        calendar_ids
+    )
+    freshness = []
+    for calendar_id, calendar_freshness, error in refreshed:
+        if error is not None:
+            # Không có dữ liệu (kể cả snapshot cũ) -> không được kết luận "không xung đột"
+            raise error
+        freshness.append(calendar_freshness)
+    return conflict_index, freshness
+
+def get_conflict_index():
+    """Chỉ mục xung đột (None khi tắt mirror) - xem open_conflict_index"""
+    return open_conflict_index()[0]
+
+def _seed_location_index():
+    """Nạp chỉ mục vị trí từ calendar_id đã lưu trong extra data"""
     try:
-        if not start_datetime_str:
-            print("⚠️ Empty datetime, using default calendar")
-            return CALENDARS['default']
-        
-        # Parse datetime string
-        from datetime import datetime
-        
-        # Xử lý các định dạng datetime
-        dt_str = start_datetime_str
-        
-        # Xử lý string có Z
-        if dt_str.endswith('Z'):
-            dt_str = dt_str.replace('Z', '+00:00')
-        
-        # Nếu không có timezone, thêm timezone mặc định
-        if 'T' in dt_str and '+' not in dt_str and '-' not in dt_str.split('T')[1]:
-            dt_str = dt_str + '+00:00'
-        
-        # Parse datetime
-        start_dt = datetime.fromisoformat(dt_str)
-        hour = start_dt.hour
-        
-        # Logic chẵn lẻ
-        if hour % 2 == 0:  # Giờ chẵn
-            print(f"🕐 Hour {hour} is EVEN -> Calendar EVEN")
-            return CALENDARS['even']
-        else:  # Giờ lẻ
-            print(f"🕐 Hour {hour} is ODD -> Calendar ODD")
-            return CALENDARS['odd']
-            
+        extra = load_extra()
+        location_index.remember_many(
+            (event_id, data.get('calendar_id')) for event_id, data in extra.items()
+        )
+        print(f"🧭 Location index seeded with {len(location_index)} events")
     except Exception as e:
-        print(f"❌ Error determining calendar by hour: {e}")
-        print(f"📝 Raw datetime string: {start_datetime_str}")
-        return CALENDARS['default']
+        print(f"⚠️ Could not seed location index: {e}")
+
+_seed_location_index()
+
+def _probe_calendars(event_id):
+    """Thử events().get song song trên mọi shard"""
+    calendar_ids = shard_router.calendar_ids()
+    results = fan_out(
+        lambda service, cid: calendar_calls.execute(service.events().get(calendarId=cid, eventId=event_id)),
+        calendar_ids
+    )
     
-def get_calendar_type_by_id(calendar_id):
-    """Lấy loại calendar từ calendar_id"""
-    if calendar_id == CALENDARS['odd']:
-        return 'odd'
-    elif calendar_id == CALENDARS['even']:
-        return 'even'
-    else:
-        return 'unknown'
+    found_event, found_calendar = None, None
+    for calendar_id, event, error in results:
+        if error is not None:
+            if isinstance(error, HttpError) and error.resp.status == 404:
+                continue  # Không tìm thấy trong calendar này
+            raise error  # Lỗi khác, raise lên
+        if found_event is None:
+            found_event, found_calendar = event, calendar_id
+    return found_event, found_calendar
+
+def find_event(event_id):
+    """
+    Tìm event: gọi thẳng calendar trong chỉ mục vị trí,
+    chỉ thử mọi shard khi chỉ mục chưa biết (hoặc đã sai)
+    Trả về (event, calendar_id) hoặc (None, None) nếu không có ở đâu
+    """
+    indexed_calendar = location_index.lookup(event_id)
+    if indexed_calendar:
+        try:
+            event = calendar_calls.execute(get_calendar_service().events().get(
+                calendarId=indexed_calendar,
+                eventId=event_id
+            ))
+            print(f"✅ Found event in {get_calendar_type_by_id(indexed_calendar).upper()} calendar (index hit)")
+            location_index.remember(event_id, indexed_calendar)
+            return event, indexed_calendar
+        except HttpError as e:
+            if e.resp.status != 404:
+                raise
+            # Chỉ mục sai (event đã chuyển/xoá) -> bỏ và thử mọi shard
+            print(f"⚠️ Location index miss for {event_id}, probing all calendars")
+            location_index.forget(event_id)
+    
+    found_event, found_calendar = _probe_calendars(event_id)
+    if found_event:
+        print(f"✅ Found event in {get_calendar_type_by_id(found_calendar).upper()} calendar")
+        location_index.remember(event_id, found_calendar)
+    return found_event, found_calendar
+
 # ---------------- Events CRUD ----------------
 # ========== HÀM LẤY EVENTS TỪ MULTIPLE CALENDARS ==========
-def list_events(calendar_type='both'):
+def _parse_event_time(dt_str):
+    """Parse dateTime/date của Google thành datetime UTC (naive) để so sánh"""
+    try:
+        if 'T' not in dt_str:
+            return datetime.fromisoformat(dt_str)  # all-day event: YYYY-MM-DD
+        dt = datetime.fromisoformat(dt_str.replace('Z', '+00:00'))
+        if dt.tzinfo:
+            dt = dt.astimezone(dt_timezone.utc).replace(tzinfo=None)
+        return dt
+    except (ValueError, TypeError):
+        return datetime.max
+
+def _to_rfc3339(value):
+    """Chuẩn hoá tham số thời gian (ISO, có/không timezone) thành RFC3339 UTC cho Google"""
+    dt = _parse_event_time(value)
+    if dt == datetime.max:
+        raise ValueError(f"Invalid datetime: {value}")
+    return dt.isoformat() + 'Z'
+
+def _rfc3339_to_ts(value):
+    return _parse_event_time(value).replace(tzinfo=dt_timezone.utc).timestamp()
+
+# Số events mỗi lần lookup extra data
+EXTRA_BATCH_SIZE = 250
+FIELD_NAME_PATTERN = re.compile(r'^[A-Za-z_]+$')
+# Các field luôn cần để phân loại/sort event khi dùng partial response (fields=)
+REQUIRED_EVENT_FIELDS = ['id', 'status', 'summary', 'start', 'end', 'recurringEventId', 'recurrence']
+# Các field backend tự thêm (extra data + metadata), không có trên Google
+LOCAL_EVENT_FIELDS = {
+    'zoom_link', 'meeting_id', 'passcode', 'classname', 'calendar_id',
+    '_calendar_source', '_calendar_id', '_is_instance', '_is_master', '_master_event_id'
+}
+
+def _build_list_params(time_min, time_max, fields):
+    """Tham số events().list cho đường đọc trực tiếp Google"""
+    params = {
+        'timeMax': time_max,
+        'maxResults': 2500,
+        'singleEvents': True,  # ⚠️ QUAN TRỌNG: True để có instances
+        'orderBy': 'startTime',
+        'showDeleted': False
+    }
+    if time_min:
+        params['timeMin'] = time_min
+    if fields:
+        google_fields = [f for f in fields if f not in LOCAL_EVENT_FIELDS]
+        item_fields = list(dict.fromkeys(REQUIRED_EVENT_FIELDS + google_fields))
+        params['fields'] = f"nextPageToken,items({','.join(item_fields)})"
+    return params
+
+def _iter_live_pages(calendar_id, params, first_page):
+    """Đi hết các trang theo nextPageToken - trang sau chỉ được gọi khi cần"""
+    page = first_page
+    while True:
+        yield page.get('items', [])
+        page_token = page.get('nextPageToken')
+        if not page_token:
+            return
+        page = calendar_calls.execute(get_calendar_service().events().list(
+            calendarId=calendar_id,
+            pageToken=page_token,
+            **params
+        ))
+
+def _iter_mirror_window(mirror, time_min, time_max):
+    """Lấy records trong [time_min, time_max) từ mirror bằng bisect trên list start đã sort"""
+    records, starts, max_duration = mirror.sorted_index()
+    max_ts = _rfc3339_to_ts(time_max)
+    min_ts = _rfc3339_to_ts(time_min) if time_min else None
+    
+    # Giống timeMax của Google: event bắt đầu trước time_max
+    hi = bisect.bisect_left(starts, max_ts)
+    lo = 0
+    if min_ts is not None:
+        # Giống timeMin của Google: event kết thúc sau time_min
+        lo = bisect.bisect_left(starts, min_ts - max_duration)
+    
+    for i in range(lo, hi):
+        record = records[i]
+        if min_ts is None or record.end_ts > min_ts:
+            yield record
+
+def _resolve_window(time_min, time_max):
+    """Khoảng thời gian RFC3339 của /classes: mặc định 60 ngày kể từ time_min (hoặc từ bây giờ)"""
+    time_min = _to_rfc3339(time_min) if time_min else None
+    if time_max:
+        time_max = _to_rfc3339(time_max)
+    else:
+        # Làm tròn tới phút để các request mặc định gần nhau có cùng key (gộp lần tải)
+        base = _parse_event_time(time_min) if time_min else datetime.utcnow().replace(second=0, microsecond=0)
+        time_max = (base + timedelta(days=60)).isoformat() + 'Z'
+    return time_min, time_max
+
+def _open_calendar_stream(service, calendar_id, time_min, time_max, fields):
     """
-    Lấy events từ các calendar - HIỆU QUẢ & ĐƠN GIẢN
+    Mở luồng EventRecord (đã sort theo start) của 1 calendar trong khoảng thời gian:
+    từ mirror nếu bật, ngược lại đọc thẳng Google -> (records, thông tin độ mới của dữ liệu)
+    Raise CalendarUnavailableError khi không đọc được và không có snapshot nào
     """
+    if MIRROR_ENABLED:
+        mirror = get_mirror(calendar_id, get_calendar_type_by_id(calendar_id))
+        freshness = mirror.read()
+        return _iter_mirror_window(mirror, time_min, time_max), freshness
+
+    # Request đồng thời cùng calendar + khoảng thời gian + fields dùng chung 1 lần tải (đọc chung các trang)
+    key = (calendar_id, time_min, time_max, tuple(fields) if fields else None)
+    calendar_type_name = get_calendar_type_by_id(calendar_id)
+    breaker = get_breaker(calendar_type_name)
+    error = None
     try:
-        all_events = []
-        cancelled_count = 0
-        
-        # Load extra data trước
-        extra = load_extra()
-        
-        # Xác định calendars cần lấy
-        calendar_ids = []
-        if calendar_type == 'odd' or calendar_type == 'both':
-            calendar_ids.append(CALENDARS['odd'])
-        if calendar_type == 'even' or calendar_type == 'both':
-            calendar_ids.append(CALENDARS['even'])
-        
-        print(f"🔄 Fetching events from {len(calendar_ids)} calendar(s): {calendar_type}")
-        
-        now = datetime.utcnow()
-        time_min = now.isoformat() + 'Z'
-        time_max = (now + timedelta(days=60)).isoformat() + 'Z'
-        
-        for calendar_id in calendar_ids:
-            try:
-                calendar_type_name = get_calendar_type_by_id(calendar_id)
-                print(f"  📅 Fetching from calendar: {calendar_type_name}")
-                
-                # **CÁCH TỐI ƯU: FETCH 1 LẦN VỚI singleEvents=True**
-                # Google Calendar API đã expand instances cho chúng ta
-                events_result = calendar_service.events().list(
-                    calendarId=calendar_id,
-                    #timeMin=time_min,
-                    timeMax=time_max,
-                    maxResults=2500,
-                    singleEvents=True,  # ⚠️ QUAN TRỌNG: True để có instances
-                    orderBy='startTime',
-                    showDeleted=False
-                ).execute()
-                
-                events = events_result.get('items', [])
-                print(f"  📊 Found {len(events)} events")
-                
-                # **XỬ LÝ TỪNG EVENT**
-                for event in events:
-                    event_id = event.get('id')
-                    
-                    # Skip cancelled events
-                    if event.get('status') == 'cancelled':
-                        cancelled_count += 1
-                        continue
-                    
-                    # **PHÂN LOẠI EVENT**
-                    recurring_event_id = event.get('recurringEventId')
-                    has_recurrence = event.get('recurrence')
-                    
-                    # THÊM METADATA
-                    event['_calendar_source'] = calendar_type_name
-                    event['_calendar_id'] = calendar_id
-                    
-                    if recurring_event_id:
-                        # Đây là instance của recurring event
-                        event['_is_instance'] = True
-                        event['_is_master'] = False
-                        event['_master_event_id'] = recurring_event_id
-                    elif has_recurrence:
-                        # Đây là master event - KHÔNG HIỂN THỊ TRÊN CALENDAR VIEW
-                        event['_is_master'] = True
-                        event['_is_instance'] = False
-                        
-                        # **QUAN TRỌNG: SKIP MASTER EVENTS - không thêm vào all_events**
-                        # Master events chỉ là template, không có thời gian cụ thể
-                        continue
-                    else:
-                        # Regular non-recurring event
-                        event['_is_master'] = False
-                        event['_is_instance'] = False
-                    
-                    # THÊM EXTRA DATA
-                    if event_id in extra:
-                        event['zoom_link'] = extra[event_id].get('zoom_link', '')
-                        event['meeting_id'] = extra[event_id].get('meeting_id', '')
-                        event['passcode'] = extra[event_id].get('passcode', '')
-                        event['classname'] = extra[event_id].get('classname', '')
-                    
-                    # THÊM VÀO ALL_EVENTS
-                    all_events.append(event)
-                
-                # **THỐNG KÊ CHO CALENDAR NÀY**
-                masters_skipped = len([e for e in events if e.get('recurrence') and not e.get('recurringEventId')])
-                instances_added = len([e for e in all_events if e.get('_calendar_id') == calendar_id and e.get('_is_instance')])
-                regular_added = len([e for e in all_events if e.get('_calendar_id') == calendar_id and not e.get('_is_instance') and not e.get('_is_master')])
-                
-                print(f"    👑 Skipped {masters_skipped} master events (hidden)")
-                print(f"    ➕ Added {instances_added} instances")
-                print(f"    📌 Added {regular_added} regular events")
-                
-            except HttpError as error:
-                print(f"❌ Error fetching from calendar {calendar_id}: {error}")
+        window = calendar_reads.do(
+            key, lambda: breaker.call(_open_live_window, service, calendar_id, time_min, time_max, fields, key)
+        )
+    except Exception as e:
+        # Google lỗi / breaker mở -> dùng lần tải đầy đủ thành công gần nhất của cùng khoảng thời gian
+        window = _last_good_windows.get(key)
+        if window is None:
+            raise CalendarUnavailableError(f"Calendar {calendar_type_name.upper()} unavailable: {e}") from e
+        print(f"⚠️ Serving stale {calendar_type_name.upper()} window: {e}")
+        error = str(e)
+
+    freshness = {
+        'calendar': calendar_type_name,
+        'source': 'live',
+        'age_seconds': round(time.monotonic() - window.fetched_at, 1),
+        'stale': error is not None
+    }
+    if error:
+        freshness['error'] = error
+    return window.records(), freshness
+
+def _open_live_window(service, calendar_id, time_min, time_max, fields, key):
+    """Tải trang đầu của 1 calendar trong khoảng thời gian -> _LiveWindow (các trang sau tải khi được đọc tới)"""
+    # Google Calendar API đã expand instances cho chúng ta (singleEvents=True)
+    params = _build_list_params(time_min, time_max, fields)
+    first_page = calendar_calls.execute(service.events().list(calendarId=calendar_id, **params))
+    return _LiveWindow(key, calendar_id, _iter_live_pages(calendar_id, params, first_page))
+
+class _LiveWindow:
+    """
+    Kết quả đọc thẳng Google của 1 (calendar, khoảng thời gian, fields), stream theo trang:
+    trang sau chỉ được tải khi có người đọc tới, trang đã tải được giữ lại cho các request
+    dùng chung (single-flight) đọc từ đầu; tải hết mọi trang -> thành last-good của khoảng đó
+    """
+
+    def __init__(self, key, calendar_id, pages):
+        self.key = key
+        self.calendar_id = calendar_id
+        self.fetched_at = time.monotonic()
+        self._calendar_type = get_calendar_type_by_id(calendar_id)
+        self._breaker = get_breaker(self._calendar_type)
+        self._source = pages
+        self._pages = []
+        self._complete = False
+        self._error = None
+        self._lock = threading.Lock()
+
+    def _next_page_locked(self):
+        """Tải thêm 1 trang -> False khi đã hết trang"""
+        if self._error is not None:
+            raise self._error
+        if self._complete:
+            return False
+        try:
+            # Trang đầu đã có sẵn; trang sau là 1 lời gọi Google qua breaker
+            items = next(self._source, None) if not self._pages else self._breaker.call(next, self._source, None)
+        except Exception as e:
+            # Generator đã dừng -> các lần đọc sau cũng phải thấy lỗi thay vì kết quả thiếu
+            self._error = e
+            raise
+        if items is None:
+            self._complete = True
+            _remember_live_window(self)
+            return False
+        self._pages.append([EventRecord.from_google(event, self.calendar_id, self._calendar_type) for event in items])
+        return True
+
+    def records(self):
+        index = 0
+        while True:
+            with self._lock:
+                if index >= len(self._pages) and not self._next_page_locked():
+                    return
+                page = self._pages[index]
+            index += 1
+            yield from page
+
+# Lần tải đầy đủ thành công gần nhất theo (calendar, khoảng thời gian, fields) - dùng khi Google lỗi (mirror tắt)
+_last_good_windows = OrderedDict()
+_last_good_lock = threading.Lock()
+MAX_LAST_GOOD_WINDOWS = 32
+
+def _remember_live_window(window):
+    with _last_good_lock:
+        _last_good_windows[window.key] = window
+        _last_good_windows.move_to_end(window.key)
+        while len(_last_good_windows) > MAX_LAST_GOOD_WINDOWS:
+            _last_good_windows.popitem(last=False)
+
+def _project_event(event, fields):
+    """Chỉ giữ các field được yêu cầu (luôn giữ id)"""
+    projected = {'id': event.get('id')}
+    for field in fields:
+        if field in event:
+            projected[field] = event[field]
+    return projected
+
+def _iter_batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def _visible_records(records, calendar_id, stats):
+    """Bỏ master/cancelled, đếm thống kê; lỗi giữa chừng chỉ dừng calendar này"""
+    try:
+        for record in records:
+            # Skip cancelled events
+            if record.cancelled:
+                stats['cancelled'] += 1
                 continue
-            except Exception as e:
-                print(f"❌ Unexpected error with calendar {calendar_id}: {e}")
+            # Master events chỉ là template - KHÔNG HIỂN THỊ TRÊN CALENDAR VIEW
+            if record.is_master:
+                stats['masters'] += 1
                 continue
-        
-        # **SORT LẠI (cho chắc chắn)**
-        def get_start_time(event):
-            start = event.get('start', {})
-            dt_str = start.get('dateTime') or start.get('date')
-            if dt_str:
-                try:
-                    return datetime.fromisoformat(dt_str.replace('Z', '+00:00'))
-                except:
-                    return datetime.max
-            return datetime.max
-        
-        all_events.sort(key=get_start_time)
-        
-        # **THỐNG KÊ TỔNG**
-        total_masters_skipped = len([e for e in all_events if e.get('_is_master')])
-        total_instances = len([e for e in all_events if e.get('_is_instance')])
-        total_regular = len([e for e in all_events if not e.get('_is_instance') and not e.get('_is_master')])
-        
-        print(f"📅 Total displayed: {len(all_events)} events")
-        print(f"📊 Calendar breakdown: ODD: {len([e for e in all_events if e.get('_calendar_source') == 'odd'])}, EVEN: {len([e for e in all_events if e.get('_calendar_source') == 'even'])}")
-        print(f"📈 Event types: {total_masters_skipped} masters hidden, {total_instances} instances, {total_regular} regular")
-        
-        # **DEBUG: Hiển thị sample events**
-        if all_events and len(all_events) > 0:
-            print(f"🔍 Sample events to display:")
-            for i, event in enumerate(all_events[:3]):  # 3 events đầu
-                event_type = "INSTANCE" if event.get('_is_instance') else "REGULAR"
-                print(f"   {i+1}. {event.get('summary', 'No title')[:30]}... ({event_type})")
-        
-        return all_events
-        
+            stats['instances' if record.is_instance else 'regular'] += 1
+            stats[record.calendar_source] = stats.get(record.calendar_source, 0) + 1
+            yield record
+    except HttpError as error:
+        print(f"❌ Error fetching from calendar {calendar_id}: {error}")
     except Exception as e:
-        print(f"❌ Error in list_events: {e}")
-        import traceback
-        traceback.print_exc()
-        return []
+        print(f"❌ Unexpected error with calendar {calendar_id}: {e}")
+
+def _record_start(record):
+    return record.start_ts
+
+def open_records(calendar_type='both', time_min=None, time_max=None, fields=None):
+    """
+    Mở EventRecord từ các calendar -> (iterator theo thứ tự thời gian, độ mới dữ liệu của từng calendar)
+    Dùng cho các đường xử lý nội bộ (conflict, gợi ý lịch, thống kê) - không copy dict
+    time_min/time_max: khoảng thời gian (ISO), mặc định tới 60 ngày sau
+    Raise CalendarUnavailableError khi có calendar không đọc được và không có snapshot
+    (không trả lịch rỗng - conflict check sẽ kết luận sai là "không xung đột")
+    """
+    # Xác định calendars cần lấy: 'both'/'all' = mọi shard, hoặc tên shard (vd 'odd' hay 'odd,s2')
+    calendar_ids = shard_router.resolve(calendar_type)
+    
+    print(f"🔄 Fetching events from {len(calendar_ids)} calendar(s): {calendar_type}")
+    
+    time_min, time_max = _resolve_window(time_min, time_max)
+    
+    # Mở luồng song song từ các calendar (fan-out)
+    opened = fan_out(
+        lambda service, cid: _open_calendar_stream(service, cid, time_min, time_max, fields),
+        calendar_ids
+    )
+    
+    stats = {'cancelled': 0, 'masters': 0, 'instances': 0, 'regular': 0}
+    streams = []
+    freshness = []
+    for calendar_id, opened_stream, open_error in opened:
+        if open_error is not None:
+            print(f"❌ Error fetching from calendar {calendar_id}: {open_error}")
+            if isinstance(open_error, CalendarUnavailableError):
+                raise open_error
+            raise CalendarUnavailableError(str(open_error)) from open_error
+        records, calendar_freshness = opened_stream
+        freshness.append(calendar_freshness)
+        streams.append(_visible_records(records, calendar_id, stats))
+    
+    return _merge_streams(streams, stats), freshness
+
+def _merge_streams(streams, stats):
+    # **MERGE THEO THỜI GIAN** - mỗi luồng đã được sort sẵn
+    total = 0
+    for record in heapq.merge(*streams, key=_record_start):
+        total += 1
+        yield record
+    
+    # **THỐNG KÊ TỔNG** (sau khi stream xong)
+    print(f"📅 Total displayed: {total} events")
+    breakdown = ', '.join(f"{name.upper()}: {stats.get(name, 0)}" for name in shard_router.names())
+    print(f"📊 Calendar breakdown: {breakdown}")
+    print(f"📈 Event types: {stats['masters']} masters hidden, {stats['instances']} instances, {stats['regular']} regular")
+
+def list_records(calendar_type='both', time_min=None, time_max=None, fields=None):
+    """
+    Lấy EventRecord từ các calendar - GENERATOR theo thứ tự thời gian
+    Dùng cho các đường xử lý nội bộ (conflict, gợi ý lịch, thống kê) - không copy dict
+    time_min/time_max: khoảng thời gian (ISO), mặc định tới 60 ngày sau
+    Raise CalendarUnavailableError (khi bắt đầu duyệt) nếu không đọc được calendar
+    """
+    records, _ = open_records(calendar_type, time_min, time_max, fields)
+    yield from records
+
+def open_events(calendar_type='both', time_min=None, time_max=None, fields=None):
+    """
+    Mở events (dict API) từ các calendar -> (iterator theo thứ tự thời gian, độ mới dữ liệu của từng calendar)
+    Đọc từ mirror cục bộ (hoặc Google), gộp các calendar bằng merge
+    time_min/time_max: khoảng thời gian (ISO), mặc định tới 60 ngày sau
+    fields: danh sách field cần trả về (None = toàn bộ event)
+    Raise CalendarUnavailableError ngay (trước khi stream) nếu không đọc được calendar
+    """
+    if fields:
+        fields = [f for f in fields if FIELD_NAME_PATTERN.match(f)]
+    records, freshness = open_records(calendar_type, time_min, time_max, fields)
+    return _records_to_api(records, fields), freshness
+
+def _records_to_api(records, fields):
+    # Chuyển về dict API ở biên + gắn extra data (lookup theo lô)
+    for batch in _iter_batches(records, EXTRA_BATCH_SIZE):
+        extra = get_extra_many(r.id for r in batch)
+        for record in batch:
+            event = record.to_api(extra.get(record.id))
+            yield _project_event(event, fields) if fields else event
+
+def list_events(calendar_type='both', time_min=None, time_max=None, fields=None):
+    """
+    Lấy events từ các calendar - GENERATOR, yield từng event (dict API) theo thứ tự thời gian
+    Đọc từ mirror cục bộ (hoặc Google theo từng trang), gộp các calendar bằng merge
+    time_min/time_max: khoảng thời gian (ISO), mặc định tới 60 ngày sau
+    fields: danh sách field cần trả về (None = toàn bộ event)
+    """
+    events, _ = open_events(calendar_type, time_min, time_max, fields)
+    yield from events
+
+def _read_mirrors(calendar_ids):
+    """Poll delta các mirror (song song) -> [(mirror, độ mới dữ liệu)], raise CalendarUnavailableError như open_records"""
+    opened = fan_out(
+        lambda service, cid: get_mirror(cid, get_calendar_type_by_id(cid)).read(),
+        calendar_ids
+    )
+    mirrors = []
+    for calendar_id, freshness, read_error in opened:
+        if read_error is not None:
+            print(f"❌ Error syncing calendar {calendar_id}: {read_error}")
+            if isinstance(read_error, CalendarUnavailableError):
+                raise read_error
+            raise CalendarUnavailableError(str(read_error)) from read_error
+        mirrors.append((get_mirror(calendar_id, get_calendar_type_by_id(calendar_id)), freshness))
+    return mirrors
+
+def open_changes(since, calendar_type='both', fields=None, time_min=None, time_max=None):
+    """
+    Các event thay đổi sau version token since (delta cho client giữ bản sao /classes)
+    -> ({'version', 'reset', 'upserted': [event dict API], 'deleted': [id]}, độ mới dữ liệu)
+    - chỉ xét thay đổi ghi nhận ở các shard của calendar_type (event đổi ở shard khác bị bỏ qua)
+    - upserted: trạng thái hiện tại của event được tạo/sửa, nằm trong khoảng time_min/time_max như /classes
+    - deleted: event các shard này đã xoá/chuyển đi, hoặc đã dời ra ngoài khoảng thời gian
+    - reset=True: since không dùng được (khởi động lại / quá cũ / full sync) -> client tải lại /classes
+    Chỉ dùng được khi bật mirror (log được ghi từ listener của mirror)
+    """
+    if fields:
+        fields = [f for f in fields if FIELD_NAME_PATTERN.match(f)]
+    time_min, time_max = _resolve_window(time_min, time_max)
+    min_ts = _rfc3339_to_ts(time_min) if time_min else None
+    max_ts = _rfc3339_to_ts(time_max)
+    # Poll trước: thay đổi làm trực tiếp trên Google Calendar cũng vào log
+    calendar_ids = shard_router.resolve(calendar_type)
+    mirrors = _read_mirrors(calendar_ids)
+    freshness = [f for _, f in mirrors]
+    
+    event_ids, version = change_log.changed_since(since, set(calendar_ids))
+    if event_ids is None:
+        print(f"🔄 Change token {since!r} expired, client must reload")
+        return {'version': version, 'reset': True, 'upserted': [], 'deleted': []}, freshness
+    
+    upserted, deleted = [], []
+    for event_id in event_ids:
+        record = next((r for r in (m.get(event_id) for m, _ in mirrors) if r is not None), None)
+        if record is None or record.start_ts >= max_ts or (min_ts is not None and record.end_ts <= min_ts):
+            deleted.append(event_id)
+        else:
+            upserted.append(record)
+    if upserted or deleted:
+        print(f"🔄 Changes since {since}: {len(upserted)} upserted, {len(deleted)} deleted")
+    return {
+        'version': version,
+        'reset': False,
+        'upserted': list(_records_to_api(upserted, fields)),
+        'deleted': deleted
+    }, freshness
 
 
 # ✅ THÊM HÀM MỚI: Lấy single event bằng ID
 def get_event(event_id):
     """
-    Tìm event trên cả 2 calendars
+    Tìm event trên mọi shard
     """
     try:
         if not event_id or event_id == "undefined":
@@ -300,39 +630,24 @@ def get_event(event_id):
             
         print(f"🔍 Fetching single event: {event_id}")
         
-        # Thử tìm trên cả 2 calendars
-        found_event = None
-        found_calendar = None
-        
-        for calendar_id, cal_type in [(CALENDARS['odd'], 'odd'), (CALENDARS['even'], 'even')]:
-            try:
-                event = calendar_service.events().get(
-                    calendarId=calendar_id,
-                    eventId=event_id
-                ).execute()
-                found_event = event
-                found_calendar = calendar_id
-                event['_calendar_source'] = cal_type
-                event['_calendar_id'] = calendar_id
-                print(f"✅ Found event in {cal_type.upper()} calendar")
-                break
-            except HttpError as e:
-                if e.resp.status == 404:
-                    continue  # Không tìm thấy trong calendar này, thử calendar khác
-                else:
-                    raise  # Lỗi khác, raise lên
+        # Tìm song song trên mọi shard
+        found_event, found_calendar = find_event(event_id)
+        if found_event:
+            cal_type = get_calendar_type_by_id(found_calendar)
+            found_event['_calendar_source'] = cal_type
+            found_event['_calendar_id'] = found_calendar
         
         if not found_event:
             raise HttpError(resp=type('obj', (object,), {'status': 404})(), content=b'Event not found')
         
         # ✅ THÊM EXTRA DATA NẾU CÓ
-        extra = load_extra()
-        if event_id in extra:
-            found_event['zoom_link'] = extra[event_id].get('zoom_link', '')
-            found_event['meeting_id'] = extra[event_id].get('meeting_id', '')
-            found_event['passcode'] = extra[event_id].get('passcode', '')
-            found_event['classname'] = extra[event_id].get('classname', '')
-            found_event['calendar_id'] = extra[event_id].get('calendar_id', found_calendar)
+        extra = extra_store.get(event_id)
+        if extra:
+            found_event['zoom_link'] = extra.get('zoom_link', '')
+            found_event['meeting_id'] = extra.get('meeting_id', '')
+            found_event['passcode'] = extra.get('passcode', '')
+            found_event['classname'] = extra.get('classname', '')
+            found_event['calendar_id'] = extra.get('calendar_id') or found_calendar
         else:
             found_event['calendar_id'] = found_calendar
         
@@ -346,133 +661,161 @@ def get_event(event_id):
         raise
 
 # ----------------- CREATE -----------------
-def create_event(class_info):
+def build_event_body(class_info):
     """
-    Tạo event với calendar tự động chọn dựa trên giờ bắt đầu
+    Dựng event body cho Google + chọn calendar dựa trên giờ bắt đầu
+    Trả về (calendar_id, event)
     """
-    try:
-        # ✅ XÁC ĐỊNH CALENDAR DỰA TRÊN GIỜ BẮT ĐẦU
-        start_time = class_info.get('start', '')
-        calendar_id = determine_calendar_by_hour(start_time)
-        
-        print(f"🎯 ========== CREATE EVENT ==========")
-        print(f"📥 Received class_info: {class_info}")
-        print(f"🕐 Auto-selected calendar: {'EVEN' if calendar_id == CALENDARS['even'] else 'ODD'}")
-        print(f"🔧 Calendar ID: {calendar_id[:50]}...")
-        
-        # ✅ VALIDATION TIMEZONE
-        timezone = class_info.get('timezone', 'Asia/Ho_Chi_Minh')
-        
-        valid_timezones = [
-            'Asia/Ho_Chi_Minh', 'America/Chicago', 'America/New_York', 
-            'America/Los_Angeles', 'Europe/London', 'Europe/Paris',
-            'Asia/Tokyo', 'Australia/Sydney', 'UTC',
-            'America/Denver', 'Europe/Berlin', 'Asia/Seoul',
-            'Asia/Singapore', 'Pacific/Auckland'
-        ]
+    # ✅ XÁC ĐỊNH CALENDAR (SHARD) THEO KHOÁ CHIA: giờ bắt đầu / program / teacher
+    calendar_id = shard_router.route(class_info)
+    
+    print(f"📥 Received class_info: {class_info}")
+    print(f"🕐 Auto-selected calendar: {get_calendar_type_by_id(calendar_id).upper()}")
+    print(f"🔧 Calendar ID: {calendar_id[:50]}...")
+    
+    # ✅ VALIDATION TIMEZONE
+    timezone = class_info.get('timezone', 'Asia/Ho_Chi_Minh')
+    
+    valid_timezones = [
+        'Asia/Ho_Chi_Minh', 'America/Chicago', 'America/New_York', 
+        'America/Los_Angeles', 'Europe/London', 'Europe/Paris',
+        'Asia/Tokyo', 'Australia/Sydney', 'UTC',
+        'America/Denver', 'Europe/Berlin', 'Asia/Seoul',
+        'Asia/Singapore', 'Pacific/Auckland'
+    ]
+    
+    if timezone not in valid_timezones:
+        print(f"⚠️ Warning: Unknown timezone '{timezone}', using Asia/Ho_Chi_Minh")
+        timezone = 'Asia/Ho_Chi_Minh'
+    
+    print(f"🕐 Using validated timezone: {timezone}")
+    
+    # ✅ NORMALIZE DATETIME WITH TIMEZONE
+    def normalize_datetime_with_timezone(dt_str, timezone_str):
+        print(f"🕐 normalize_datetime_with_timezone:")
+        print(f"   Input: {dt_str}")
+        print(f"   Timezone: {timezone_str}")
         
-        if timezone not in valid_timezones:
-            print(f"⚠️ Warning: Unknown timezone '{timezone}', using Asia/Ho_Chi_Minh")
-            timezone = 'Asia/Ho_Chi_Minh'
+        if not dt_str:
+            raise ValueError("Datetime string is empty")
         
-        print(f"🕐 Using validated timezone: {timezone}")
+        from datetime import datetime
+        import pytz
         
-        # ✅ NORMALIZE DATETIME WITH TIMEZONE
-        def normalize_datetime_with_timezone(dt_str, timezone_str):
-            print(f"🕐 normalize_datetime_with_timezone:")
-            print(f"   Input: {dt_str}")
-            print(f"   Timezone: {timezone_str}")
+        try:
+            # TRƯỜNG HỢP 1: Đã có timezone trong string -> giữ nguyên
+            if 'T' in dt_str and ('+' in dt_str.split('T')[1] or '-' in dt_str.split('T')[1] or dt_str.endswith('Z')):
+                print(f"   ✅ Already has timezone info: {dt_str}")
+                return dt_str
             
-            if not dt_str:
-                raise ValueError("Datetime string is empty")
+            # TRƯỜNG HỢP 2: Không có timezone -> thêm timezone từ request
+            print(f"   ⚠️ No timezone detected, adding: {timezone_str}")
             
-            from datetime import datetime
-            import pytz
+            # Parse datetime (định dạng: "2024-11-28T15:00")
+            dt = datetime.fromisoformat(dt_str)
             
+            # ✅ KIỂM TRA TIMEZONE CÓ HỢP LỆ KHÔNG
             try:
-                # TRƯỜNG HỢP 1: Đã có timezone trong string -> giữ nguyên
-                if 'T' in dt_str and ('+' in dt_str.split('T')[1] or '-' in dt_str.split('T')[1] or dt_str.endswith('Z')):
-                    print(f"   ✅ Already has timezone info: {dt_str}")
-                    return dt_str
-                
-                # TRƯỜNG HỢP 2: Không có timezone -> thêm timezone từ request
-                print(f"   ⚠️ No timezone detected, adding: {timezone_str}")
-                
-                # Parse datetime (định dạng: "2024-11-28T15:00")
-                dt = datetime.fromisoformat(dt_str)
-                
-                # ✅ KIỂM TRA TIMEZONE CÓ HỢP LỆ KHÔNG
-                try:
-                    tz = pytz.timezone(timezone_str)
-                    print(f"   ✅ Timezone is valid: {timezone_str}")
-                except pytz.UnknownTimeZoneError:
-                    print(f"   ❌ Unknown timezone: {timezone_str}, falling back to UTC")
-                    tz = pytz.UTC
-                
-                # Áp dụng timezone
-                dt_aware = tz.localize(dt)
-                
-                result = dt_aware.isoformat()
-                print(f"   ✅ After adding timezone: {result}")
-                return result
-                
-            except Exception as e:
-                print(f"   ❌ Error in normalize_datetime: {e}")
-                # Fallback: trả về nguyên bản + thêm timezone cơ bản
-                return dt_str + "+00:00"  # UTC fallback
-        
-        start_normalized = normalize_datetime_with_timezone(class_info['start'], timezone)
-        end_normalized = normalize_datetime_with_timezone(class_info['end'], timezone)
-
-        # ✅ TẠO DESCRIPTION
-        base_description = (
-            f"Classname: {class_info.get('classname', '')}\n"
-            f"Teacher: {class_info.get('teacher', '')}\n"
-            f"Zoom: {class_info.get('zoom_link', '')}\n"
-            f"Meeting ID: {class_info.get('meeting_id', '')}\n"
-            f"Passcode: {class_info.get('passcode', '')}\n"
-            f"Program: {class_info.get('program', '')}"
-        )
-        
-        # THÊM RECURRENCE DESCRIPTION NẾU CÓ
-        recurrence_desc = class_info.get('recurrence_description', '')
-        if recurrence_desc:
-            description = base_description + f"\nRecurrence: {recurrence_desc}"
-            print(f"📝 Added recurrence description: {recurrence_desc}")
-        else:
-            description = base_description
-            print("📝 No recurrence description")
+                tz = pytz.timezone(timezone_str)
+                print(f"   ✅ Timezone is valid: {timezone_str}")
+            except pytz.UnknownTimeZoneError:
+                print(f"   ❌ Unknown timezone: {timezone_str}, falling back to UTC")
+                tz = pytz.UTC
+            
+            # Áp dụng timezone
+            dt_aware = tz.localize(dt)
+            
+            result = dt_aware.isoformat()
+            print(f"   ✅ After adding timezone: {result}")
+            return result
             
-        print(f"📝 Final event description: {description}")
+        except Exception as e:
+            print(f"   ❌ Error in normalize_datetime: {e}")
+            # Fallback: trả về nguyên bản + thêm timezone cơ bản
+            return dt_str + "+00:00"  # UTC fallback
+    
+    start_normalized = normalize_datetime_with_timezone(class_info['start'], timezone)
+    end_normalized = normalize_datetime_with_timezone(class_info['end'], timezone)
 
-        rrule_list = class_info.get("rrule")
-        print("📆 RRULE được gửi lên Google:", rrule_list)
+    # ✅ TẠO DESCRIPTION
+    base_description = (
+        f"Classname: {class_info.get('classname', '')}\n"
+        f"Teacher: {class_info.get('teacher', '')}\n"
+        f"Zoom: {class_info.get('zoom_link', '')}\n"
+        f"Meeting ID: {class_info.get('meeting_id', '')}\n"
+        f"Passcode: {class_info.get('passcode', '')}\n"
+        f"Program: {class_info.get('program', '')}"
+    )
+    
+    # THÊM RECURRENCE DESCRIPTION NẾU CÓ
+    recurrence_desc = class_info.get('recurrence_description', '')
+    if recurrence_desc:
+        description = base_description + f"\nRecurrence: {recurrence_desc}"
+        print(f"📝 Added recurrence description: {recurrence_desc}")
+    else:
+        description = base_description
+        print("📝 No recurrence description")
         
-        # ✅ TẠO EVENT OBJECT
-        event = {
-            'summary': class_info['name'],
-            'description': description,
-            'location': class_info.get('zoom_link', ''),
-            'start': {'dateTime': start_normalized, 'timeZone': timezone},
-            'end': {'dateTime': end_normalized, 'timeZone': timezone},
-            'recurrence': rrule_list
-        }
+    print(f"📝 Final event description: {description}")
+
+    rrule_list = class_info.get("rrule")
+    print("📆 RRULE được gửi lên Google:", rrule_list)
+    
+    # ✅ TẠO EVENT OBJECT
+    event = {
+        'summary': class_info['name'],
+        'description': description,
+        'location': class_info.get('zoom_link', ''),
+        'start': {'dateTime': start_normalized, 'timeZone': timezone},
+        'end': {'dateTime': end_normalized, 'timeZone': timezone},
+        'recurrence': rrule_list
+    }
+
+    # DEBUG chi tiết event trước khi gửi
+    print("🎯 Event data gửi lên Google Calendar:")
+    print(f"  - Summary: {event['summary']}")
+    print(f"  - Calendar: {get_calendar_type_by_id(calendar_id).upper()}")
+    print(f"  - Start: {event['start']}")
+    print(f"  - End: {event['end']}")
+    print(f"  - Recurrence: {event['recurrence']}")
+
+    return calendar_id, event
 
-        # DEBUG chi tiết event trước khi gửi
-        print("🎯 Event data gửi lên Google Calendar:")
-        print(f"  - Summary: {event['summary']}")
-        print(f"  - Calendar: {'EVEN' if calendar_id == CALENDARS['even'] else 'ODD'}")
-        print(f"  - Start: {event['start']}")
-        print(f"  - End: {event['end']}")
-        print(f"  - Recurrence: {event['recurrence']}")
+def _new_event_id():
+    """Id do client tạo cho insert (base32hex: 0-9a-v) -> insert gửi lại sau lỗi 5xx bị 409 thay vì tạo lớp trùng"""
+    return uuid.uuid4().hex
+
+def _is_duplicate_insert(error):
+    return isinstance(error, HttpError) and error.resp.status == 409
+
+def _fetch_created(calendar_id, event_id):
+    """Insert bị 409 với id do mình tạo: lần gửi trước đã ghi vào Google -> lấy event đó"""
+    print(f"♻️ Insert {event_id} already applied by an earlier attempt, fetching it")
+    return calendar_calls.execute(get_calendar_service().events().get(calendarId=calendar_id, eventId=event_id))
+
+def create_event(class_info):
+    """
+    Tạo event với calendar tự động chọn dựa trên giờ bắt đầu
+    """
+    try:
+        print(f"🎯 ========== CREATE EVENT ==========")
+        calendar_id, event = build_event_body(class_info)
+        event['id'] = _new_event_id()
+        rrule_list = event['recurrence']
 
         # ✅ GỬI REQUEST TẠO EVENT VÀO CALENDAR ĐÃ CHỌN
-        result = calendar_service.events().insert(
-            calendarId=calendar_id,  # SỬ DỤNG CALENDAR ĐÃ XÁC ĐỊNH
-            body=event
-        ).execute()
+        try:
+            result = calendar_calls.execute(get_calendar_service().events().insert(
+                calendarId=calendar_id,  # SỬ DỤNG CALENDAR ĐÃ XÁC ĐỊNH
+                body=event
+            ))
+        except HttpError as e:
+            if not _is_duplicate_insert(e):
+                raise
+            result = _fetch_created(calendar_id, event['id'])
 
         event_id = result.get('id')
+        _record_write(calendar_id, event=result)
         
         # ✅ LƯU EXTRA DATA VỚI CALENDAR_ID
         add_extra(event_id,
@@ -483,7 +826,7 @@ def create_event(class_info):
                   calendar_id  # LƯU CALENDAR_ID
         )
 
-        print(f"✅ Event created in {'EVEN' if calendar_id == CALENDARS['even'] else 'ODD'} calendar")
+        print(f"✅ Event created in {get_calendar_type_by_id(calendar_id).upper()} calendar")
         print(f"🔄 Recurrence setting: {rrule_list}")
         return result
 
@@ -491,11 +834,266 @@ def create_event(class_info):
         print(f"❌ Error in create_event: {str(e)}")
         raise
 
-# ----------------- UPDATE -----------------
+# ----------------- BULK (Google batch HTTP) -----------------
+# Google cho phép tới 1000 request/batch nhưng khuyến nghị khoảng 50
+BATCH_LIMIT = 50
+
+def _execute_batches(service, requests, retried=None):
+    """
+    Gửi các request theo lô BATCH_LIMIT qua batch HTTP của Google (qua call scheduler: rate limit + retry)
+    requests: list (request_id, request) - trả về {request_id: (response, error)}
+    retried: set nhận request_id đã gửi lại sau lỗi 5xx (xem CallScheduler.execute_batch)
+    """
+    return calendar_calls.execute_batch(service, requests, BATCH_LIMIT, retried)
+
+def bulk_create_events(class_infos):
+    """
+    Tạo nhiều event: insert gộp thành batch request, extra data ghi trong 1 transaction
+    Trả về kết quả riêng cho từng item (theo thứ tự đầu vào)
+    """
+    print(f"🎯 ========== BULK CREATE: {len(class_infos)} events ==========")
+    service = get_calendar_service()
+    results = [None] * len(class_infos)
+    pending = {}
+    requests = []
+    
+    for index, class_info in enumerate(class_infos):
+        try:
+            calendar_id, event = build_event_body(class_info)
+        except Exception as e:
+            results[index] = {'index': index, 'status': 'error', 'error': str(e)}
+            continue
+        event['id'] = _new_event_id()
+        request_id = str(index)
+        pending[request_id] = (calendar_id, class_info, event['id'])
+        requests.append((request_id, service.events().insert(calendarId=calendar_id, body=event)))
+    
+    responses = _execute_batches(service, requests)
+    
+    extra_records = {}
+    for request_id, (calendar_id, class_info, new_id) in pending.items():
+        index = int(request_id)
+        response, error = responses.get(request_id, (None, RuntimeError("No batch response")))
+        if _is_duplicate_insert(error):
+            try:
+                response, error = _fetch_created(calendar_id, new_id), None
+            except Exception as e:
+                error = e
+        if error is not None:
+            print(f"❌ Bulk create item {index} failed: {error}")
+            results[index] = {'index': index, 'status': 'error', 'error': str(error)}
+            continue
+        
+        event_id = response.get('id')
+        _record_write(calendar_id, event=response)
+        extra_records[event_id] = {
+            "zoom_link": class_info.get('zoom_link', ''),
+            "meeting_id": class_info.get('meeting_id', ''),
+            "passcode": class_info.get('passcode', ''),
+            "classname": class_info.get('classname', ''),
+            "calendar_id": calendar_id
+        }
+        results[index] = {
+            'index': index,
+            'status': 'created',
+            'id': event_id,
+            'calendar': get_calendar_type_by_id(calendar_id),
+            'event': response
+        }
+    
+    # ✅ LƯU EXTRA DATA CỦA CẢ LÔ TRONG 1 TRANSACTION
+    extra_store.upsert_many(extra_records)
+    
+    created = sum(1 for r in results if r['status'] == 'created')
+    print(f"✅ Bulk create done: {created}/{len(class_infos)} created")
+    return results
+
+def bulk_delete_events(event_ids):
+    """
+    Xoá nhiều event bằng batch request (mode 'this' cho từng id)
+    Event chưa có trong chỉ mục vị trí: thử lần lượt từng shard, 404 thì thử shard tiếp theo ở lô sau
+    404 sau khi gửi lại vì lỗi 5xx: lần gửi trước có thể đã xoá - vẫn thử các shard còn lại,
+    không có ở đâu thì coi như đã xoá ở calendar đó
+    """
+    print(f"🗑️ ========== BULK DELETE: {len(event_ids)} events ==========")
+    service = get_calendar_service()
+    all_calendars = shard_router.calendar_ids()
+    results = {}
+    deleted_by_calendar = {}
+    # event_id -> calendar trả 404 cho lần gửi lại sau lỗi 5xx
+    maybe_deleted = {}
+    
+    # Mỗi event: danh sách calendar cần thử, calendar trong chỉ mục được thử trước
+    candidates = {}
+    for event_id in dict.fromkeys(event_ids):
+        if not event_id or event_id == "undefined":
+            results[event_id] = {'event_id': event_id, 'status': 'error', 'error': 'Invalid event ID'}
+            continue
+        indexed = location_index.lookup(event_id)
+        order = [indexed] + [c for c in all_calendars if c != indexed] if indexed else list(all_calendars)
+        candidates[event_id] = order
+    
+    attempt = 0
+    while candidates:
+        requests = []
+        tried = {}
+        for i, (event_id, order) in enumerate(candidates.items()):
+            calendar_id = order[attempt] if attempt < len(order) else None
+            if calendar_id is None:
+                continue
+            request_id = str(i)
+            tried[request_id] = (event_id, calendar_id)
+            requests.append((request_id, service.events().delete(calendarId=calendar_id, eventId=event_id)))
+        if not requests:
+            break
+        
+        retried = set()
+        responses = _execute_batches(service, requests, retried)
+        for request_id, (event_id, calendar_id) in tried.items():
+            _, error = responses.get(request_id, (None, RuntimeError("No batch response")))
+            status = getattr(getattr(error, 'resp', None), 'status', None)
+            if error is None or status == 410:
+                # 410: event đã bị xoá từ trước -> coi như đã xoá
+                results[event_id] = {
+                    'event_id': event_id,
+                    'status': 'deleted',
+                    'from_calendar': get_calendar_type_by_id(calendar_id).upper()
+                }
+                deleted_by_calendar.setdefault(calendar_id, []).append(event_id)
+                candidates.pop(event_id)
+            elif status == 404:
+                if request_id in retried:
+                    maybe_deleted.setdefault(event_id, calendar_id)
+                continue  # Thử calendar tiếp theo ở lô sau
+            else:
+                results[event_id] = {'event_id': event_id, 'status': 'error', 'error': str(error)}
+                candidates.pop(event_id)
+        attempt += 1
+    
+    for event_id in candidates:
+        calendar_id = maybe_deleted.get(event_id)
+        if calendar_id is not None:
+            # Không có ở shard nào: lần gửi bị lỗi 5xx trước đó đã xoá event này
+            results[event_id] = {
+                'event_id': event_id,
+                'status': 'deleted',
+                'from_calendar': get_calendar_type_by_id(calendar_id).upper()
+            }
+            deleted_by_calendar.setdefault(calendar_id, []).append(event_id)
+            continue
+        results[event_id] = {'event_id': event_id, 'status': 'error', 'error': 'Event not found in any calendar'}
+    
+    # ✅ XOÁ EXTRA DATA CỦA CẢ LÔ TRONG 1 TRANSACTION
+    deleted_ids = [i for ids in deleted_by_calendar.values() for i in ids]
+    extra_store.delete_many(deleted_ids)
+    for calendar_id, ids in deleted_by_calendar.items():
+        _record_write(calendar_id, deleted_ids=ids)
+    
+    print(f"✅ Bulk delete done: {len(deleted_ids)}/{len(event_ids)} deleted")
+    return [results[event_id] for event_id in dict.fromkeys(event_ids)]
+
+# ----------------- UPDATE / DELETE -----------------
+# Instance của lớp lặp lại: <master_id>_<giờ bắt đầu gốc UTC>, vd abc123_20261103T020000Z
+INSTANCE_ID = re.compile(r'^(.+)_(\d{8}T\d{6}Z)$')
+
+def _split_instance_id(event_id):
+    """'abc123_20261103T020000Z' -> ('abc123', '2026-11-03T02:00:00Z'), không phải instance -> (None, None)"""
+    match = INSTANCE_ID.match(event_id)
+    if not match:
+        return None, None
+    start = datetime.strptime(match.group(2), '%Y%m%dT%H%M%SZ')
+    return match.group(1), start.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def _local_copy(calendar_id, event_id):
+    """Bản hiện tại của event từ mirror (không gọi Google) - None nếu mirror tắt/cũ/không có"""
+    if not MIRROR_ENABLED:
+        return None
+    return get_mirror(calendar_id, get_calendar_type_by_id(calendar_id)).local_copy(event_id)
+
+def _with_located_event(event_id, apply):
+    """
+    apply(current_event, calendar_id) với calendar lấy từ chỉ mục vị trí và event từ mirror
+    (current_event có thể None) - không tốn lời gọi Google nào để tìm event.
+    Chỉ mục chưa biết, hoặc Google trả 404 (chỉ mục cũ) -> find_event rồi thử lại 1 lần
+    """
+    calendar_id = location_index.lookup(event_id)
+    if calendar_id:
+        try:
+            return apply(_local_copy(calendar_id, event_id), calendar_id)
+        except HttpError as e:
+            if e.resp.status != 404:
+                raise
+            print(f"⚠️ Location index stale for {event_id}, looking it up again")
+            location_index.forget(event_id)
+    
+    current_event, calendar_id = find_event(event_id)
+    if not current_event:
+        raise ValueError(f"Event {event_id} not found in any calendar")
+    return apply(current_event, calendar_id)
+
+def _same_time(old, new):
+    old, new = old or {}, new or {}
+    if old.get('timeZone') != new.get('timeZone'):
+        return False
+    if old.get('dateTime') and new.get('dateTime'):
+        return _rfc3339_to_ts(old['dateTime']) == _rfc3339_to_ts(new['dateTime'])
+    return old.get('dateTime') == new.get('dateTime') and old.get('date') == new.get('date')
+
+def _changed_fields(current_event, desired):
+    """Các trường trong desired khác với event hiện tại (body cho events.patch)"""
+    changes = {}
+    for field, value in desired.items():
+        old = current_event.get(field)
+        if field in ('start', 'end'):
+            same = _same_time(old, value)
+        elif field == 'recurrence':
+            same = (old or None) == (value or None)
+        else:
+            same = (old or '') == (value or '')
+        if not same:
+            changes[field] = value
+    return changes
+
+def _patch_event(calendar_id, event_id, current_event, desired):
+    """
+    events.patch chỉ với các trường thay đổi (không có bản hiện tại -> gửi mọi trường của form),
+    không gọi Google nếu không có gì thay đổi
+    """
+    changes = _changed_fields(current_event, desired) if current_event is not None else dict(desired)
+    if not changes:
+        print(f"✅ Nothing changed on Google for {event_id}, skipping patch")
+        return current_event
+    
+    print(f"🩹 Patching fields: {sorted(changes)}")
+    return calendar_calls.execute(get_calendar_service().events().patch(
+        calendarId=calendar_id,
+        eventId=event_id,
+        body=changes
+    ))
+
+def _move_event(calendar_id, event_id, destination):
+    """
+    events.move sang calendar khác, giữ nguyên event_id (extra data, link phía client vẫn đúng)
+    Trả về event ở calendar mới, None nếu Google không cho move (vd 1 buổi của lớp lặp lại)
+    """
+    try:
+        return calendar_calls.execute(get_calendar_service().events().move(
+            calendarId=calendar_id,
+            eventId=event_id,
+            destination=destination
+        ))
+    except HttpError as e:
+        if e.resp.status not in (400, 403) or is_rate_limited(e):
+            raise
+        print(f"⚠️ Cannot move {event_id} to other calendar: {e}")
+        return None
+
 # ========== HÀM CẬP NHẬT EVENT VỚI CALENDAR TỰ ĐỘNG ==========
 def update_event(event_id, class_info):
     """
     Cập nhật event - có thể chuyển sang calendar khác nếu giờ thay đổi
+    Calendar lấy từ chỉ mục vị trí, bản hiện tại từ mirror; đổi calendar bằng events.move
+    rồi chỉ patch các trường thay đổi. Kết quả có google_calls = số lời gọi Google đã dùng
     """
     try:
         if not event_id or event_id == "undefined":
@@ -505,167 +1103,29 @@ def update_event(event_id, class_info):
         print(f"🆔 Event ID: {event_id}")
         print(f"📝 Update data: {class_info}")
         
-        # ✅ HÀM normalize_datetime_with_timezone (giống trong create_event)
-        def normalize_datetime_with_timezone(dt_str, timezone_str):
-            print(f"🕐 normalize_datetime_with_timezone:")
-            print(f"   Input: {dt_str}")
-            print(f"   Timezone: {timezone_str}")
-            
-            if not dt_str:
-                raise ValueError("Datetime string is empty")
-            
-            from datetime import datetime
-            import pytz
-            
-            try:
-                if 'T' in dt_str and ('+' in dt_str.split('T')[1] or '-' in dt_str.split('T')[1] or dt_str.endswith('Z')):
-                    print(f"   ✅ Already has timezone info: {dt_str}")
-                    return dt_str
-                
-                print(f"   ⚠️ No timezone detected, adding: {timezone_str}")
-                dt = datetime.fromisoformat(dt_str)
-                
-                try:
-                    tz = pytz.timezone(timezone_str)
-                    print(f"   ✅ Timezone is valid: {timezone_str}")
-                except pytz.UnknownTimeZoneError:
-                    print(f"   ❌ Unknown timezone: {timezone_str}, falling back to UTC")
-                    tz = pytz.UTC
-                
-                dt_aware = tz.localize(dt)
-                result = dt_aware.isoformat()
-                print(f"   ✅ After adding timezone: {result}")
-                return result
-                
-            except Exception as e:
-                print(f"   ❌ Error in normalize_datetime: {e}")
-                return dt_str + "+00:00"
-        
-        # ✅ TÌM EVENT HIỆN TẠI TRÊN CALENDAR NÀO
-        current_event = None
-        current_calendar_id = None
-        
-        # Thử tìm trên cả 2 calendars
-        for calendar_id in [CALENDARS['odd'], CALENDARS['even']]:
-            try:
-                event = calendar_service.events().get(
-                    calendarId=calendar_id,
-                    eventId=event_id
-                ).execute()
-                current_event = event
-                current_calendar_id = calendar_id
-                print(f"✅ Found existing event in {'EVEN' if calendar_id == CALENDARS['even'] else 'ODD'} calendar")
-                break
-            except HttpError as e:
-                if e.resp.status == 404:
-                    continue  # Không tìm thấy trong calendar này
-                else:
-                    raise
-        
-        if not current_event:
-            raise ValueError(f"Event {event_id} not found in any calendar")
-        
-        # ✅ XÁC ĐỊNH CALENDAR MỚI DỰA TRÊN GIỜ MỚI
-        new_start_time = class_info.get('start', '')
-        new_calendar_id = determine_calendar_by_hour(new_start_time)
-        
-        print(f"🔄 Calendar check:")
-        print(f"  - Current: {'EVEN' if current_calendar_id == CALENDARS['even'] else 'ODD'}")
-        print(f"  - New: {'EVEN' if new_calendar_id == CALENDARS['even'] else 'ODD'}")
-        
-        # ✅ VALIDATION TIMEZONE
-        timezone = class_info.get('timezone', 'Asia/Ho_Chi_Minh')
-        
-        valid_timezones = [
-            'Asia/Ho_Chi_Minh', 'America/Chicago', 'America/New_York', 
-            'America/Los_Angeles', 'Europe/London', 'Europe/Paris',
-            'Asia/Tokyo', 'Australia/Sydney', 'UTC',
-            'America/Denver', 'Europe/Berlin', 'Asia/Seoul',
-            'Asia/Singapore', 'Pacific/Auckland'
-        ]
-        
-        if timezone not in valid_timezones:
-            print(f"⚠️ Warning: Unknown timezone '{timezone}', using Asia/Ho_Chi_Minh")
-            timezone = 'Asia/Ho_Chi_Minh'
+        # ✅ CALENDAR MỚI + CÁC TRƯỜNG MỚI (giống create_event)
+        new_calendar_id, desired = build_event_body(class_info)
         
-        print(f"🕐 Using validated timezone: {timezone}")
-        
-        # ✅ NORMALIZE DATETIME
-        start_normalized = normalize_datetime_with_timezone(class_info['start'], timezone)
-        end_normalized = normalize_datetime_with_timezone(class_info['end'], timezone)
-        
-        # ✅ TẠO DESCRIPTION MỚI
-        base_description = (
-            f"Classname: {class_info.get('classname', '')}\n"
-            f"Teacher: {class_info.get('teacher', '')}\n"
-            f"Zoom: {class_info.get('zoom_link', '')}\n"
-            f"Meeting ID: {class_info.get('meeting_id', '')}\n"
-            f"Passcode: {class_info.get('passcode', '')}\n"
-            f"Program: {class_info.get('program', '')}"
-        )
-        
-        recurrence_desc = class_info.get('recurrence_description', '')
-        if recurrence_desc:
-            description = base_description + f"\nRecurrence: {recurrence_desc}"
-            print(f"📝 Added recurrence description: {recurrence_desc}")
-        else:
-            description = base_description
-            print("📝 No recurrence description")
-        
-        rrule_list = class_info.get("rrule")
-        
-        # ✅ TRƯỜNG HỢP 1: CALENDAR THAY ĐỔI -> XÓA CŨ, TẠO MỚI
-        if new_calendar_id != current_calendar_id:
-            print(f"🔄 Calendar changed! Deleting old and creating new...")
+        def apply(current_event, current_calendar_id):
+            print(f"🔄 Calendar check:")
+            print(f"  - Current: {get_calendar_type_by_id(current_calendar_id).upper()}")
+            print(f"  - New: {get_calendar_type_by_id(new_calendar_id).upper()}")
             
-            # Xóa event cũ
-            try:
-                calendar_service.events().delete(
-                    calendarId=current_calendar_id,
-                    eventId=event_id
-                ).execute()
-                print(f"🗑️ Deleted event from old calendar")
-            except Exception as delete_error:
-                print(f"⚠️ Error deleting from old calendar: {delete_error}")
+            # ✅ TRƯỜNG HỢP 1: CALENDAR THAY ĐỔI -> MOVE (giữ event_id) rồi patch
+            if new_calendar_id != current_calendar_id:
+                print(f"🔄 Calendar changed! Moving event...")
+                moved = _move_event(current_calendar_id, event_id, new_calendar_id)
+                if moved is None:
+                    return _recreate_in_calendar(event_id, class_info, current_calendar_id, new_calendar_id)
+                _record_write(current_calendar_id, deleted_ids=[event_id])
+                # Kết quả move là bản mới nhất trên Google -> patch đúng các trường khác
+                current_event, current_calendar_id = moved, new_calendar_id
             
-            # Tạo event mới với calendar mới
-            class_info['calendar_id'] = new_calendar_id
-            return create_event(class_info)
-        
-        # ✅ TRƯỜNG HỢP 2: CÙNG CALENDAR -> UPDATE BÌNH THƯỜNG
-        else:
-            print(f"🔄 Same calendar, updating normally...")
+            # ✅ TRƯỜNG HỢP 2: CÙNG CALENDAR -> PATCH CÁC TRƯỜNG THAY ĐỔI
+            result = _patch_event(current_calendar_id, event_id, current_event, desired)
+            _record_write(current_calendar_id, event=result)
             
-            # Cập nhật thông tin event
-            current_event['summary'] = class_info.get('name', current_event.get('summary'))
-            current_event['description'] = description
-            current_event['location'] = class_info.get('zoom_link', '')
-            current_event['start'] = {
-                'dateTime': start_normalized, 
-                'timeZone': timezone
-            }
-            current_event['end'] = {
-                'dateTime': end_normalized, 
-                'timeZone': timezone
-            }
-            current_event['recurrence'] = rrule_list
-
-            # DEBUG chi tiết
-            print("🎯 Event update data:")
-            print(f"  - Summary: {current_event['summary']}")
-            print(f"  - Calendar: {'EVEN' if current_calendar_id == CALENDARS['even'] else 'ODD'}")
-            print(f"  - Start: {current_event['start']}")
-            print(f"  - End: {current_event['end']}")
-            print(f"  - Recurrence: {current_event['recurrence']}")
-
-            # Cập nhật Google Calendar
-            result = calendar_service.events().update(
-                calendarId=current_calendar_id,
-                eventId=event_id,
-                body=current_event
-            ).execute()
-
-            # Cập nhật file extra JSON
+            # Cập nhật extra data
             update_extra(
                 event_id,
                 class_info.get('meeting_id', ''),
@@ -674,19 +1134,109 @@ def update_event(event_id, class_info):
                 class_info.get('classname', ''),
                 current_calendar_id  # Lưu calendar_id
             )
-
-            print(f"✅ Event updated in {'EVEN' if current_calendar_id == CALENDARS['even'] else 'ODD'} calendar")
-            print(f"🔄 Recurrence setting: {current_event['recurrence']}")
+            
+            print(f"✅ Event updated in {get_calendar_type_by_id(current_calendar_id).upper()} calendar")
+            print(f"🔄 Recurrence setting: {desired['recurrence']}")
             return result
+        
+        with calendar_calls.tracking() as tracker:
+            result = _with_located_event(event_id, apply)
+        print(f"📊 update_event used {tracker.count} Google calls")
+        return dict(result, google_calls=tracker.count)
 
     except Exception as e:
         print(f"❌ Error in update_event: {str(e)}")
         raise
 
+def _recreate_in_calendar(event_id, class_info, current_calendar_id, new_calendar_id):
+    """Không move được -> xoá event cũ, tạo mới ở calendar mới (event_id mới)"""
+    print(f"🔄 Deleting old and creating new...")
+    try:
+        calendar_calls.execute(get_calendar_service().events().delete(
+            calendarId=current_calendar_id,
+            eventId=event_id
+        ))
+        print(f"🗑️ Deleted event from old calendar")
+        _record_write(current_calendar_id, deleted_ids=[event_id])
+    except Exception as delete_error:
+        print(f"⚠️ Error deleting from old calendar: {delete_error}")
+    
+    class_info['calendar_id'] = new_calendar_id
+    return create_event(class_info)
+
+# ----------------- DELETE -----------------
+def _delete_on_google(calendar_id, event_id):
+    calendar_calls.execute(get_calendar_service().events().delete(
+        calendarId=calendar_id,
+        eventId=event_id
+    ))
+
+# Lỗi Google khi đọc/patch master mà vẫn xoá được riêng buổi này: recurrence bị từ chối, master đã xoá
+FOLLOWING_FALLBACK_STATUSES = {400, 404, 410}
+
+def _delete_following(calendar_id, event_id, master_event_id, instance_start):
+    """
+    Xoá buổi này và các buổi sau: 1 lời gọi - patch UNTIL vào master (xoá master nếu là buổi đầu)
+    Master lấy từ mirror nếu còn mới. Trả về (master sau khi patch | None, các id đã xoá, lý do fallback | None)
+    Master không đọc/sửa được (thiếu giờ bắt đầu, master đã xoá, Google từ chối recurrence mới) -> chỉ xoá buổi này
+    và trả về lý do; lỗi khác (5xx hết lượt retry, quyền...) được raise
+    """
+    try:
+        if not instance_start:
+            raise ValueError("Cannot get instance start time")
+        print(f"🕐 Instance to delete starts at: {instance_start}")
+        
+        # 1. Lấy master event
+        master_event = _local_copy(calendar_id, master_event_id)
+        if master_event is None:
+            master_event = calendar_calls.execute(get_calendar_service().events().get(
+                calendarId=calendar_id,
+                eventId=master_event_id
+            ))
+        
+        # 2. Kiểm tra đây có phải instance đầu tiên không (cho phép sai số 1 phút do timezone)
+        master_start = master_event.get('start', {}).get('dateTime')
+        is_first_instance = False
+        if master_start:
+            master_dt = datetime.fromisoformat(master_start.replace('Z', '+00:00'))
+            instance_dt = datetime.fromisoformat(instance_start.replace('Z', '+00:00'))
+            is_first_instance = abs((instance_dt - master_dt).total_seconds()) < 60
+        
+        # 3a. Instance đầu tiên -> xóa toàn bộ series
+        if is_first_instance:
+            print(f"🗑️ First instance, deleting entire series")
+            _delete_on_google(calendar_id, master_event_id)
+            remove_extra(master_event_id)
+            print(f"✅ Entire series deleted")
+            return None, [event_id, master_event_id], None
+        
+        # 3b. Dừng recurrence trước buổi này bằng UNTIL - Google bỏ luôn buổi này và các buổi sau
+        # (UNTIL tính theo UTC nên đổi giờ bắt đầu sang UTC trước)
+        updated_recurrence = stop_recurrence_at_instance(master_event, _to_rfc3339(instance_start))
+        if not updated_recurrence:
+            raise ValueError("Could not update recurrence")
+        result = calendar_calls.execute(get_calendar_service().events().patch(
+            calendarId=calendar_id,
+            eventId=master_event_id,
+            body={'recurrence': updated_recurrence}
+        ))
+        print(f"✅ Master event updated with UNTIL")
+        return result, [event_id], None
+        
+    except (ValueError, HttpError) as e:
+        if isinstance(e, HttpError) and e.resp.status not in FOLLOWING_FALLBACK_STATUSES:
+            raise
+        print(f"⚠️ Error in 'following' delete: {e}")
+        # Fallback: chỉ xóa instance này (caller báo lại cho client)
+        _delete_on_google(calendar_id, event_id)
+        print(f"✅ Instance deleted (fallback)")
+        return None, [event_id], str(e)
+
 def delete_event(event_id, delete_mode='this'):
     """
     Xóa event với các mode khác nhau cho recurring events
     delete_mode: 'this', 'following', 'all'
+    Master/giờ bắt đầu của instance lấy từ event_id hoặc mirror, mỗi mode thường chỉ tốn 1 lời gọi Google
     """
     try:
         if not event_id or event_id == "undefined":
@@ -694,191 +1244,68 @@ def delete_event(event_id, delete_mode='this'):
         
         print(f"🗑️ Deleting event: {event_id}, mode: {delete_mode}")
         
-        # **KHỞI TẠO BIẾN deleted_from TRƯỚC**
-        deleted_from = 'unknown'  # Khởi tạo giá trị mặc định
-        
-        # **THÊM LOGIC PHÂN BIỆT MASTER/INSTANCE**
-        is_instance = '_' in event_id and event_id.count('_') >= 2
-        master_event_id = None
-        
-        if is_instance:
-            # Extract master event ID từ instance ID
-            parts = event_id.rsplit('_', 1)
-            if len(parts) == 2:
-                master_event_id = parts[0]
-                print(f"🔍 Instance detected, master ID: {master_event_id}")
-        
-        # Tìm event trên calendar nào
-        current_event = None
-        current_calendar_id = None
-        
-        for calendar_id in [CALENDARS['odd'], CALENDARS['even']]:
-            try:
-                event = calendar_service.events().get(
-                    calendarId=calendar_id,
-                    eventId=event_id
-                ).execute()
-                current_event = event
-                current_calendar_id = calendar_id
-                
-                # Nếu là instance và chưa có master_event_id, lấy từ recurringEventId
-                if not master_event_id:
-                    master_event_id = event.get('recurringEventId')
-                
-                print(f"✅ Found event in {'EVEN' if calendar_id == CALENDARS['even'] else 'ODD'} calendar")
-                print(f"🔄 Event type: {'INSTANCE' if master_event_id else 'MASTER'}")
-                print(f"🔄 Master event ID: {master_event_id}")
-                break
-            except HttpError as e:
-                if e.resp.status == 404:
-                    continue
-                else:
-                    raise
-        
-        if not current_event:
-            raise ValueError(f"Event {event_id} not found in any calendar")
-        
-        # **CẬP NHẬT deleted_from DỰA TRÊN CALENDAR**
-        deleted_from = 'EVEN' if current_calendar_id == CALENDARS['even'] else 'ODD'
+        # **PHÂN BIỆT MASTER/INSTANCE TỪ event_id**
+        id_master_event_id, id_instance_start = _split_instance_id(event_id)
         
-        # **XỬ LÝ CÁC MODE XÓA**
-        if delete_mode == 'all' and master_event_id:
-            # Xóa toàn bộ series (xóa master event)
-            print(f"🗑️ Deleting entire series (master: {master_event_id})")
-            calendar_service.events().delete(
-                calendarId=current_calendar_id,
-                eventId=master_event_id
-            ).execute()
-            print(f"✅ Entire series deleted from {deleted_from} calendar")
-            
-            # Cũng thử xóa instance hiện tại nếu còn tồn tại
-            try:
-                calendar_service.events().delete(
-                    calendarId=current_calendar_id,
-                    eventId=event_id
-                ).execute()
-            except:
-                pass  # Instance có thể đã bị xóa cùng master
+        def apply(current_event, current_calendar_id):
+            master_event_id, instance_start = id_master_event_id, id_instance_start
+            if current_event is not None:
+                # Instance đã sửa (exception) có thể có giờ khác giờ gốc trong id
+                master_event_id = current_event.get('recurringEventId') or master_event_id
+                instance_start = current_event.get('start', {}).get('dateTime') or instance_start
             
-            # Xóa extra data của cả master và instance
-            remove_extra(master_event_id)
-            remove_extra(event_id)
-            
-        elif delete_mode == 'following' and master_event_id:
-            print(f"🗑️ Deleting this and following events from series")
+            print(f"🔄 Event type: {'INSTANCE' if master_event_id else 'MASTER'}")
+            print(f"🔄 Master event ID: {master_event_id}")
+            deleted_from = get_calendar_type_by_id(current_calendar_id).upper()
+            master_result = None
+            fallback_reason = None
             
-            try:
-                # 1. Lấy master event
-                master_event = calendar_service.events().get(
-                    calendarId=current_calendar_id,
-                    eventId=master_event_id
-                ).execute()
-                
-                # 2. Lấy start time của instance
-                instance_start = current_event.get('start', {}).get('dateTime')
-                if not instance_start:
-                    raise ValueError("Cannot get instance start time")
-                
-                print(f"🕐 Instance to delete starts at: {instance_start}")
-                
-                # 3. Kiểm tra đây có phải instance đầu tiên không
-                master_start = master_event.get('start', {}).get('dateTime')
-                is_first_instance = False
-                
-                if master_start:
-                    from datetime import datetime
-                    master_dt = datetime.fromisoformat(master_start.replace('Z', '+00:00'))
-                    instance_dt = datetime.fromisoformat(instance_start.replace('Z', '+00:00'))
-                    
-                    # Cho phép sai số 1 phút do timezone
-                    time_diff = abs((instance_dt - master_dt).total_seconds())
-                    is_first_instance = time_diff < 60
-                    
-                    if is_first_instance:
-                        print(f"⚠️ This is the FIRST instance in the series")
-                
-                # 4. Xóa instance hiện tại
-                calendar_service.events().delete(
-                    calendarId=current_calendar_id,
-                    eventId=event_id
-                ).execute()
-                print(f"✅ Instance {event_id} deleted")
-                
-                # 5. Xử lý master event
-                if is_first_instance:
-                    # Nếu là instance đầu tiên → xóa toàn bộ series
-                    print(f"🗑️ First instance deleted, deleting entire series")
-                    calendar_service.events().delete(
-                        calendarId=current_calendar_id,
-                        eventId=master_event_id
-                    ).execute()
-                    print(f"✅ Entire series deleted")
-                    
-                    # Xóa extra data của master
-                    remove_extra(master_event_id)
-                    
-                else:
-                    # Không phải instance đầu tiên → dùng UNTIL để dừng recurrence
-                    print(f"🔄 Updating master event to stop BEFORE this instance")
-                    
-                    try:
-                        # Cập nhật recurrence với UNTIL
-                        updated_recurrence = stop_recurrence_at_instance(master_event, instance_start)
-                        
-                        if updated_recurrence:
-                            master_event['recurrence'] = updated_recurrence
-                            
-                            # Cập nhật master event
-                            calendar_service.events().update(
-                                calendarId=current_calendar_id,
-                                eventId=master_event_id,
-                                body=master_event
-                            ).execute()
-                            print(f"✅ Master event updated with UNTIL")
-                        else:
-                            print(f"⚠️ Could not update recurrence")
-                            
-                    except Exception as update_error:
-                        print(f"⚠️ Error updating master event: {update_error}")
-                        # Tiếp tục dù có lỗi update master
+            # **XỬ LÝ CÁC MODE XÓA**
+            if delete_mode == 'all' and master_event_id:
+                # Xóa master = xóa toàn bộ series (kể cả instance này)
+                print(f"🗑️ Deleting entire series (master: {master_event_id})")
+                _delete_on_google(current_calendar_id, master_event_id)
+                print(f"✅ Entire series deleted from {deleted_from} calendar")
+                remove_extra(master_event_id)
+                deleted_ids = [event_id, master_event_id]
                 
+            elif delete_mode == 'following' and master_event_id:
+                print(f"🗑️ Deleting this and following events from series")
+                master_result, deleted_ids, fallback_reason = _delete_following(
+                    current_calendar_id, event_id, master_event_id, instance_start
+                )
                 print(f"✅ Following delete completed from {deleted_from} calendar")
                 
-            except Exception as e:
-                print(f"⚠️ Error in 'following' delete: {e}")
-                # Fallback: chỉ xóa instance này
-                try:
-                    calendar_service.events().delete(
-                        calendarId=current_calendar_id,
-                        eventId=event_id
-                    ).execute()
-                    print(f"✅ Instance deleted (fallback)")
-                except Exception as delete_error:
-                    print(f"❌ Even fallback delete failed: {delete_error}")
-                    raise
-                
-            # Xóa extra data của instance
-            remove_extra(event_id)
-            
-        else:
-            # Xóa single event, instance, hoặc master không recurring
-            calendar_service.events().delete(
-                calendarId=current_calendar_id,
-                eventId=event_id
-            ).execute()
-            print(f"✅ Event deleted from {deleted_from} calendar (this mode)")
+            else:
+                # Xóa single event, instance, hoặc master không recurring
+                _delete_on_google(current_calendar_id, event_id)
+                print(f"✅ Event deleted from {deleted_from} calendar (this mode)")
+                deleted_ids = [event_id]
             
             # Xóa JSON extra
             remove_extra(event_id)
+            
+            # Mirror: bỏ các event đã xoá, poll delta lần tới để nhận instances bị huỷ
+            _record_write(current_calendar_id, event=master_result, deleted_ids=deleted_ids)
+            
+            result = {
+                "status": "deleted",
+                "from_calendar": deleted_from,
+                "delete_mode": delete_mode,
+                "master_event_id": master_event_id,
+                "is_instance": bool(master_event_id)
+            }
+            if fallback_reason is not None:
+                # Không xoá được các buổi sau -> chỉ buổi này đã bị xoá
+                result.update(delete_mode='this', fallback=True, fallback_reason=fallback_reason)
+            return result
         
-        return {
-            "status": "deleted", 
-            "from_calendar": deleted_from,
-            "delete_mode": delete_mode,
-            "master_event_id": master_event_id,
-            "is_instance": is_instance
-        }
+        with calendar_calls.tracking() as tracker:
+            result = _with_located_event(event_id, apply)
+        print(f"📊 delete_event used {tracker.count} Google calls")
+        result["google_calls"] = tracker.count
+        return result
 
     except Exception as e:
         print(f"❌ Error in delete_event: {str(e)}")
-        raise
\ No newline at end of file
+        raise
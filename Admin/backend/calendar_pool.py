@@ -0,0 +1,54 @@
+# backend/calendar_pool.py
+"""
+Gọi Google Calendar song song trên nhiều calendar (fan-out) rồi gộp kết quả.
+
+Mỗi worker thread dùng service riêng từ get_calendar_service(),
+vì calendar_service dùng chung (httplib2) không thread-safe.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from calendar_backend import get_calendar_service
+from call_scheduler import calendar_calls
+
+CALENDAR_FANOUT_WORKERS = int(os.getenv("CALENDAR_FANOUT_WORKERS", "8"))
+
+_executor = ThreadPoolExecutor(
+    max_workers=CALENDAR_FANOUT_WORKERS,
+    thread_name_prefix="calendar-fanout"
+)
+
+
+def fan_out(func, calendar_ids):
+    """
+    Chạy func(service, calendar_id) song song cho từng calendar.
+    Trả về list (calendar_id, result, error) theo đúng thứ tự calendar_ids.
+    """
+    # Lời gọi trên worker thread vẫn được đếm vào thao tác đang chạy (xem calendar_calls.tracking)
+    tracker = calendar_calls.current_tracker()
+
+    def run(calendar_id):
+        with calendar_calls.tracking(tracker):
+            return func(get_calendar_service(), calendar_id)
+
+    if len(calendar_ids) <= 1:
+        futures = None
+    else:
+        futures = [(cid, _executor.submit(run, cid)) for cid in calendar_ids]
+
+    results = []
+    if futures is None:
+        # 1 calendar: gọi luôn trên thread hiện tại, không cần qua pool
+        for calendar_id in calendar_ids:
+            try:
+                results.append((calendar_id, run(calendar_id), None))
+            except Exception as e:
+                results.append((calendar_id, None, e))
+        return results
+
+    for calendar_id, future in futures:
+        try:
+            results.append((calendar_id, future.result(), None))
+        except Exception as e:
+            results.append((calendar_id, None, e))
+    return results
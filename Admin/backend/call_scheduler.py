@@ -0,0 +1,315 @@
+# backend/call_scheduler.py
+"""
+Lập lịch mọi lời gọi Google Calendar API: token bucket + retry.
+
+Mỗi lời gọi lấy token từ bucket chung (quota theo user/service account) và
+bucket của calendar đích, nên các thao tác hàng loạt (bulk, xoá 'following',
+đổi calendar khi update) không vượt giới hạn của Google. Lỗi rate limit
+(429, 403 rateLimitExceeded) và lỗi 5xx được thử lại với backoff + jitter
+(5xx chỉ thử lại request idempotent - xem is_idempotent);
+khi bị rate limit, bucket giảm tốc độ một nửa rồi tăng dần lại khi gọi thành
+công (AIMD) - chạy ở tốc độ nhanh nhất mà Google chấp nhận.
+"""
+import json
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import unquote
+
+from googleapiclient.errors import HttpError
+
+from calendar_backend import CALENDAR_BACKEND
+
+CALENDAR_USER_QPS = float(os.getenv("CALENDAR_USER_QPS", "10"))
+CALENDAR_USER_BURST = int(os.getenv("CALENDAR_USER_BURST", "20"))
+CALENDAR_PER_CALENDAR_QPS = float(os.getenv("CALENDAR_PER_CALENDAR_QPS", "5"))
+CALENDAR_PER_CALENDAR_BURST = int(os.getenv("CALENDAR_PER_CALENDAR_BURST", "10"))
+CALENDAR_MAX_RETRIES = int(os.getenv("CALENDAR_MAX_RETRIES", "5"))
+RETRY_BASE_SECONDS = 0.5
+RETRY_MAX_SECONDS = 32.0
+# Bị rate limit: tốc độ không xuống dưới max_rate / MIN_RATE_DIVISOR
+MIN_RATE_DIVISOR = 16
+# Mỗi lần gọi thành công tăng lại 5% tốc độ tối đa
+RATE_RECOVERY_STEP = 0.05
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded'}
+CALENDAR_IN_URI = re.compile(r'/calendars/([^/?]+)/events')
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Chờ tới khi đủ token -> số giây đã chờ (batch lớn hơn burst thì 'nợ' token)"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                needed = min(tokens, self.burst)
+                if self.tokens >= needed:
+                    self.tokens -= tokens
+                    return waited
+                delay = (needed - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def throttle(self):
+        """Google báo rate limit -> giảm một nửa tốc độ, bỏ token đang có"""
+        with self._lock:
+            self.rate = max(self.rate / 2, self.max_rate / MIN_RATE_DIVISOR)
+            self.tokens = min(self.tokens, 0.0)
+
+    def recover(self):
+        if self.rate >= self.max_rate:
+            return
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * RATE_RECOVERY_STEP)
+
+
+def error_reason(error):
+    """reason đầu tiên trong body lỗi của Google (vd rateLimitExceeded), '' nếu không có"""
+    try:
+        content = error.content.decode('utf-8') if isinstance(error.content, bytes) else error.content
+        return json.loads(content)['error']['errors'][0].get('reason', '')
+    except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+        return ''
+
+
+def is_rate_limited(error):
+    status = error.resp.status
+    return status == 429 or (status == 403 and error_reason(error) in RATE_LIMIT_REASONS)
+
+
+def is_idempotent(request):
+    """
+    Gửi lại có an toàn không: GET/PUT/PATCH/DELETE luôn an toàn; POST (insert, move...) chỉ khi body
+    có id do client tạo - lần gửi lại bị 409 thay vì tạo event trùng (5xx có thể xảy ra sau khi Google đã ghi)
+    """
+    method = (getattr(request, 'method', None) or 'GET').upper()
+    if method != 'POST':
+        return True
+    try:
+        return bool(json.loads(getattr(request, 'body', None) or '{}').get('id'))
+    except (ValueError, TypeError, AttributeError):
+        return False
+
+
+def is_retryable(error, request=None):
+    """Rate limit luôn thử lại được (Google chưa thực hiện request); 5xx chỉ khi request idempotent"""
+    if not isinstance(error, HttpError):
+        return False
+    if is_rate_limited(error):
+        return True
+    return error.resp.status in RETRYABLE_STATUSES and (request is None or is_idempotent(request))
+
+
+def _calendar_of(request):
+    match = CALENDAR_IN_URI.search(getattr(request, 'uri', '') or '')
+    return unquote(match.group(1)) if match else None
+
+
+def _backoff(attempt):
+    # Full jitter: các thread bị rate limit cùng lúc không thử lại cùng lúc
+    return random.uniform(0, min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** attempt))
+
+
+class CallTracker:
+    """Đếm số lời gọi HTTP tới Google của 1 thao tác (có thể dùng chung giữa các thread fan-out)"""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def add(self, calls=1):
+        with self._lock:
+            self.count += calls
+
+
+class CallScheduler:
+    def __init__(self, max_retries=CALENDAR_MAX_RETRIES, enforce_quota=CALENDAR_BACKEND == 'google'):
+        self.max_retries = max_retries
+        # Backend memory/sqlite không có quota -> không giới hạn tốc độ (load test)
+        self.enforce_quota = enforce_quota
+        self.user_bucket = TokenBucket(CALENDAR_USER_QPS, CALENDAR_USER_BURST)
+        self._calendar_buckets = {}
+        self._lock = threading.Lock()
+        self.counters = {
+            'calls': 0,
+            'batch_items': 0,
+            'retries': 0,
+            'rate_limited': 0,
+            'errors': 0,
+            'throttled_seconds': 0.0,
+        }
+        self._local = threading.local()
+
+    @contextmanager
+    def tracking(self, tracker=None):
+        """Đếm các lời gọi Google (kể cả retry) trong khối with vào tracker của thread hiện tại"""
+        tracker = tracker or CallTracker()
+        previous = getattr(self._local, 'tracker', None)
+        self._local.tracker = tracker
+        try:
+            yield tracker
+        finally:
+            self._local.tracker = previous
+
+    def current_tracker(self):
+        return getattr(self._local, 'tracker', None)
+
+    def _track(self):
+        tracker = self.current_tracker()
+        if tracker is not None:
+            tracker.add()
+
+    def _bucket(self, calendar_id):
+        with self._lock:
+            bucket = self._calendar_buckets.get(calendar_id)
+            if bucket is None:
+                bucket = TokenBucket(CALENDAR_PER_CALENDAR_QPS, CALENDAR_PER_CALENDAR_BURST)
+                self._calendar_buckets[calendar_id] = bucket
+            return bucket
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def _acquire(self, costs):
+        """costs: {calendar_id | None: số lời gọi}"""
+        if not self.enforce_quota:
+            return
+        waited = self.user_bucket.acquire(sum(costs.values()))
+        for calendar_id, cost in costs.items():
+            if calendar_id:
+                waited += self._bucket(calendar_id).acquire(cost)
+        if waited:
+            self._count('throttled_seconds', waited)
+
+    def _on_rate_limited(self, calendar_ids):
+        self._count('rate_limited')
+        self.user_bucket.throttle()
+        for calendar_id in calendar_ids:
+            if calendar_id:
+                self._bucket(calendar_id).throttle()
+
+    def _on_success(self, calendar_ids):
+        self.user_bucket.recover()
+        for calendar_id in calendar_ids:
+            if calendar_id:
+                self._bucket(calendar_id).recover()
+
+    def execute(self, request, calendar_id=None):
+        """request.execute() qua rate limit + retry (calendar lấy từ URI nếu không truyền)"""
+        calendar_id = calendar_id or _calendar_of(request)
+        attempt = 0
+        while True:
+            self._acquire({calendar_id: 1})
+            self._count('calls')
+            self._track()
+            try:
+                result = request.execute()
+            except HttpError as e:
+                if is_rate_limited(e):
+                    self._on_rate_limited([calendar_id])
+                if not is_retryable(e, request) or attempt >= self.max_retries:
+                    self._count('errors')
+                    raise
+                delay = _backoff(attempt)
+                attempt += 1
+                self._count('retries')
+                print(f"🔁 Calendar API {e.resp.status} ({error_reason(e) or 'error'}), "
+                      f"retry {attempt}/{self.max_retries} in {delay:.2f}s")
+                time.sleep(delay)
+                continue
+            self._on_success([calendar_id])
+            return result
+
+    def execute_batch(self, service, requests, batch_limit, retried=None):
+        """
+        Gửi (request_id, request) theo lô batch_limit; item lỗi tạm thời (429/403 rate limit/5xx)
+        được gửi lại ở lô sau với backoff -> {request_id: (response, error)}
+        Không raise: cả lô lỗi thì mọi item của lô nhận lỗi đó, các lô trước vẫn giữ kết quả
+        (caller còn lưu được dữ liệu cho những event đã tạo)
+        retried: set nhận request_id đã được gửi lại sau lỗi 5xx - lần gửi trước có thể đã được Google thực hiện
+        """
+        results = {}
+        pending = list(requests)
+        attempt = 0
+        while pending:
+            retry = []
+            for start in range(0, len(pending), batch_limit):
+                chunk = pending[start:start + batch_limit]
+                chunk_results = {}
+
+                def callback(request_id, response, exception):
+                    chunk_results[request_id] = (response, exception)
+
+                costs = {}
+                for _, request in chunk:
+                    calendar_id = _calendar_of(request)
+                    costs[calendar_id] = costs.get(calendar_id, 0) + 1
+                self._acquire(costs)
+                self._count('calls')
+                self._track()
+                self._count('batch_items', len(chunk))
+
+                batch = service.new_batch_http_request(callback=callback)
+                for request_id, request in chunk:
+                    batch.add(request, request_id=request_id)
+                try:
+                    batch.execute()
+                except Exception as e:
+                    # Cả lô lỗi (vd 503, mất kết nối) -> từng item tự quyết định thử lại hay báo lỗi bên dưới
+                    print(f"❌ Batch failed: {e}")
+                    chunk_results = {request_id: (None, e) for request_id, _ in chunk}
+                print(f"📦 Batch executed: {len(chunk)} requests")
+
+                rate_limited = set()
+                for request_id, request in chunk:
+                    response, error = chunk_results.get(request_id, (None, RuntimeError("No batch response")))
+                    if error is not None and is_retryable(error, request) and attempt < self.max_retries:
+                        if is_rate_limited(error):
+                            rate_limited.add(_calendar_of(request))
+                        elif retried is not None:
+                            retried.add(request_id)
+                        retry.append((request_id, request))
+                        continue
+                    if error is not None:
+                        self._count('errors')
+                    results[request_id] = (response, error)
+                if rate_limited:
+                    self._on_rate_limited(rate_limited)
+                else:
+                    self._on_success(costs)
+            if retry:
+                delay = _backoff(attempt)
+                attempt += 1
+                self._count('retries', len(retry))
+                print(f"🔁 Retrying {len(retry)} batch items in {delay:.2f}s ({attempt}/{self.max_retries})")
+                time.sleep(delay)
+            pending = retry
+        return results
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters, throttled_seconds=round(self.counters['throttled_seconds'], 2))
+            stats['user_rate'] = round(self.user_bucket.rate, 2)
+            stats['calendar_rates'] = {
+                calendar_id[:12]: round(bucket.rate, 2) for calendar_id, bucket in self._calendar_buckets.items()
+            }
+        return stats
+
+
+calendar_calls = CallScheduler()
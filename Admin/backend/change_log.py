@@ -0,0 +1,161 @@
+# backend/change_log.py
+"""
+Nhật ký thay đổi có version tăng dần cho client đồng bộ lịch theo delta.
+
+Mọi thay đổi của mirror (create/update/delete qua API, delta sync từ Google)
+đi qua listener của event_mirror và được ghi thành (version, event_id, calendar_id).
+Log chỉ giữ id - nội dung hiện tại đọc lại từ mirror khi client hỏi, nên 1 event
+sửa nhiều lần chỉ trả về 1 lần với trạng thái mới nhất.
+
+Thay đổi hàng loạt của 1 calendar (full sync, expand lại mọi lớp lặp lại hằng ngày)
+không ghi từng event mà chỉ đánh dấu reset cho calendar đó: client có token cũ hơn
+và đang xem calendar đó phải tải lại /classes.
+
+Version token có dạng '<epoch>.<version>': epoch đổi mỗi lần khởi động API,
+token của tiến trình cũ hoặc đã rơi khỏi log (CALENDAR_CHANGE_LOG_SIZE) -> client
+phải tải lại toàn bộ /classes (reset).
+
+Client SSE (/classes/stream) đăng ký ChangeSubscription: mỗi thay đổi chỉ bật cờ
+đánh thức của client, nội dung được lấy lại từ log theo token của client đó - client
+chậm không làm đầy bộ nhớ, lần gửi sau chỉ gộp nhiều thay đổi hơn.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+
+from event_mirror import add_change_listener
+
+CALENDAR_CHANGE_LOG_SIZE = int(os.getenv("CALENDAR_CHANGE_LOG_SIZE", "20000"))
+CALENDAR_STREAM_MAX_CLIENTS = int(os.getenv("CALENDAR_STREAM_MAX_CLIENTS", "200"))
+# Không có thay đổi: sau N giây client SSE vẫn poll mirror (thay đổi trực tiếp trên Google) + gửi ping giữ kết nối
+CALENDAR_STREAM_HEARTBEAT_SECONDS = float(os.getenv("CALENDAR_STREAM_HEARTBEAT_SECONDS", "15"))
+
+
+class TooManySubscribersError(Exception):
+    pass
+
+
+class ChangeSubscription:
+    """
+    1 client SSE: cờ 'có thay đổi' gộp mọi thông báo chưa xử lý (hàng đợi tối đa 1 phần tử)
+    Được bật từ thread bất kỳ (listener của mirror), chờ trên event loop của route
+    """
+
+    def __init__(self, loop):
+        self._loop = loop
+        self._changed = asyncio.Event()
+
+    def notify(self):
+        try:
+            self._loop.call_soon_threadsafe(self._changed.set)
+        except RuntimeError:
+            # Event loop đã đóng (server đang tắt)
+            pass
+
+    async def wait(self, timeout):
+        """Chờ thay đổi tối đa timeout giây -> True nếu có thay đổi"""
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            # Thay đổi tới sau lúc này sẽ đánh thức lần chờ sau; thay đổi tới trước đã nằm trong log
+            self._changed.clear()
+
+
+class ChangeLog:
+    def __init__(self, max_entries=CALENDAR_CHANGE_LOG_SIZE):
+        self.epoch = format(time.time_ns(), 'x')
+        self.version = 0
+        # (version, event_id, calendar_id) theo thứ tự version
+        self._entries = deque(maxlen=max_entries)
+        # calendar_id -> version của lần reset gần nhất (full sync / expand lại toàn bộ)
+        self._reset_versions = {}
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self.max_subscribers = CALENDAR_STREAM_MAX_CLIENTS
+        self.resets = 0
+
+    def record(self, calendar_id, upserted, removed_ids, reset=False):
+        """
+        Listener của mirror: mỗi event thay đổi nhận 1 version mới, đánh thức các client SSE
+        reset=True: chỉ 1 version đánh dấu calendar cần tải lại, không ghi từng event
+        """
+        with self._lock:
+            if reset:
+                self.version += 1
+                self._reset_versions[calendar_id] = self.version
+            else:
+                for event_id in [r.id for r in upserted] + list(removed_ids):
+                    self.version += 1
+                    self._entries.append((self.version, event_id, calendar_id))
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.notify()
+
+    def subscribe(self, loop):
+        """Đăng ký 1 client SSE (raise TooManySubscribersError khi đã đủ CALENDAR_STREAM_MAX_CLIENTS)"""
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise TooManySubscribersError(f"Too many change stream clients ({self.max_subscribers})")
+            subscription = ChangeSubscription(loop)
+            self._subscribers.add(subscription)
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def token(self, version=None):
+        """Version token hiện tại (hoặc của version cho trước)"""
+        with self._lock:
+            return f"{self.epoch}.{self.version if version is None else version}"
+
+    def _parse(self, token):
+        """Token -> version, None nếu sai định dạng hoặc của lần khởi động khác"""
+        epoch, _, version = (token or '').partition('.')
+        if epoch != self.epoch or not version.isdigit():
+            return None
+        version = int(version)
+        return version if version <= self.version else None
+
+    def changed_since(self, token, calendar_ids=None):
+        """
+        -> (id các event đã đổi sau token trong calendar_ids (None = mọi calendar) theo thứ tự thay đổi, token mới)
+        ids là None khi token không dùng được nữa (client phải tải lại toàn bộ)
+        """
+        with self._lock:
+            since = self._parse(token)
+            oldest = self._entries[0][0] if self._entries else self.version + 1
+            reset_at = max(
+                (v for c, v in self._reset_versions.items() if calendar_ids is None or c in calendar_ids), default=0
+            )
+            # Log đã bỏ bớt entry sau since, hoặc calendar đã reset sau since -> không biết đủ các thay đổi
+            if since is None or (since < self.version and since + 1 < oldest) or reset_at > since:
+                self.resets += 1
+                return None, f"{self.epoch}.{self.version}"
+            changed = {}
+            for version, event_id, calendar_id in reversed(self._entries):
+                if version <= since:
+                    break
+                if calendar_ids is None or calendar_id in calendar_ids:
+                    changed.setdefault(event_id, version)
+            ids = sorted(changed, key=changed.get)
+            return ids, f"{self.epoch}.{self.version}"
+
+    def stats(self):
+        with self._lock:
+            return {
+                'version': self.version,
+                'entries': len(self._entries),
+                'oldest_version': self._entries[0][0] if self._entries else None,
+                'resets': self.resets,
+                'stream_clients': len(self._subscribers)
+            }
+
+
+change_log = ChangeLog()
+add_change_listener(change_log.record)
@@ -0,0 +1,104 @@
+# backend/circuit_breaker.py
+"""
+Circuit breaker cho từng calendar.
+
+Sau CALENDAR_BREAKER_FAILURES lỗi liên tiếp, breaker "mở": các lần đọc sau
+không gọi Google nữa (dùng snapshot cũ nếu có) trong CALENDAR_BREAKER_RESET_SECONDS
+giây. Hết thời gian đó chỉ cho 1 lời gọi thử (half-open): thành công thì đóng
+lại, lỗi thì mở tiếp.
+"""
+import os
+import threading
+import time
+
+CALENDAR_BREAKER_FAILURES = int(os.getenv("CALENDAR_BREAKER_FAILURES", "3"))
+CALENDAR_BREAKER_RESET_SECONDS = float(os.getenv("CALENDAR_BREAKER_RESET_SECONDS", "30"))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Breaker đang mở - không gọi upstream"""
+
+
+class CalendarUnavailableError(Exception):
+    """Không đọc được calendar và cũng không có snapshot nào để trả về"""
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=CALENDAR_BREAKER_FAILURES,
+                 reset_seconds=CALENDAR_BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.last_error = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpenError nếu chưa được gọi upstream"""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return
+            raise CircuitOpenError(f"Circuit open for {self.name}: {self.last_error}")
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                print(f"🟢 Circuit closed for {self.name}")
+            self.state = CLOSED
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self, error):
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error)
+            self._trial_running = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    print(f"🔴 Circuit opened for {self.name} after {self.failures} failures: {error}")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def call(self, func, *args, **kwargs):
+        self.before_call()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        self.record_success()
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {'state': self.state, 'failures': self.failures, 'last_error': self.last_error}
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name):
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(name)
+            _breakers[name] = breaker
+        return breaker
+
+
+def breaker_stats():
+    with _breakers_lock:
+        return {name: breaker.stats() for name, breaker in _breakers.items()}
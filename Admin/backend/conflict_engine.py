@@ -0,0 +1,226 @@
+# backend/conflict_engine.py
+"""
+Chỉ mục khoảng thời gian theo giáo viên cho kiểm tra xung đột lịch.
+
+Mỗi giáo viên (tên đã chuẩn hoá) có danh sách khoảng [start, end) tính bằng
+UTC epoch seconds (EventRecord đã parse sẵn), sort theo start. Tìm xung đột bằng bisect: O(log n + k),
+cập nhật từng event khi tạo/sửa/xoá thay vì quét lại toàn bộ lịch.
+"""
+import bisect
+import math
+import threading
+
+from schedule_utils import normalize_teacher_name, parse_iso_datetime_flexible
+from event_record import as_record
+
+
+def to_conflict(record):
+    """EventRecord -> định dạng conflict giống traditional_conflict_check"""
+    return {
+        'event_summary': record.summary,
+        'event_teacher': record.teacher_name,
+        'event_start': record.start_str,
+        'event_end': record.end_str,
+        'conflict_type': 'teacher_schedule_conflict',
+        'timezone_note': "Conflict detected in UTC time (same actual time)"
+    }
+
+
+class _TeacherIntervals:
+    """Các EventRecord của 1 giáo viên: starts (sort) + intervals song song"""
+    __slots__ = ('starts', 'intervals', 'max_duration')
+
+    def __init__(self):
+        self.starts = []
+        self.intervals = []
+        # Thời lượng dài nhất, dùng làm cận dưới khi bisect (tính lại khi xoá khoảng dài nhất)
+        self.max_duration = 0.0
+
+    def add(self, record):
+        i = bisect.bisect_right(self.starts, record.start_ts)
+        self.starts.insert(i, record.start_ts)
+        self.intervals.insert(i, record)
+        self.max_duration = max(self.max_duration, record.end_ts - record.start_ts)
+
+    def remove(self, event_id, start):
+        i = bisect.bisect_left(self.starts, start)
+        while i < len(self.starts) and self.starts[i] == start:
+            if self.intervals[i].id == event_id:
+                removed = self.intervals[i]
+                del self.starts[i]
+                del self.intervals[i]
+                if removed.end_ts - removed.start_ts >= self.max_duration:
+                    self.max_duration = max((r.end_ts - r.start_ts for r in self.intervals), default=0.0)
+                return True
+            i += 1
+        return False
+
+    def overlapping(self, start, end):
+        """Các khoảng giao với [start, end) - theo thứ tự thời gian"""
+        lo = bisect.bisect_left(self.starts, start - self.max_duration)
+        hi = bisect.bisect_left(self.starts, end)
+        return [r for r in self.intervals[lo:hi] if r.end_ts > start]
+
+    def overlapping_sweep(self, ranges):
+        """
+        Quét 1 lượt cho nhiều khoảng [start, end) đã sort theo start:
+        2 con trỏ chỉ tiến, tổng chi phí O(len(ranges) + len(intervals) + k)
+        hi chỉ tiến theo end lớn nhất đã gặp -> khoảng ngắn sau khoảng dài phải lọc lại theo end
+        """
+        results = []
+        lo = hi = 0
+        count = len(self.starts)
+        for start, end in ranges:
+            while lo < count and self.starts[lo] < start - self.max_duration:
+                lo += 1
+            hi = max(hi, lo)
+            while hi < count and self.starts[hi] < end:
+                hi += 1
+            results.append([r for r in self.intervals[lo:hi] if r.end_ts > start and r.start_ts < end])
+        return results
+
+
+class TeacherIntervalIndex:
+    def __init__(self):
+        self._by_teacher = {}
+        # event_id -> (teacher chuẩn hoá, start) để xoá/cập nhật
+        self._locations = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_events(cls, events, only_teacher=None):
+        """Build chỉ mục từ danh sách events (only_teacher: chỉ giữ 1 giáo viên đã chuẩn hoá)"""
+        index = cls()
+        for event in events:
+            record = as_record(event)
+            if only_teacher is not None and record.teacher != only_teacher:
+                continue
+            index.upsert(record)
+        return index
+
+    def __len__(self):
+        return len(self._locations)
+
+    def upsert(self, event):
+        """Thêm/cập nhật 1 event (EventRecord hoặc dict Google; master recurring và event huỷ bị bỏ qua)"""
+        record = as_record(event)
+        with self._lock:
+            if record.id is not None:
+                self._remove_locked(record.id)
+            if not record.is_visible:
+                return  # Master event chỉ là template, instances được index riêng
+            if not record.teacher_name or not record.timed or record.start_ts == math.inf:
+                return
+            self._by_teacher.setdefault(record.teacher, _TeacherIntervals()).add(record)
+            if record.id is not None:
+                self._locations[record.id] = (record.teacher, record.start_ts)
+
+    def remove(self, event_id):
+        with self._lock:
+            self._remove_locked(event_id)
+
+    def _remove_locked(self, event_id):
+        location = self._locations.pop(event_id, None)
+        if location is None:
+            return
+        teacher, start = location
+        intervals = self._by_teacher.get(teacher)
+        if intervals is not None:
+            intervals.remove(event_id, start)
+
+    def find_overlaps(self, teacher, start_ts, end_ts, exclude_event_id=None):
+        """Các EventRecord của giáo viên giao với [start_ts, end_ts)"""
+        with self._lock:
+            intervals = self._by_teacher.get(normalize_teacher_name(teacher))
+            if intervals is None:
+                return []
+            return [
+                r for r in intervals.overlapping(start_ts, end_ts)
+                if not _is_excluded(r, exclude_event_id)
+            ]
+
+    def find_series_overlaps(self, teacher, ranges, exclude_event_id=None):
+        """Với mỗi khoảng (đã sort theo start) -> các EventRecord của giáo viên giao với nó"""
+        with self._lock:
+            intervals = self._by_teacher.get(normalize_teacher_name(teacher))
+            if intervals is None:
+                return [[] for _ in ranges]
+            return [
+                [r for r in overlaps if not _is_excluded(r, exclude_event_id)]
+                for overlaps in intervals.overlapping_sweep(ranges)
+            ]
+
+    def check(self, teacher, new_start, new_end, exclude_event_id=None):
+        """Kiểm tra xung đột - cùng định dạng kết quả với traditional_conflict_check"""
+        try:
+            new_start_dt = parse_iso_datetime_flexible(new_start)
+            new_end_dt = parse_iso_datetime_flexible(new_end)
+
+            if not new_start_dt or not new_end_dt:
+                print(f"❌ Invalid datetime: new_start={new_start}, new_end={new_end}")
+                return {'has_conflict': False, 'error': 'Invalid datetime format'}
+
+            overlaps = self.find_overlaps(
+                teacher, new_start_dt.timestamp(), new_end_dt.timestamp(), exclude_event_id
+            )
+            conflicts = [to_conflict(r) for r in overlaps]
+
+            print(f"⚡ Indexed conflict check for '{teacher}': {len(conflicts)} conflicts")
+
+            return {
+                'has_conflict': len(conflicts) > 0,
+                'conflicts': conflicts,
+                'conflict_count': len(conflicts),
+                'ai_analysis': f'Kiểm tra nhanh: {len(conflicts)} xung đột' if conflicts else 'Không có xung đột'
+            }
+        except Exception as e:
+            print(f"❌ Indexed conflict check error: {e}")
+            return {'has_conflict': False, 'error': str(e)}
+
+    def check_series(self, teacher, occurrences, exclude_event_id=None):
+        """
+        Kiểm tra xung đột cho mọi buổi của 1 lớp lặp lại đề xuất
+        occurrences: [(start, end)] datetime có tz - trả về từng buổi bị trùng
+        """
+        try:
+            ordered = sorted(occurrences, key=lambda o: o[0])
+            ranges = [(start.timestamp(), end.timestamp()) for start, end in ordered]
+            overlaps = self.find_series_overlaps(teacher, ranges, exclude_event_id)
+
+            conflicting_occurrences = []
+            conflicts = []
+            for index, ((start, end), records) in enumerate(zip(ordered, overlaps)):
+                if not records:
+                    continue
+                occurrence_conflicts = [to_conflict(r) for r in records]
+                conflicting_occurrences.append({
+                    'occurrence_index': index,
+                    'occurrence_start': start.isoformat(),
+                    'occurrence_end': end.isoformat(),
+                    'conflicts': occurrence_conflicts
+                })
+                for conflict in occurrence_conflicts:
+                    conflicts.append(dict(conflict, occurrence_start=start.isoformat(), occurrence_end=end.isoformat()))
+
+            print(f"⚡ Series conflict check for '{teacher}': {len(ordered)} occurrences, "
+                  f"{len(conflicting_occurrences)} conflicting")
+
+            return {
+                'has_conflict': len(conflicts) > 0,
+                'conflicts': conflicts,
+                'conflict_count': len(conflicts),
+                'occurrence_count': len(ordered),
+                'conflicting_occurrences': conflicting_occurrences,
+                'ai_analysis': (
+                    f'Kiểm tra nhanh: {len(conflicting_occurrences)}/{len(ordered)} buổi bị trùng lịch'
+                    if conflicts else f'Không có xung đột trong {len(ordered)} buổi'
+                )
+            }
+        except Exception as e:
+            print(f"❌ Series conflict check error: {e}")
+            return {'has_conflict': False, 'error': str(e)}
+
+
+def _is_excluded(record, exclude_event_id):
+    """Bỏ qua event đang sửa - với lớp lặp lại thì bỏ cả các instance của nó"""
+    return bool(exclude_event_id) and exclude_event_id in (record.id, record.master_id)
@@ -0,0 +1,55 @@
+# backend/event_locator.py
+"""
+Chỉ mục event_id -> calendar_id.
+
+Giúp get/update/delete gọi thẳng đúng calendar thay vì thử lần lượt cả 2.
+Được nạp từ: event vừa tạo, dữ liệu sync của mirror và extra data (calendar_id).
+"""
+import re
+import threading
+
+# Instance của recurring event có id dạng: <master_id>_YYYYMMDDTHHMMSSZ (hoặc _YYYYMMDD nếu cả ngày)
+INSTANCE_ID_PATTERN = re.compile(r'^(.+)_\d{8}(T\d{6}Z?)?$')
+
+
+class EventLocationIndex:
+    def __init__(self):
+        self._locations = {}
+        self._lock = threading.Lock()
+
+    def remember(self, event_id, calendar_id):
+        if event_id and calendar_id:
+            with self._lock:
+                self._locations[event_id] = calendar_id
+
+    def remember_many(self, pairs):
+        with self._lock:
+            for event_id, calendar_id in pairs:
+                if event_id and calendar_id:
+                    self._locations[event_id] = calendar_id
+
+    def forget(self, event_id):
+        with self._lock:
+            self._locations.pop(event_id, None)
+
+    def forget_many(self, event_ids):
+        with self._lock:
+            for event_id in event_ids:
+                self._locations.pop(event_id, None)
+
+    def lookup(self, event_id):
+        """calendar_id của event (instance thì dùng calendar của master), None nếu chưa biết"""
+        with self._lock:
+            calendar_id = self._locations.get(event_id)
+            if calendar_id:
+                return calendar_id
+            match = INSTANCE_ID_PATTERN.match(event_id or '')
+            if match:
+                return self._locations.get(match.group(1))
+            return None
+
+    def __len__(self):
+        return len(self._locations)
+
+
+location_index = EventLocationIndex()
@@ -0,0 +1,443 @@
+# backend/event_mirror.py
+"""
+Bản sao cục bộ (mirror) của các Google Calendar.
+
+Đồng bộ đầy đủ một lần, sau đó chỉ lấy phần thay đổi bằng `syncToken`,
+để list_events đọc từ bộ nhớ thay vì tải lại toàn bộ calendar mỗi request.
+
+Mặc định (CALENDAR_MIRROR_EXPANSION=local) chỉ tải master + exception
+(singleEvents=False) rồi tự sinh instances bằng recurrence_engine, thay vì
+tải từng buổi học của mọi lớp lặp lại từ Google.
+"""
+import copy
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from googleapiclient.errors import HttpError
+from calendar_backend import get_calendar_service
+from circuit_breaker import get_breaker, CalendarUnavailableError
+from call_scheduler import calendar_calls
+from event_record import EventRecord
+from recurrence_engine import materialize_instances
+
+# Bật/tắt mirror bằng biến môi trường (CALENDAR_MIRROR=0 để gọi Google trực tiếp)
+MIRROR_ENABLED = os.getenv("CALENDAR_MIRROR", "1") != "0"
+# Khoảng thời gian tối thiểu giữa 2 lần poll delta (giây)
+MIRROR_POLL_SECONDS = float(os.getenv("CALENDAR_MIRROR_POLL_SECONDS", "15"))
+PAGE_SIZE = 2500
+# local: tự expand recurring từ master + exceptions | google: để Google expand (singleEvents=True)
+MIRROR_EXPANSION = os.getenv("CALENDAR_MIRROR_EXPANSION", "local").lower()
+# Expand lại các rule không giới hạn (không COUNT/UNTIL) mỗi ngày để đẩy horizon
+HORIZON_REFRESH_SECONDS = 24 * 3600
+# Quá poll interval nhưng chưa quá N giây: trả snapshot ngay (stale), poll delta ở nền
+# Quá N giây: poll ngay trong request; lỗi -> báo calendar không khả dụng
+MIRROR_STALE_SECONDS = float(os.getenv("CALENDAR_MIRROR_STALE_SECONDS", "300"))
+
+_revalidate_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="mirror-revalidate")
+
+
+class CalendarMirror:
+    """Mirror của một calendar: EventRecord theo id + syncToken cho lần poll tiếp theo"""
+
+    def __init__(self, calendar_id, calendar_type, poll_interval=MIRROR_POLL_SECONDS,
+                 expand_locally=(MIRROR_EXPANSION == "local")):
+        self.calendar_id = calendar_id
+        self.calendar_type = calendar_type
+        self.poll_interval = poll_interval
+        self.expand_locally = expand_locally
+        # events: các buổi hiển thị (event thường + instances), không gồm master
+        self.events = {}
+        # Chỉ dùng khi expand_locally: master (dict Google), exception theo master, instance -> master
+        self.masters = {}
+        self.exceptions = {}
+        self._exceptions_by_master = {}
+        self._instances_by_master = {}
+        self._master_by_instance = {}
+        self._materialized_at = 0.0
+        self.sync_token = None
+        self.last_sync = 0.0
+        self.version = 0
+        self._dirty = True
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        # Số lần ghi trực tiếp (apply_write/apply_delete) - phát hiện ghi xen giữa lúc đang gọi Google
+        self._writes = 0
+        self._sorted = None
+        self._sorted_version = -1
+        self._breaker = get_breaker(calendar_type)
+
+    @property
+    def is_ready(self):
+        return self.sync_token is not None
+
+    @property
+    def age_seconds(self):
+        return time.monotonic() - self.last_sync if self.is_ready else None
+
+    def mark_dirty(self):
+        """Buộc lần đọc tiếp theo phải poll delta (sau khi ghi lên Google)"""
+        self._dirty = True
+
+    def refresh(self, force=False):
+        """
+        Full sync lần đầu, các lần sau chỉ poll delta bằng syncToken
+        Chỉ giữ self._lock khi áp kết quả: lời gọi Google (retry + backoff của call scheduler, có thể tới
+        hàng chục giây) chạy ngoài lock nên snapshot()/ghi trực tiếp không bị chặn; _sync_lock để mỗi lúc 1 lần sync
+        """
+        with self._sync_lock:
+            self._refresh_locked(force)
+
+    def _refresh_locked(self, force=False):
+        """refresh() khi đã giữ _sync_lock"""
+        with self._lock:
+            is_fresh = (time.monotonic() - self.last_sync) < self.poll_interval
+            if self.is_ready and is_fresh and not self._dirty and not force:
+                return
+            sync_token = self.sync_token
+            writes = self._writes
+
+        # Breaker mở -> không gọi Google (CircuitOpenError), caller dùng snapshot hiện có
+        self._breaker.before_call()
+        started = time.monotonic()
+        try:
+            if sync_token is None:
+                full, (items, next_token) = True, self._fetch_all(showDeleted=False)
+            else:
+                try:
+                    full, (items, next_token) = False, self._fetch_all(syncToken=sync_token)
+                except HttpError as e:
+                    if e.resp.status != 410:
+                        raise
+                    # syncToken hết hạn -> Google yêu cầu full sync lại
+                    print(f"⚠️ Sync token expired for {self.calendar_type.upper()}, doing full sync")
+                    full, (items, next_token) = True, self._fetch_all(showDeleted=False)
+        except Exception as e:
+            self._breaker.record_failure(e)
+            raise
+        self._breaker.record_success()
+
+        with self._lock:
+            if full:
+                changes = self._full_sync(items, next_token, started)
+            else:
+                changes = self._delta_sync(items, next_token)
+            if self._writes != writes:
+                # Có ghi trực tiếp trong lúc gọi Google: kết quả vừa áp có thể cũ hơn -> lần đọc sau poll lại
+                self._dirty = True
+            reset = full
+            if self.expand_locally and time.monotonic() - self._materialized_at > HORIZON_REFRESH_SECONDS:
+                changes = _merge_changes(changes, self._rematerialize_all())
+                reset = True
+
+        # Báo cho listeners ngoài self._lock để listener có thể đọc lại mirror
+        _notify_listeners(self, *changes, reset=reset)
+
+    def read(self):
+        """
+        Chuẩn bị mirror để đọc (stale-while-revalidate) -> thông tin độ mới của dữ liệu
+        - còn trong poll interval: dùng luôn
+        - quá poll interval nhưng chưa quá MIRROR_STALE_SECONDS (và không có ghi mới): dùng snapshot, poll ở nền
+          (Google chậm không làm request chờ hết lượt retry của call scheduler)
+        - còn lại: poll ngay; lỗi hoặc breaker mở -> dùng snapshot cũ (stale) nếu chưa quá MIRROR_STALE_SECONDS
+        Raise CalendarUnavailableError khi chưa từng sync được hoặc snapshot đã quá cũ
+        """
+        if self.is_ready and not self._dirty:
+            age = self.age_seconds
+            if age < self.poll_interval:
+                return self._freshness(False)
+            if age < MIRROR_STALE_SECONDS:
+                self._revalidate_in_background()
+                return self._freshness(True)
+        try:
+            self.refresh()
+        except Exception as e:
+            if not self.is_ready:
+                raise CalendarUnavailableError(f"Calendar {self.calendar_type.upper()} unavailable: {e}") from e
+            if self.age_seconds >= MIRROR_STALE_SECONDS:
+                raise CalendarUnavailableError(
+                    f"Calendar {self.calendar_type.upper()} unavailable for {self.age_seconds:.0f}s: {e}"
+                ) from e
+            print(f"⚠️ Serving stale {self.calendar_type.upper()} snapshot ({self.age_seconds:.0f}s old): {e}")
+            return self._freshness(True, error=str(e))
+        return self._freshness(False)
+
+    def _revalidate_in_background(self):
+        """Poll delta trên thread nền - bỏ qua nếu đang có lần sync khác (single-flight theo _sync_lock)"""
+        if not self._sync_lock.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self._refresh_locked()
+            except Exception as e:
+                print(f"⚠️ Background refresh failed for {self.calendar_type.upper()}: {e}")
+            finally:
+                self._sync_lock.release()
+
+        try:
+            _revalidate_executor.submit(run)
+        except RuntimeError:
+            # Executor đã tắt (server đang dừng)
+            self._sync_lock.release()
+
+    def _freshness(self, stale, error=None):
+        info = {
+            'calendar': self.calendar_type,
+            'source': 'mirror',
+            'age_seconds': round(self.age_seconds, 1),
+            'stale': stale
+        }
+        if error:
+            info['error'] = error
+        return info
+
+    def snapshot(self):
+        """Danh sách EventRecord hiện có trong mirror (không gồm event đã huỷ)"""
+        with self._lock:
+            return list(self.events.values())
+
+    def sorted_index(self):
+        """
+        (records sort theo start, list start_ts tương ứng, thời lượng dài nhất)
+        để tìm theo khoảng thời gian bằng bisect - cache theo version (không được sửa các list này)
+        """
+        with self._lock:
+            if self._sorted is None or self._sorted_version != self.version:
+                records = sorted(self.events.values(), key=_start_key)
+                starts = [r.start_ts for r in records]
+                durations = [r.end_ts - r.start_ts for r in records if r.timed]
+                self._sorted = (records, starts, max(durations, default=0.0))
+                self._sorted_version = self.version
+            return self._sorted
+
+    def get(self, event_id):
+        """EventRecord đang hiển thị theo id (None nếu không có / đã xoá)"""
+        with self._lock:
+            return self.events.get(event_id)
+
+    def get_master(self, master_id):
+        """Master event (dict Google) nếu mirror đang giữ - chỉ có khi expand_locally"""
+        with self._lock:
+            return self.masters.get(master_id)
+
+    def local_copy(self, event_id):
+        """
+        Bản sao dict Google của event/master khi mirror còn mới (trong poll interval) - để khỏi gọi lại Google
+        None nếu mirror không có hoặc đã cũ
+        """
+        with self._lock:
+            if not self.is_ready or time.monotonic() - self.last_sync >= self.poll_interval:
+                return None
+            item = self.masters.get(event_id)
+            if item is None:
+                record = self.events.get(event_id)
+                item = record.raw if record is not None else None
+            return copy.deepcopy(item) if item is not None else None
+
+    def apply_write(self, event):
+        """Ghi ngay kết quả insert/update vào mirror, không cần chờ poll"""
+        with self._lock:
+            changes = self._apply_item(event)
+            self.version += 1
+            self._writes += 1
+            self._dirty = True
+        _notify_listeners(self, *changes)
+
+    def apply_delete(self, event_id):
+        with self._lock:
+            if self.expand_locally and event_id in self.masters:
+                changes = self._apply_item({'id': event_id, 'status': 'cancelled'})
+            elif self.expand_locally and event_id in self._master_by_instance:
+                # Xoá 1 buổi của lớp lặp lại = exception bị huỷ
+                changes = self._apply_item({
+                    'id': event_id, 'status': 'cancelled',
+                    'recurringEventId': self._master_by_instance[event_id]
+                })
+            else:
+                removed = self.events.pop(event_id, None)
+                changes = ([], [event_id] if removed is not None else [])
+            self.version += 1
+            self._writes += 1
+            self._dirty = True
+        _notify_listeners(self, *changes)
+
+    # ---------------- Sync helpers ----------------
+    def _to_record(self, item):
+        """Parse 1 lần khi nhận từ Google"""
+        return EventRecord.from_google(item, self.calendar_id, self.calendar_type)
+
+    def _apply_item(self, item):
+        """Áp 1 item Google vào mirror (gọi khi đang giữ lock), trả về (records mới/đổi, id đã bị xoá)"""
+        item_id = item.get('id')
+        cancelled = item.get('status') == 'cancelled'
+
+        if self.expand_locally:
+            master_id = item.get('recurringEventId')
+            if item.get('recurrence') or item_id in self.masters:
+                # Master: lưu template rồi sinh lại các instances
+                if cancelled:
+                    self.masters.pop(item_id, None)
+                    for exception_id in self._exceptions_by_master.pop(item_id, set()):
+                        self.exceptions.pop(exception_id, None)
+                else:
+                    self.masters[item_id] = item
+                return self._rematerialize(item_id)
+            if master_id:
+                # Exception (buổi bị sửa/huỷ) thay cho instance tự sinh cùng id
+                self.exceptions[item_id] = item
+                self._exceptions_by_master.setdefault(master_id, set()).add(item_id)
+                if master_id in self.masters:
+                    return self._rematerialize(master_id)
+
+        if cancelled:
+            removed = self.events.pop(item_id, None)
+            return [], [item_id] if removed is not None else []
+        record = self._to_record(item)
+        self.events[record.id] = record
+        return [record], []
+
+    def _rematerialize(self, master_id):
+        """Sinh lại instances của 1 master (áp exceptions), trả về (records mới/đổi, id đã bị xoá)"""
+        old_ids = self._instances_by_master.pop(master_id, set())
+        master = self.masters.get(master_id)
+        exception_ids = self._exceptions_by_master.get(master_id, set())
+
+        instances = {}
+        if master is not None:
+            try:
+                generated = materialize_instances(master)
+            except Exception as e:
+                # 1 RRULE lỗi/không expand được không được làm hỏng sync cả calendar:
+                # giữ master (lần sau master đổi sẽ expand lại), chỉ còn các exception của nó
+                print(f"⚠️ Cannot expand master {master_id} {master.get('recurrence')}: {e}")
+                generated = []
+            for instance in generated:
+                instances[instance['id']] = instance
+            for exception_id in exception_ids:
+                # Exception nằm ngoài horizon/đã dời giờ vẫn được giữ
+                instances[exception_id] = self.exceptions[exception_id]
+
+        upserted = []
+        for instance_id, instance in instances.items():
+            if instance.get('status') == 'cancelled':
+                continue
+            record = self._to_record(instance)
+            self.events[instance_id] = record
+            upserted.append(record)
+        new_ids = {r.id for r in upserted}
+        removed = []
+        for instance_id in old_ids - new_ids:
+            self._master_by_instance.pop(instance_id, None)
+            if self.events.pop(instance_id, None) is not None:
+                removed.append(instance_id)
+        if new_ids:
+            self._instances_by_master[master_id] = new_ids
+            self._master_by_instance.update(dict.fromkeys(new_ids, master_id))
+        return upserted, removed
+
+    def _rematerialize_all(self):
+        changes = ([], [])
+        for master_id in list(self.masters):
+            changes = _merge_changes(changes, self._rematerialize(master_id))
+        self._materialized_at = time.monotonic()
+        if self.masters:
+            self.version += 1
+        return changes
+
+    def _fetch_all(self, **params):
+        """Đi hết các trang kết quả, trả về (items, nextSyncToken)"""
+        items = []
+        page_token = None
+        while True:
+            result = calendar_calls.execute(get_calendar_service().events().list(
+                calendarId=self.calendar_id,
+                singleEvents=not self.expand_locally,
+                maxResults=PAGE_SIZE,
+                pageToken=page_token,
+                **params
+            ))
+            items.extend(result.get('items', []))
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                return items, result.get('nextSyncToken')
+
+    def _full_sync(self, items, sync_token, started):
+        """Thay toàn bộ mirror bằng items đã tải (gọi khi đang giữ lock), trả về (records mới/đổi, id đã bị xoá)"""
+        previous_ids = set(self.events)
+        self.events = {}
+        self.masters, self.exceptions = {}, {}
+        self._exceptions_by_master, self._instances_by_master, self._master_by_instance = {}, {}, {}
+        for item in items:
+            # singleEvents=False vẫn trả về các buổi bị huỷ (exception) - cần để ẩn buổi đó
+            self._apply_item(item)
+        self.sync_token = sync_token
+        self.last_sync = time.monotonic()
+        self._materialized_at = self.last_sync
+        self.version += 1
+        self._dirty = False
+        print(f"🪞 Full sync {self.calendar_type.upper()}: {len(items)} items -> {len(self.events)} events "
+              f"({len(self.masters)} masters expanded locally) in {self.last_sync - started:.2f}s")
+        return list(self.events.values()), list(previous_ids - set(self.events))
+
+    def _delta_sync(self, items, sync_token):
+        """Áp phần thay đổi từ syncToken (gọi khi đang giữ lock), trả về (records mới/đổi, id đã bị xoá)"""
+        changes = ([], [])
+        for item in items:
+            changes = _merge_changes(changes, self._apply_item(item))
+        upserted, removed = changes
+        if items:
+            self.version += 1
+        self.sync_token = sync_token or self.sync_token
+        self.last_sync = time.monotonic()
+        self._dirty = False
+        if items:
+            print(f"🪞 Delta sync {self.calendar_type.upper()}: {len(items)} changed events")
+        return upserted, removed
+
+
+# ---------------- Change listeners ----------------
+_listeners = []
+
+
+def add_change_listener(listener):
+    """
+    Đăng ký listener(calendar_id, upserted_records, removed_ids, reset=False),
+    được gọi mỗi khi mirror thay đổi (sync hoặc ghi trực tiếp)
+    reset=True: thay đổi hàng loạt (full sync, expand lại mọi master hằng ngày) - không nên theo dõi từng event
+    """
+    _listeners.append(listener)
+
+
+def _notify_listeners(mirror, upserted, removed_ids, reset=False):
+    if not upserted and not removed_ids:
+        return
+    for listener in list(_listeners):
+        try:
+            listener(mirror.calendar_id, upserted, removed_ids, reset=reset)
+        except Exception as e:
+            print(f"⚠️ Mirror listener error: {e}")
+
+
+def _start_key(record):
+    return record.start_ts
+
+
+def _merge_changes(first, second):
+    return first[0] + second[0], first[1] + second[1]
+
+
+# ---------------- Registry ----------------
+_mirrors = {}
+_registry_lock = threading.Lock()
+
+
+def get_mirror(calendar_id, calendar_type):
+    """Lấy (hoặc tạo) mirror cho calendar"""
+    with _registry_lock:
+        mirror = _mirrors.get(calendar_id)
+        if mirror is None:
+            mirror = CalendarMirror(calendar_id, calendar_type)
+            _mirrors[calendar_id] = mirror
+        return mirror
@@ -0,0 +1,87 @@
+# backend/event_record.py
+"""
+Bản ghi event gọn (__slots__) được parse 1 lần khi nhận dữ liệu từ Google.
+
+Các đường xử lý nóng (list_events, conflict check, gợi ý lịch, thống kê) dùng
+thẳng start/end dạng UTC epoch seconds và tên giáo viên đã chuẩn hoá thay vì
+parse lại ISO string / summary ở mỗi bước. Chỉ chuyển lại thành dict của API
+ở biên (to_api).
+"""
+import math
+
+from schedule_utils import normalize_teacher_name, parse_iso_datetime_flexible, extract_teacher_from_event
+
+EXTRA_API_FIELDS = ('zoom_link', 'meeting_id', 'passcode', 'classname')
+
+
+def _parse_ts(time_obj):
+    """{'dateTime'|'date': ...} -> (epoch seconds, string gốc, có giờ hay không)"""
+    dt_str = time_obj.get('dateTime')
+    if dt_str:
+        dt = parse_iso_datetime_flexible(dt_str)
+        return (dt.timestamp() if dt else math.inf), dt_str, True
+    date_str = time_obj.get('date')
+    if date_str:
+        # Event cả ngày: tính từ 00:00 giờ Việt Nam (giống parse_iso_datetime_flexible)
+        dt = parse_iso_datetime_flexible(f"{date_str}T00:00:00")
+        return (dt.timestamp() if dt else math.inf), date_str, False
+    return math.inf, '', False
+
+
+class EventRecord:
+    __slots__ = (
+        'id', 'calendar_id', 'calendar_source', 'start_ts', 'end_ts', 'start_str', 'end_str',
+        'timed', 'teacher', 'teacher_name', 'summary', 'master_id', 'is_instance', 'is_master',
+        'cancelled', 'raw'
+    )
+
+    @classmethod
+    def from_google(cls, event, calendar_id=None, calendar_source=None):
+        record = cls()
+        record.id = event.get('id')
+        record.calendar_id = calendar_id or event.get('_calendar_id')
+        record.calendar_source = calendar_source or event.get('_calendar_source')
+        record.start_ts, record.start_str, start_timed = _parse_ts(event.get('start') or {})
+        record.end_ts, record.end_str, end_timed = _parse_ts(event.get('end') or {})
+        record.timed = start_timed and end_timed
+        record.teacher_name = extract_teacher_from_event(event)
+        record.teacher = normalize_teacher_name(record.teacher_name)
+        record.summary = event.get('summary', 'No title')
+        record.master_id = event.get('recurringEventId')
+        record.is_instance = bool(record.master_id)
+        record.is_master = bool(event.get('recurrence')) and not record.is_instance
+        record.cancelled = event.get('status') == 'cancelled'
+        record.raw = event
+        return record
+
+    @property
+    def is_visible(self):
+        """Event hiển thị trên lịch: không bị huỷ và không phải master (chỉ là template)"""
+        return not self.cancelled and not self.is_master
+
+    def overlaps(self, start_ts, end_ts):
+        return self.start_ts < end_ts and self.end_ts > start_ts
+
+    def to_api(self, extra=None):
+        """Chuyển về dict event của API (copy của event Google + metadata + extra data)"""
+        event = dict(self.raw)
+        event['_calendar_source'] = self.calendar_source
+        event['_calendar_id'] = self.calendar_id
+        event['_is_master'] = self.is_master
+        event['_is_instance'] = self.is_instance
+        if self.is_instance:
+            event['_master_event_id'] = self.master_id
+        if extra:
+            for field in EXTRA_API_FIELDS:
+                event[field] = extra.get(field, '')
+        return event
+
+    def __repr__(self):
+        return f"EventRecord({self.id!r}, {self.summary!r}, {self.start_str!r})"
+
+
+def as_record(event):
+    """Nhận EventRecord hoặc dict event Google, luôn trả về EventRecord"""
+    if isinstance(event, EventRecord):
+        return event
+    return EventRecord.from_google(event)
@@ -0,0 +1,226 @@
+# backend/extra_store.py
+"""
+Lưu extra data của class (zoom link, meeting id, passcode, classname, calendar_id)
+trong SQLite (WAL mode), khoá theo event id. Cùng file DB giữ shard map
+(giá trị khoá chia shard -> shard) của shard_router.
+
+Thay cho việc đọc/ghi lại toàn bộ data/classes_extra.json mỗi request:
+mỗi lần ghi chỉ chạm 1 dòng, đọc được theo lô cho cả trang events,
+và các request đồng thời không làm mất dữ liệu của nhau.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+EXTRA_DB_FILE = Path(os.getenv("EXTRA_DB_PATH", "data/classes_extra.db"))
+LEGACY_JSON_FILE = Path("data/classes_extra.json")
+
+EXTRA_FIELDS = ("zoom_link", "meeting_id", "passcode", "classname", "calendar_id")
+# SQLite giới hạn số tham số trong 1 câu lệnh -> chia lô khi lookup nhiều id
+LOOKUP_CHUNK_SIZE = 500
+
+
+class ExtraStore:
+    def __init__(self, db_path=EXTRA_DB_FILE, legacy_json=LEGACY_JSON_FILE):
+        self.db_path = Path(db_path)
+        self.legacy_json = Path(legacy_json) if legacy_json else None
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    # ---------------- Connection ----------------
+    def _connect(self):
+        """Mỗi thread 1 connection (sqlite3 connection không dùng chung giữa các thread)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        if not self._initialized:
+            self._initialize(conn)
+        return conn
+
+    def _initialize(self, conn):
+        with self._init_lock:
+            if self._initialized:
+                return
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS class_extra (
+                    event_id TEXT PRIMARY KEY,
+                    zoom_link TEXT NOT NULL DEFAULT '',
+                    meeting_id TEXT NOT NULL DEFAULT '',
+                    passcode TEXT NOT NULL DEFAULT '',
+                    classname TEXT NOT NULL DEFAULT '',
+                    calendar_id TEXT NOT NULL DEFAULT '',
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS shard_map (
+                    shard_key TEXT PRIMARY KEY,
+                    shard TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS store_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            """)
+            self._migrate_from_json(conn)
+            self._initialized = True
+
+    def _migrate_from_json(self, conn):
+        """Chuyển dữ liệu từ classes_extra.json sang SQLite - chỉ chạy 1 lần"""
+        migrated = conn.execute(
+            "SELECT value FROM store_meta WHERE key = 'json_migrated'"
+        ).fetchone()
+        if migrated or not self.legacy_json or not self.legacy_json.exists():
+            return
+
+        with open(self.legacy_json, "r", encoding="utf-8") as f:
+            legacy = json.load(f)
+
+        now = time.time()
+        with _transaction(conn):
+            conn.executemany(
+                """INSERT OR IGNORE INTO class_extra
+                   (event_id, zoom_link, meeting_id, passcode, classname, calendar_id, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                [(event_id, *_field_values(data), now) for event_id, data in legacy.items()]
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO store_meta (key, value) VALUES ('json_migrated', ?)",
+                (str(now),)
+            )
+        print(f"📦 Migrated {len(legacy)} extra records from {self.legacy_json} to {self.db_path}")
+
+    # ---------------- Read ----------------
+    def get(self, event_id):
+        row = self._connect().execute(
+            "SELECT * FROM class_extra WHERE event_id = ?", (event_id,)
+        ).fetchone()
+        return _row_to_dict(row) if row else None
+
+    def get_many(self, event_ids):
+        """Lookup theo lô: {event_id: extra} cho các id có dữ liệu"""
+        ids = list(dict.fromkeys(i for i in event_ids if i))
+        result = {}
+        conn = self._connect()
+        for start in range(0, len(ids), LOOKUP_CHUNK_SIZE):
+            chunk = ids[start:start + LOOKUP_CHUNK_SIZE]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT * FROM class_extra WHERE event_id IN ({placeholders})", chunk
+            ).fetchall()
+            for row in rows:
+                result[row["event_id"]] = _row_to_dict(row)
+        return result
+
+    def all(self):
+        rows = self._connect().execute("SELECT * FROM class_extra").fetchall()
+        return {row["event_id"]: _row_to_dict(row) for row in rows}
+
+    # ---------------- Write ----------------
+    def upsert(self, event_id, data):
+        self.upsert_many({event_id: data})
+
+    def upsert_many(self, records):
+        """Ghi nhiều bản ghi trong 1 transaction"""
+        if not records:
+            return
+        now = time.time()
+        conn = self._connect()
+        with _transaction(conn):
+            conn.executemany(
+                """INSERT INTO class_extra
+                   (event_id, zoom_link, meeting_id, passcode, classname, calendar_id, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(event_id) DO UPDATE SET
+                       zoom_link = excluded.zoom_link,
+                       meeting_id = excluded.meeting_id,
+                       passcode = excluded.passcode,
+                       classname = excluded.classname,
+                       calendar_id = excluded.calendar_id,
+                       updated_at = excluded.updated_at""",
+                [(event_id, *_field_values(data), now) for event_id, data in records.items()]
+            )
+
+    def delete(self, event_id):
+        self.delete_many([event_id])
+
+    def delete_many(self, event_ids):
+        ids = [i for i in event_ids if i]
+        if not ids:
+            return
+        conn = self._connect()
+        with _transaction(conn):
+            conn.executemany("DELETE FROM class_extra WHERE event_id = ?", [(i,) for i in ids])
+
+
+    # ---------------- Shard map ----------------
+    def get_shard(self, shard_key):
+        row = self._connect().execute(
+            "SELECT shard FROM shard_map WHERE shard_key = ?", (shard_key,)
+        ).fetchone()
+        return row["shard"] if row else None
+
+    def assign_shard(self, shard_key, shard, only_if_absent=False):
+        """Gán khoá -> shard; only_if_absent: process khác gán trước thì giữ shard đó. Trả về shard đang dùng"""
+        conn = self._connect()
+        with _transaction(conn):
+            if only_if_absent:
+                conn.execute(
+                    "INSERT OR IGNORE INTO shard_map (shard_key, shard, updated_at) VALUES (?, ?, ?)",
+                    (shard_key, shard, time.time())
+                )
+            else:
+                conn.execute(
+                    """INSERT INTO shard_map (shard_key, shard, updated_at) VALUES (?, ?, ?)
+                       ON CONFLICT(shard_key) DO UPDATE SET shard = excluded.shard, updated_at = excluded.updated_at""",
+                    (shard_key, shard, time.time())
+                )
+            row = conn.execute("SELECT shard FROM shard_map WHERE shard_key = ?", (shard_key,)).fetchone()
+        return row["shard"]
+
+    def shard_map(self):
+        rows = self._connect().execute("SELECT shard_key, shard FROM shard_map ORDER BY shard_key").fetchall()
+        return {row["shard_key"]: row["shard"] for row in rows}
+
+    def shard_key_counts(self):
+        """{shard: số khoá đang gán}"""
+        rows = self._connect().execute("SELECT shard, COUNT(*) AS n FROM shard_map GROUP BY shard").fetchall()
+        return {row["shard"]: row["n"] for row in rows}
+
+
+class _transaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK (connection ở chế độ autocommit)"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+def _field_values(data):
+    return tuple(str(data.get(field) or "") for field in EXTRA_FIELDS)
+
+
+def _row_to_dict(row):
+    return {field: row[field] for field in EXTRA_FIELDS}
+
+
+extra_store = ExtraStore()
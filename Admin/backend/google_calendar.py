@@ -1,4 +1,6 @@
 # google_calendar.py
+import threading
+
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 
@@ -25,12 +27,30 @@ CALENDAR_TYPES = {
     CALENDAR_EVEN: 'even'
 }
 
-credentials = service_account.Credentials.from_service_account_file(
-    SERVICE_ACCOUNT_FILE, scopes=SCOPES
-)
-
-calendar_service = build('calendar', 'v3', credentials=credentials)
+# Credentials + service chỉ được tạo khi dùng backend Google (xem calendar_backend)
+_credentials = None
+_credentials_lock = threading.Lock()
+
+# httplib2 (bên trong service) không thread-safe -> mỗi thread 1 service riêng
+_thread_local = threading.local()
+
+def _get_credentials():
+    global _credentials
+    with _credentials_lock:
+        if _credentials is None:
+            _credentials = service_account.Credentials.from_service_account_file(
+                SERVICE_ACCOUNT_FILE, scopes=SCOPES
+            )
+            print(f"✅ Google Calendar API initialized")
+        return _credentials
+
+def get_google_service():
+    """Lấy Google calendar service riêng của thread hiện tại (tạo lần đầu nếu chưa có)"""
+    service = getattr(_thread_local, 'service', None)
+    if service is None:
+        service = build('calendar', 'v3', credentials=_get_credentials(), cache_discovery=False)
+        _thread_local.service = service
+    return service
 
-print(f"✅ Google Calendar API initialized")
 print(f"📅 Calendar ODD: {CALENDAR_ODD[:30]}...")
-print(f"📅 Calendar EVEN: {CALENDAR_EVEN[:30]}...")
\ No newline at end of file
+print(f"📅 Calendar EVEN: {CALENDAR_EVEN[:30]}...")
@@ -0,0 +1,88 @@
+# backend/io_executor.py
+"""
+Executor riêng cho I/O chặn (googleapiclient, Gemini) của các route async.
+
+Route async không được gọi thẳng Google (sẽ chặn event loop), nên mọi lời gọi
+đi qua run_io(): chạy trên pool thread riêng (kích thước cấu hình được, không
+dùng chung threadpool mặc định của Starlette), mỗi worker tạo calendar_service
+riêng ở lần đầu dùng (httplib2 không thread-safe; get_calendar_service giữ theo thread). Mỗi upstream có semaphore riêng để 1 upstream
+chậm (vd Gemini) không chiếm hết worker của upstream kia.
+"""
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+IO_EXECUTOR_WORKERS = int(os.getenv("IO_EXECUTOR_WORKERS", "32"))
+UPSTREAM_LIMITS = {
+    'calendar': int(os.getenv("CALENDAR_MAX_CONCURRENCY", "24")),
+    'gemini': int(os.getenv("GEMINI_MAX_CONCURRENCY", "4")),
+}
+# Số item lấy mỗi lần khi stream 1 generator chặn qua executor
+STREAM_CHUNK_SIZE = 200
+
+
+_executor = ThreadPoolExecutor(
+    max_workers=IO_EXECUTOR_WORKERS,
+    thread_name_prefix="io"
+    # Không dùng initializer: lỗi credentials trong initializer làm executor hỏng vĩnh viễn (BrokenThreadPool)
+)
+
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+_waiting = {name: 0 for name in UPSTREAM_LIMITS}
+
+
+def _semaphore(upstream):
+    # asyncio.Semaphore gắn với 1 event loop -> tạo trong loop đang chạy (không tạo lúc import)
+    loop = asyncio.get_running_loop()
+    with _semaphores_lock:
+        entry = _semaphores.get(upstream)
+        if entry is None or entry[0] is not loop:
+            entry = (loop, asyncio.Semaphore(UPSTREAM_LIMITS[upstream]))
+            _semaphores[upstream] = entry
+    return entry[1]
+
+
+async def run_io(upstream, func, *args, **kwargs):
+    """Chạy func(*args, **kwargs) chặn trên executor I/O, tối đa N lời gọi đồng thời / upstream"""
+    semaphore = _semaphore(upstream)
+    _waiting[upstream] += 1
+    try:
+        await semaphore.acquire()
+    finally:
+        _waiting[upstream] -= 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+    finally:
+        semaphore.release()
+
+
+async def iterate_io_chunks(upstream, iterable, chunk_size=STREAM_CHUNK_SIZE):
+    """Duyệt 1 iterable chặn (vd generator của list_events) trên executor I/O, yield từng list <= chunk_size item"""
+    iterator = iter(iterable)
+
+    def next_chunk():
+        chunk = []
+        for item in iterator:
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                break
+        return chunk
+
+    while True:
+        chunk = await run_io(upstream, next_chunk)
+        if not chunk:
+            return
+        yield chunk
+
+
+def stats():
+    return {
+        'workers': IO_EXECUTOR_WORKERS,
+        'upstreams': {
+            name: {'limit': limit, 'waiting': _waiting[name]}
+            for name, limit in UPSTREAM_LIMITS.items()
+        }
+    }
@@ -0,0 +1,113 @@
+# backend/prompt_builder.py
+"""
+Dựng phần "lịch hiện tại" gọn cho prompt Gemini.
+
+Chỉ giữ event của giáo viên cần xét trong khoảng thời gian liên quan, mã hoá
+dạng bảng (1 dòng / event, giờ địa phương, không có description) và cắt theo
+ngân sách token - ưu tiên các event gần thời điểm cần xét nhất. Kích thước
+prompt vì vậy không tăng theo số lớp của cả trường.
+"""
+import os
+from datetime import datetime, timedelta
+
+import pytz
+
+from event_record import as_record
+from schedule_utils import normalize_teacher_name
+
+AI_PROMPT_TOKEN_BUDGET = int(os.getenv("AI_PROMPT_TOKEN_BUDGET", "1500"))
+AI_PROMPT_HORIZON_DAYS = int(os.getenv("AI_PROMPT_HORIZON_DAYS", "14"))
+PROMPT_TIMEZONE = pytz.timezone('Asia/Ho_Chi_Minh')
+# Ước lượng thô: ~3 ký tự / token (tiếng Việt có dấu tốn token hơn tiếng Anh)
+CHARS_PER_TOKEN = 3
+MAX_SUMMARY_CHARS = 40
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def horizon_window(focus=None, days=AI_PROMPT_HORIZON_DAYS):
+    """(start, end) datetime có tz: từ 1 ngày trước focus (mặc định: bây giờ) tới N ngày sau"""
+    focus = focus or datetime.now(PROMPT_TIMEZONE)
+    if focus.tzinfo is None:
+        focus = PROMPT_TIMEZONE.localize(focus)
+    return focus - timedelta(days=1), focus + timedelta(days=days)
+
+
+def _format_row(record, include_teacher):
+    start = datetime.fromtimestamp(record.start_ts, PROMPT_TIMEZONE)
+    end = datetime.fromtimestamp(record.end_ts, PROMPT_TIMEZONE)
+    end_text = end.strftime('%H:%M') if end.date() == start.date() else end.strftime('%m-%d %H:%M')
+    summary = record.summary.replace('|', '/')[:MAX_SUMMARY_CHARS]
+    cells = [start.strftime('%Y-%m-%d %a'), start.strftime('%H:%M'), end_text]
+    if include_teacher:
+        cells.append(record.teacher_name or '-')
+    cells.append(summary)
+    return '|'.join(cells)
+
+
+def build_schedule_table(existing_classes, teacher=None, window_start=None, window_end=None,
+                         focus=None, exclude_event_id=None, token_budget=AI_PROMPT_TOKEN_BUDGET):
+    """
+    Bảng lịch gọn cho prompt -> (text, stats)
+    teacher: chỉ giữ event của giáo viên này (None = mọi giáo viên, thêm cột GV)
+    focus: thời điểm cần xét - khi vượt ngân sách thì giữ các event gần focus nhất
+    """
+    target = normalize_teacher_name(teacher) if teacher else None
+    if window_start is None or window_end is None:
+        window_start, window_end = horizon_window(focus)
+    start_ts, end_ts = window_start.timestamp(), window_end.timestamp()
+
+    considered = 0
+    selected = []
+    for event in existing_classes:
+        record = as_record(event)
+        considered += 1
+        if not record.is_visible or not record.timed:
+            continue
+        if exclude_event_id and exclude_event_id in (record.id, record.master_id):
+            continue
+        if target is not None and record.teacher != target:
+            continue
+        if record.end_ts <= start_ts or record.start_ts >= end_ts:
+            continue
+        selected.append(record)
+
+    include_teacher = target is None
+    header = 'ngày|bắt đầu|kết thúc|' + ('GV|' if include_teacher else '') + 'lớp'
+    rows = {id(r): _format_row(r, include_teacher) for r in selected}
+
+    # Giữ các event gần focus nhất cho tới khi hết ngân sách token
+    focus_ts = (focus or window_start).timestamp()
+    budget_chars = token_budget * CHARS_PER_TOKEN - len(header) - 1
+    kept = []
+    for record in sorted(selected, key=lambda r: abs(r.start_ts - focus_ts)):
+        row_chars = len(rows[id(record)]) + 1
+        if row_chars > budget_chars:
+            break
+        budget_chars -= row_chars
+        kept.append(record)
+    kept.sort(key=lambda r: r.start_ts)
+
+    lines = [header] + [rows[id(r)] for r in kept]
+    if not kept:
+        lines.append('(không có lịch trong khoảng này)')
+    text = '\n'.join(lines)
+
+    stats = {
+        'events_considered': considered,
+        'events_in_window': len(selected),
+        'events_included': len(kept),
+        'events_dropped': len(selected) - len(kept),
+        'window': [window_start.isoformat(), window_end.isoformat()],
+    }
+    return text, stats
+
+
+def report_prompt(kind, prompt, stats):
+    """Ghi log + trả về kích thước prompt của lần gọi"""
+    stats = dict(stats, prompt_chars=len(prompt), prompt_tokens_est=estimate_tokens(prompt))
+    print(f"📏 Prompt {kind}: {stats['events_included']}/{stats['events_in_window']} events "
+          f"(từ {stats['events_considered']}), {stats['prompt_chars']} chars ≈ {stats['prompt_tokens_est']} tokens")
+    return stats
@@ -0,0 +1,101 @@
+# backend/read_coalescer.py
+"""
+Gộp các lần đọc calendar giống nhau đang chạy cùng lúc (single-flight).
+
+Nhiều admin mở trang lịch cùng lúc (hoặc /check-conflict chạy song song) sẽ
+chỉ tạo 1 lần tải cho mỗi (calendar, khoảng thời gian, fields): request đầu
+tiên tải, các request khác chờ và dùng chung kết quả. Kết quả được giữ thêm
+READ_COALESCE_SECONDS giây sau khi tải xong; mọi lần ghi lên Google xoá hết
+(kể cả lần tải đang chạy) để không đọc lại dữ liệu cũ.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+READ_COALESCE_SECONDS = float(os.getenv("READ_COALESCE_SECONDS", "2"))
+MAX_FRESH_ENTRIES = 64
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, fresh_seconds=READ_COALESCE_SECONDS, max_entries=MAX_FRESH_ENTRIES):
+        self.fresh_seconds = fresh_seconds
+        self.max_entries = max_entries
+        # key -> _Call đang chạy
+        self._calls = {}
+        # key -> (finished_at, result) của các lần tải vừa xong
+        self._fresh = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.fetches = 0
+        self.shared = 0
+        self.fresh_hits = 0
+
+    def do(self, key, func):
+        """Trả về func() - dùng chung với lần gọi cùng key đang chạy hoặc vừa xong"""
+        with self._lock:
+            entry = self._fresh.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.fresh_seconds:
+                self.fresh_hits += 1
+                return entry[1]
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                generation = self._generation
+                self.fetches += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                # Có ghi trong lúc đang tải -> không giữ kết quả này
+                if call.error is None and generation == self._generation and self.fresh_seconds > 0:
+                    self._fresh[key] = (time.monotonic(), call.result)
+                    self._fresh.move_to_end(key)
+                    while len(self._fresh) > self.max_entries:
+                        self._fresh.popitem(last=False)
+            call.done.set()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def forget_all(self):
+        """Sau khi ghi: bỏ kết quả đã giữ, request mới không nhập vào lần tải đang chạy"""
+        with self._lock:
+            self._generation += 1
+            self._fresh.clear()
+            self._calls.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'fetches': self.fetches,
+                'shared': self.shared,
+                'fresh_hits': self.fresh_hits,
+                'in_flight': len(self._calls)
+            }
+
+
+calendar_reads = SingleFlight()
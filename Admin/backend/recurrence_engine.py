@@ -0,0 +1,505 @@
+# backend/recurrence_engine.py
+"""
+Tự expand các master event lặp lại (RRULE / EXDATE / RDATE) thành các buổi học.
+
+Hỗ trợ phần RFC 5545 mà recurrence_helper.build_recurrence_rule và các thao tác
+xoá "this/following" sinh ra: FREQ DAILY/WEEKLY/MONTHLY/YEARLY, INTERVAL,
+COUNT, UNTIL, BYDAY (kể cả dạng 1MO / -1FR), BYMONTHDAY, BYMONTH, WKST.
+Các buổi được tính theo giờ địa phương của master (start.timeZone) nên giữ
+nguyên giờ học qua các lần đổi DST, giống cách Google expand.
+
+Kết quả expand được cache theo master (id + recurrence + start), mirror dùng
+để tự sinh instances thay vì tải từng instance từ Google (singleEvents=True).
+"""
+import bisect
+import calendar
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime, date, timedelta, timezone, MAXYEAR
+
+import pytz
+
+# Với rule không có COUNT/UNTIL: chỉ sinh buổi học tới (bây giờ + N ngày)
+RECURRENCE_HORIZON_DAYS = int(os.getenv("RECURRENCE_HORIZON_DAYS", "365"))
+# Giới hạn an toàn số buổi của 1 master
+MAX_OCCURRENCES = 5000
+# Rule không bao giờ khớp (vd BYMONTH=2;BYMONTHDAY=30): dừng sau N chu kỳ liên tiếp không có buổi nào
+MAX_EMPTY_PERIODS = 10000
+SUPPORTED_FREQS = ('DAILY', 'WEEKLY', 'MONTHLY', 'YEARLY')
+CACHE_SIZE = 1024
+
+WEEKDAYS = {'MO': 0, 'TU': 1, 'WE': 2, 'TH': 3, 'FR': 4, 'SA': 5, 'SU': 6}
+BYDAY_PATTERN = re.compile(r'^([+-]?\d{1,2})?(MO|TU|WE|TH|FR|SA|SU)$')
+
+
+# ---------------- Parse ----------------
+def _parse_int_list(value):
+    return [int(x) for x in value.split(',') if x.strip()]
+
+
+def _parse_ical_datetime(value, tz):
+    """20261020T100000Z | 20261020T100000 (giờ địa phương tz) | 20261020 -> datetime có tz"""
+    value = value.strip()
+    if value.endswith('Z'):
+        return datetime.strptime(value, '%Y%m%dT%H%M%SZ').replace(tzinfo=timezone.utc)
+    if 'T' in value:
+        return _localize(tz, datetime.strptime(value, '%Y%m%dT%H%M%S'))
+    return _localize(tz, datetime.strptime(value, '%Y%m%d'))
+
+
+def _line_tz(params, default_tz):
+    """Lấy TZID trong tham số dòng EXDATE/RDATE (vd: EXDATE;TZID=Asia/Ho_Chi_Minh:...)"""
+    match = re.search(r'TZID=([^;:]+)', params)
+    if match:
+        try:
+            return pytz.timezone(match.group(1))
+        except pytz.UnknownTimeZoneError:
+            pass
+    return default_tz
+
+
+def _localize(tz, naive):
+    if hasattr(tz, 'localize'):
+        return tz.localize(naive)
+    return naive.replace(tzinfo=tz)
+
+
+def _normalize(tz, aware):
+    if hasattr(tz, 'normalize'):
+        return tz.normalize(aware)
+    return aware
+
+
+class _PeriodEnd:
+    """Mốc hết 1 chu kỳ (ngày/tuần/tháng/năm) - next_start: đầu chu kỳ sau, để iter_local kiểm tra stop"""
+    __slots__ = ('next_start',)
+
+    def __init__(self, next_start):
+        self.next_start = next_start
+
+
+class RecurrenceRule:
+    """1 dòng RRULE đã parse"""
+
+    def __init__(self, rrule_str):
+        self.freq = None
+        self.interval = 1
+        self.count = None
+        self.until = None  # string gốc, parse theo tz của master
+        self.byday = []  # [(ordinal|None, weekday)]
+        self.bymonthday = []
+        self.bymonth = []
+        self.wkst = 0
+        for part in rrule_str.replace('RRULE:', '').split(';'):
+            if '=' not in part:
+                continue
+            key, value = part.split('=', 1)
+            key = key.strip().upper()
+            value = value.strip()
+            if key == 'FREQ':
+                self.freq = value.upper()
+            elif key == 'INTERVAL':
+                self.interval = max(1, int(value))
+            elif key == 'COUNT':
+                self.count = int(value)
+            elif key == 'UNTIL':
+                self.until = value
+            elif key == 'BYDAY':
+                for token in value.upper().split(','):
+                    match = BYDAY_PATTERN.match(token.strip())
+                    if match:
+                        ordinal = int(match.group(1)) if match.group(1) else None
+                        self.byday.append((ordinal, WEEKDAYS[match.group(2)]))
+            elif key == 'BYMONTHDAY':
+                self.bymonthday = _parse_int_list(value)
+            elif key == 'BYMONTH':
+                self.bymonth = _parse_int_list(value)
+            elif key == 'WKST':
+                self.wkst = WEEKDAYS.get(value.upper(), 0)
+        if self.freq not in SUPPORTED_FREQS:
+            raise ValueError(f"Unsupported RRULE FREQ: {self.freq} ({' | '.join(SUPPORTED_FREQS)})")
+
+    # ---------------- Expand ----------------
+    def iter_local(self, dtstart, stop):
+        """Sinh các thời điểm (naive, giờ địa phương) theo thứ tự, từ dtstart tới stop"""
+        if self.freq == 'DAILY':
+            iterator = self._iter_daily(dtstart)
+        elif self.freq == 'WEEKLY':
+            iterator = self._iter_weekly(dtstart)
+        elif self.freq == 'MONTHLY':
+            iterator = self._iter_monthly(dtstart)
+        else:
+            iterator = self._iter_yearly(dtstart)
+        empty_periods = 0
+        for candidate in iterator:
+            if isinstance(candidate, _PeriodEnd):
+                # Hết 1 chu kỳ: kiểm tra stop kể cả khi chu kỳ không có buổi nào (rule không khớp ngày nào)
+                empty_periods += 1
+                if candidate.next_start > stop or empty_periods > MAX_EMPTY_PERIODS:
+                    return
+                continue
+            if candidate > stop:
+                return
+            empty_periods = 0
+            yield candidate
+
+    def _matches_filters(self, day):
+        if self.bymonth and day.month not in self.bymonth:
+            return False
+        if self.bymonthday and not _matches_monthday(day, self.bymonthday):
+            return False
+        if self.byday and day.weekday() not in {wd for _, wd in self.byday}:
+            return False
+        return True
+
+    def _iter_daily(self, dtstart):
+        current = dtstart
+        while True:
+            yield current if self._matches_filters(current.date()) else _PeriodEnd(current)
+            current += timedelta(days=self.interval)
+
+    def _iter_weekly(self, dtstart):
+        weekdays = sorted({wd for _, wd in self.byday}, key=lambda wd: (wd - self.wkst) % 7) \
+            or [dtstart.weekday()]
+        week_start = dtstart - timedelta(days=(dtstart.weekday() - self.wkst) % 7)
+        while True:
+            for wd in weekdays:
+                candidate = week_start + timedelta(days=(wd - self.wkst) % 7)
+                if candidate < dtstart:
+                    continue
+                if not self._matches_filters(candidate.date()):
+                    continue
+                yield candidate
+            week_start += timedelta(weeks=self.interval)
+            yield _PeriodEnd(week_start)
+
+    def _iter_monthly(self, dtstart):
+        year, month = dtstart.year, dtstart.month
+        while True:
+            if not self.bymonth or month in self.bymonth:
+                for day in self._days_in_month(year, month, dtstart):
+                    candidate = datetime.combine(day, dtstart.time())
+                    if candidate >= dtstart:
+                        yield candidate
+            month += self.interval
+            year += (month - 1) // 12
+            month = (month - 1) % 12 + 1
+            if year > MAXYEAR:
+                return
+            yield _PeriodEnd(datetime.combine(date(year, month, 1), dtstart.time()))
+
+    def _iter_yearly(self, dtstart):
+        year = dtstart.year
+        months = sorted(self.bymonth) or [dtstart.month]
+        while True:
+            for month in months:
+                for day in self._days_in_month(year, month, dtstart):
+                    candidate = datetime.combine(day, dtstart.time())
+                    if candidate >= dtstart:
+                        yield candidate
+            year += self.interval
+            if year > MAXYEAR:
+                return
+            yield _PeriodEnd(datetime.combine(date(year, 1, 1), dtstart.time()))
+
+    def _days_in_month(self, year, month, dtstart):
+        """Các ngày của tháng khớp BYMONTHDAY/BYDAY (mặc định: ngày của dtstart)"""
+        last_day = calendar.monthrange(year, month)[1]
+        all_days = [date(year, month, d) for d in range(1, last_day + 1)]
+
+        if self.byday:
+            days = [d for d in all_days if _matches_byday_in_month(d, self.byday, last_day)]
+            if self.bymonthday:
+                days = [d for d in days if _matches_monthday(d, self.bymonthday)]
+            return days
+        if self.bymonthday:
+            return [d for d in all_days if _matches_monthday(d, self.bymonthday)]
+        # Ngày không tồn tại trong tháng (vd: 31/2) thì bỏ qua, theo RFC 5545
+        return [date(year, month, dtstart.day)] if dtstart.day <= last_day else []
+
+
+def _matches_monthday(day, monthdays):
+    last_day = calendar.monthrange(day.year, day.month)[1]
+    return any(
+        day.day == md or (md < 0 and day.day == last_day + md + 1)
+        for md in monthdays
+    )
+
+
+def _matches_byday_in_month(day, byday, last_day):
+    for ordinal, weekday in byday:
+        if day.weekday() != weekday:
+            continue
+        if ordinal is None:
+            return True
+        if ordinal > 0 and (day.day - 1) // 7 + 1 == ordinal:
+            return True
+        if ordinal < 0 and (last_day - day.day) // 7 + 1 == -ordinal:
+            return True
+    return False
+
+
+class RecurrenceSet:
+    """RRULE + EXDATE + RDATE của 1 master, expand theo giờ địa phương của master"""
+
+    def __init__(self, recurrence, dtstart, tz):
+        self.dtstart = dtstart
+        self.tz = tz
+        self.rules = []
+        self.exdates = set()
+        self.rdates = []
+        for line in recurrence or []:
+            head, _, value = line.partition(':')
+            name = head.split(';')[0].upper()
+            if name == 'RRULE':
+                self.rules.append(RecurrenceRule(value))
+            elif name in ('EXDATE', 'RDATE'):
+                line_tz = _line_tz(head, tz)
+                stamps = [_parse_ical_datetime(v, line_tz) for v in value.split(',') if v.strip()]
+                if name == 'EXDATE':
+                    self.exdates.update(_utc_key(s) for s in stamps)
+                else:
+                    self.rdates.extend(stamps)
+
+    def _iter_rule(self, rule, until_dt):
+        """Các buổi của 1 RRULE (COUNT tính trước khi bỏ EXDATE, theo RFC 5545)"""
+        naive_start = self.dtstart.astimezone(self.tz).replace(tzinfo=None)
+        rule_until = _parse_ical_datetime(rule.until, self.tz) if rule.until else None
+        if rule_until is not None and 'T' not in rule.until:
+            rule_until += timedelta(days=1, microseconds=-1)  # UNTIL dạng ngày: hết ngày đó
+        stop_dt = min(until_dt, rule_until) if rule_until is not None else until_dt
+        # Dừng duyệt theo giờ địa phương (+1 ngày để bù chênh lệch offset)
+        stop_local = stop_dt.astimezone(self.tz).replace(tzinfo=None) + timedelta(days=1)
+        emitted = 0
+        for local in rule.iter_local(naive_start, stop_local):
+            occurrence = _localize(self.tz, local)
+            if occurrence > stop_dt:
+                return
+            yield occurrence
+            emitted += 1
+            if (rule.count is not None and emitted >= rule.count) or emitted >= MAX_OCCURRENCES:
+                return
+
+    def occurrences(self, until_dt):
+        """Tất cả buổi (datetime có tz) tới until_dt, đã sort và bỏ EXDATE"""
+        starts = {}
+        for rule in self.rules:
+            for occurrence in self._iter_rule(rule, until_dt):
+                starts[_utc_key(occurrence)] = occurrence
+        if not self.rules:
+            starts[_utc_key(self.dtstart)] = self.dtstart
+        for rdate in self.rdates:
+            if rdate <= until_dt:
+                starts.setdefault(_utc_key(rdate), _normalize(self.tz, rdate.astimezone(self.tz)))
+        result = [starts[key] for key in sorted(starts) if key not in self.exdates]
+        return result[:MAX_OCCURRENCES]
+
+    @property
+    def is_bounded(self):
+        """Rule có điểm kết thúc (COUNT/UNTIL) -> expand được toàn bộ"""
+        return all(rule.count is not None or rule.until for rule in self.rules)
+
+
+def validate_recurrence(recurrence):
+    """Raise ValueError nếu có dòng RRULE không expand được (FREQ không hỗ trợ, thiếu FREQ...)"""
+    for line in recurrence or []:
+        head, _, value = line.partition(':')
+        if head.split(';')[0].upper() == 'RRULE':
+            RecurrenceRule(value)
+
+
+def _utc_key(dt):
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+# ---------------- Master event helpers ----------------
+def _master_timezone(master_event):
+    start = master_event.get('start', {})
+    tz_name = start.get('timeZone')
+    if tz_name:
+        try:
+            return pytz.timezone(tz_name)
+        except pytz.UnknownTimeZoneError:
+            pass
+    dt_str = start.get('dateTime')
+    if dt_str:
+        parsed = datetime.fromisoformat(dt_str.replace('Z', '+00:00'))
+        if parsed.tzinfo:
+            return parsed.tzinfo
+    return pytz.timezone('Asia/Ho_Chi_Minh')
+
+
+def _master_times(master_event):
+    """(start, end có tz, all_day) của master"""
+    tz = _master_timezone(master_event)
+    start, end = master_event.get('start', {}), master_event.get('end', {})
+    if start.get('dateTime'):
+        start_dt = datetime.fromisoformat(start['dateTime'].replace('Z', '+00:00'))
+        end_dt = datetime.fromisoformat(end.get('dateTime', start['dateTime']).replace('Z', '+00:00'))
+        if start_dt.tzinfo is None:
+            start_dt, end_dt = _localize(tz, start_dt), _localize(tz, end_dt)
+        return start_dt, end_dt, False, tz
+    start_day = datetime.strptime(start['date'], '%Y-%m-%d')
+    end_day = datetime.strptime(end.get('date', start['date']), '%Y-%m-%d')
+    return _localize(tz, start_day), _localize(tz, end_day), True, tz
+
+
+def instance_id(master_id, start_dt, all_day=False):
+    """Id instance theo định dạng Google: <master>_YYYYMMDDTHHMMSSZ (cả ngày: <master>_YYYYMMDD)"""
+    if all_day:
+        return f"{master_id}_{start_dt.strftime('%Y%m%d')}"
+    return f"{master_id}_{start_dt.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}"
+
+
+class _Expansion:
+    __slots__ = ('starts', 'stamps', 'until', 'complete', 'end_offset', 'all_day', 'tz')
+
+    def __init__(self, starts, until, complete, end_offset, all_day, tz):
+        self.starts = starts
+        self.stamps = [s.timestamp() for s in starts]
+        self.until = until
+        self.complete = complete
+        self.end_offset = end_offset
+        self.all_day = all_day
+        self.tz = tz
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cache_key(master_event):
+    start = master_event.get('start', {})
+    end = master_event.get('end', {})
+    return (
+        master_event.get('id'), tuple(master_event.get('recurrence') or ()),
+        start.get('dateTime') or start.get('date'), start.get('timeZone'),
+        end.get('dateTime') or end.get('date')
+    )
+
+
+def _expansion(master_event, until_dt):
+    """Expand master (có cache); chỉ expand lại khi cần xa hơn lần trước"""
+    key = _cache_key(master_event)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None and (cached.complete or cached.until >= until_dt):
+            _cache.move_to_end(key)
+            return cached
+
+    start_dt, end_dt, all_day, tz = _master_times(master_event)
+    recurrence_set = RecurrenceSet(master_event.get('recurrence'), start_dt, tz)
+    if recurrence_set.is_bounded:
+        # COUNT/UNTIL: expand hết 1 lần (giới hạn 100 năm phòng rule không bao giờ khớp)
+        until_dt = start_dt + timedelta(days=366 * 100)
+    else:
+        # Luôn expand ít nhất tới horizon: các cửa sổ ngắn hơn sau đó dùng lại cache
+        until_dt = max(until_dt, default_until())
+    starts = recurrence_set.occurrences(until_dt)
+    expansion = _Expansion(starts, until_dt, recurrence_set.is_bounded, end_dt - start_dt, all_day, tz)
+
+    with _cache_lock:
+        _cache[key] = expansion
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return expansion
+
+
+def default_until():
+    """Bây giờ + RECURRENCE_HORIZON_DAYS, làm tròn lên nửa đêm UTC - giữ nguyên cả ngày để cache expand dùng lại được"""
+    horizon = datetime.now(timezone.utc) + timedelta(days=RECURRENCE_HORIZON_DAYS)
+    return datetime.combine(horizon.date() + timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc)
+
+
+def expand_occurrences(master_event, window_start=None, window_end=None):
+    """
+    Các buổi (start, end có tz) của master giao với [window_start, window_end)
+    window_end mặc định: bây giờ + RECURRENCE_HORIZON_DAYS
+    """
+    expansion = _expansion(master_event, window_end or default_until())
+    lo = 0
+    if window_start is not None:
+        lo = bisect.bisect_left(expansion.stamps, window_start.timestamp() - expansion.end_offset.total_seconds())
+    hi = len(expansion.stamps)
+    if window_end is not None or not expansion.complete:
+        # Rule có COUNT/UNTIL đã expand hết -> không cắt theo horizon
+        hi = bisect.bisect_left(expansion.stamps, (window_end or expansion.until).timestamp())
+    result = []
+    for start in expansion.starts[lo:hi]:
+        end = _occurrence_end(start, expansion)
+        if window_start is None or end > window_start:
+            result.append((start, end))
+    return result
+
+
+def expand_series(start, end, timezone_name, recurrence):
+    """
+    Các buổi (start, end có tz) của 1 lớp đề xuất (chưa tạo trên Google)
+    start/end: ISO (không có offset -> hiểu theo timezone_name), recurrence: list dòng RRULE/EXDATE
+    """
+    proposal = {
+        'start': {'dateTime': start, 'timeZone': timezone_name},
+        'end': {'dateTime': end, 'timeZone': timezone_name},
+        'recurrence': list(recurrence or [])
+    }
+    return expand_occurrences(proposal)
+
+
+def _occurrence_end(start, expansion):
+    """Giữ nguyên thời lượng theo giờ địa phương (qua DST vẫn đúng giờ kết thúc)"""
+    local_end = start.astimezone(expansion.tz).replace(tzinfo=None) + expansion.end_offset
+    return _localize(expansion.tz, local_end)
+
+
+def _recurrence_set(recurrence, dtstart):
+    """RecurrenceSet từ list dòng recurrence hoặc 1 chuỗi RRULE (có/không tiền tố 'RRULE:')"""
+    tz = dtstart.tzinfo or pytz.timezone('Asia/Ho_Chi_Minh')
+    if dtstart.tzinfo is None:
+        dtstart = _localize(tz, dtstart)
+    lines = recurrence if isinstance(recurrence, (list, tuple)) else [recurrence]
+    lines = [line if ':' in line else f'RRULE:{line}' for line in lines]
+    return RecurrenceSet(lines, dtstart, tz)
+
+
+def occurrences_until(recurrence, dtstart, until_dt):
+    """Các buổi (kể cả buổi tại until_dt) của rule bắt đầu từ dtstart"""
+    if until_dt.tzinfo is None:
+        until_dt = _localize(dtstart.tzinfo or pytz.timezone('Asia/Ho_Chi_Minh'), until_dt)
+    return _recurrence_set(recurrence, dtstart).occurrences(until_dt)
+
+
+def _format_time(dt, all_day, tz_name):
+    if all_day:
+        return {'date': dt.strftime('%Y-%m-%d')}
+    value = {'dateTime': dt.isoformat()}
+    if tz_name:
+        value['timeZone'] = tz_name
+    return value
+
+
+def materialize_instances(master_event, window_start=None, window_end=None):
+    """
+    Sinh các instance (dict giống Google trả về khi singleEvents=True) của master trong khoảng
+    Không áp dụng exception - mirror tự thay bằng exception đã sửa/huỷ
+    """
+    master_id = master_event.get('id')
+    tz_name = master_event.get('start', {}).get('timeZone')
+    all_day = 'dateTime' not in master_event.get('start', {})
+    instances = []
+    for start, end in expand_occurrences(master_event, window_start, window_end):
+        instance = {k: v for k, v in master_event.items() if k not in ('recurrence', 'id', 'start', 'end')}
+        instance['id'] = instance_id(master_id, start, all_day)
+        instance['recurringEventId'] = master_id
+        instance['start'] = _format_time(start, all_day, tz_name)
+        instance['end'] = _format_time(end, all_day, tz_name)
+        instance['originalStartTime'] = dict(instance['start'])
+        instances.append(instance)
+    return instances
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
@@ -3,9 +3,11 @@
 Utility functions for handling Google Calendar recurrence rules
 """
 import re
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import pytz
 
+from recurrence_engine import occurrences_until
+
 def parse_rrule_string(rrule_str):
     """
     Parse RRULE string into components
@@ -165,21 +167,20 @@ def update_recurrence_for_following_delete(master_event, delete_instance_start):
                 updated_rules.append(f'RRULE:{new_rrule_str}')
                 
             except ImportError:
-                # dateutil not available, use simple logic
-                print("⚠️ dateutil not available, using simple logic")
+                # dateutil not available, dùng recurrence_engine (expand cục bộ)
+                events_before = occurrences_until(rrule_str, master_start, delete_dt)
+                
+                if not events_before or (len(events_before) == 1 and events_before[0] == master_start):
+                    print("⚠️ No events before delete date, removing rule")
+                    continue
                 
                 if components['count']:
-                    # Simple: reduce count by half (fallback)
-                    components['count'] = max(1, components['count'] // 2)
-                    new_rrule_str = build_rrule_string(components)
-                    updated_rules.append(f'RRULE:{new_rrule_str}')
+                    components['count'] = len(events_before)
                 else:
-                    # Add UNTIL at delete date - 1 day
-                    until_dt = delete_dt - timedelta(days=1)
-                    until_str = until_dt.strftime('%Y%m%dT%H%M%SZ')
-                    components['until'] = until_str
-                    new_rrule_str = build_rrule_string(components)
-                    updated_rules.append(f'RRULE:{new_rrule_str}')
+                    last_event = events_before[-1].astimezone(timezone.utc)
+                    components['until'] = last_event.strftime('%Y%m%dT%H%M%SZ')
+                new_rrule_str = build_rrule_string(components)
+                updated_rules.append(f'RRULE:{new_rrule_str}')
             
             except Exception as e:
                 print(f"⚠️ Error processing RRULE: {e}")
@@ -224,29 +225,11 @@ def calculate_remaining_events(rrule_str, master_start, delete_dt):
         return len(events_before)
         
     except Exception:
-        # Fallback estimation
-        components = parse_rrule_string(rrule_str)
-        
-        if components['freq'] == 'DAILY':
-            days_diff = (delete_dt - master_start).days
-            if components.get('interval'):
-                return max(1, days_diff // components['interval'])
-            return max(1, days_diff)
-        
-        elif components['freq'] == 'WEEKLY':
-            weeks_diff = (delete_dt - master_start).days // 7
-            if components.get('interval'):
-                return max(1, weeks_diff // components['interval'])
-            return max(1, weeks_diff)
-        
-        elif components['freq'] == 'MONTHLY':
-            months_diff = (delete_dt.year - master_start.year) * 12 + (delete_dt.month - master_start.month)
-            if components.get('interval'):
-                return max(1, months_diff // components['interval'])
-            return max(1, months_diff)
-        
-        else:
-            # Default fallback
+        # Fallback: expand cục bộ bằng recurrence_engine (đếm chính xác, không ước lượng)
+        try:
+            return len(occurrences_until(rrule_str, master_start, delete_dt))
+        except Exception as e:
+            print(f"⚠️ Error expanding RRULE locally: {e}")
             return 1
         
 def stop_recurrence_at_instance(master_event, instance_start_str):
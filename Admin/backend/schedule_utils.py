@@ -0,0 +1,47 @@
+# backend/schedule_utils.py
+"""
+Helper chuẩn hoá dữ liệu lịch dùng chung (ai_agent, conflict_engine, ...)
+Không phụ thuộc Google/Gemini để các module tính toán import nhẹ.
+"""
+from datetime import datetime
+
+def normalize_teacher_name(teacher_name):
+    """Chuẩn hóa tên giáo viên để so sánh"""
+    if not teacher_name:
+        return ""
+    return ' '.join(teacher_name.strip().lower().split())
+
+def parse_iso_datetime_flexible(dt_str):
+    """Parse datetime linh hoạt, xử lý cả với và không có timezone"""
+    if not dt_str:
+        return None
+    
+    try:
+        # Xử lý string có Z
+        if dt_str.endswith('Z'):
+            dt_str = dt_str.replace('Z', '+00:00')
+        
+        # Nếu không có timezone, thêm timezone mặc định (Vietnam)
+        if 'T' in dt_str and '+' not in dt_str and '-' not in dt_str.split('T')[1]:
+            dt_str = dt_str + '+07:00'
+        
+        return datetime.fromisoformat(dt_str)
+    except ValueError as e:
+        print(f"❌ Error parsing datetime {dt_str}: {e}")
+        return None
+
+def extract_teacher_from_event(cls):
+    """Trích xuất teacher từ event - ưu tiên field teacher trước"""
+    # Ưu tiên field teacher
+    cls_teacher = cls.get('teacher', '')
+    if cls_teacher:
+        return cls_teacher
+    
+    # Fallback: extract từ summary
+    summary = cls.get('summary', '')
+    if ' - ' in summary:
+        parts = summary.split(' - ')
+        if len(parts) >= 2:
+            return parts[1].strip()
+    
+    return ""
@@ -0,0 +1,256 @@
+# backend/shard_router.py
+"""
+Chia lớp học ra N calendar (shard) để không calendar nào chạm giới hạn ghi của Google.
+
+CALENDAR_SHARDS: danh sách name=calendar_id, cách nhau bởi dấu phẩy
+(mặc định 2 calendar even/odd hiện có). CALENDAR_SHARD_KEY chọn khoá chia:
+- hour (mặc định): giờ bắt đầu % N - với 2 shard even,odd chính là chia chẵn/lẻ cũ
+- program / teacher: khoá mới được gán vào shard đang có ít khoá nhất
+
+Mỗi giá trị khoá (vd teacher:tom) được gán shard lần đầu gặp và lưu trong bảng
+shard_map cạnh extra data, nên thêm shard không làm xáo trộn lớp đã có. Đọc luôn
+fan-out song song trên mọi shard. Chuyển 1 khoá sang shard khác khi API vẫn chạy:
+
+    python shard_router.py show
+    python shard_router.py rebalance teacher:tom s3 [--dry-run]
+
+rebalance gán khoá sang shard mới trước (lớp tạo mới vào thẳng shard mới) rồi
+events.move từng lớp cũ (giữ nguyên event id). CLI chạy ở tiến trình riêng nên không
+chạm được vào mirror của API: API thấy các lớp đã chuyển ở lần poll delta tiếp theo
+(tối đa CALENDAR_MIRROR_POLL_SECONDS), chỉ mục vị trí tự sửa khi gặp 404.
+"""
+import argparse
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from googleapiclient.errors import HttpError
+
+from google_calendar import CALENDAR_EVEN, CALENDAR_ODD
+from calendar_backend import get_calendar_service
+from call_scheduler import calendar_calls
+from extra_store import extra_store
+from schedule_utils import extract_teacher_from_event, normalize_teacher_name
+
+CALENDAR_SHARDS = os.getenv("CALENDAR_SHARDS", f"even={CALENDAR_EVEN},odd={CALENDAR_ODD}")
+CALENDAR_SHARD_KEY = os.getenv("CALENDAR_SHARD_KEY", "hour").lower()
+# Không xác định được khoá (vd giờ sai định dạng) -> shard này (mặc định giống CALENDARS['default'] cũ)
+CALENDAR_DEFAULT_SHARD = os.getenv("CALENDAR_DEFAULT_SHARD", "odd")
+
+SHARD_KEYS = ('hour', 'program', 'teacher')
+ALL_SHARDS = ('both', 'all')
+
+
+def parse_shards(value):
+    """'even=<id>,odd=<id>' -> OrderedDict name -> calendar_id"""
+    shards = OrderedDict()
+    for part in value.split(','):
+        name, _, calendar_id = part.strip().partition('=')
+        if name.strip() and calendar_id.strip():
+            shards[name.strip()] = calendar_id.strip()
+    if not shards:
+        raise ValueError(f"CALENDAR_SHARDS has no name=calendar_id entries: {value!r}")
+    return shards
+
+
+def _start_hour(dt_str):
+    """Giờ bắt đầu theo đúng chuỗi gửi lên (có offset thì giờ địa phương đó, Z thì UTC)"""
+    if not dt_str:
+        return None
+    try:
+        return datetime.fromisoformat(dt_str.replace('Z', '+00:00')).hour
+    except ValueError:
+        return None
+
+
+def _description_field(event, label):
+    """Giá trị dòng '<label>: ...' trong description do build_event_body tạo"""
+    prefix = f"{label}:"
+    for line in (event.get('description') or '').splitlines():
+        if line.startswith(prefix):
+            return line[len(prefix):].strip()
+    return ''
+
+
+class ShardRouter:
+    def __init__(self, shards, key_kind=CALENDAR_SHARD_KEY, store=extra_store,
+                 default_shard=CALENDAR_DEFAULT_SHARD):
+        if key_kind not in SHARD_KEYS:
+            raise ValueError(f"Unknown CALENDAR_SHARD_KEY: {key_kind} ({' | '.join(SHARD_KEYS)})")
+        self.shards = OrderedDict(shards)
+        self.key_kind = key_kind
+        self.store = store
+        self.default_shard = default_shard if default_shard in self.shards else next(iter(self.shards))
+        self._names_by_id = {calendar_id: name for name, calendar_id in self.shards.items()}
+        self._assign_lock = threading.Lock()
+
+    # ---------------- Shards ----------------
+    def names(self):
+        return list(self.shards)
+
+    def calendar_ids(self):
+        return list(self.shards.values())
+
+    def name_of(self, calendar_id):
+        return self._names_by_id.get(calendar_id, 'unknown')
+
+    def resolve(self, calendar_type='both'):
+        """'both'/'all' -> mọi shard; 'odd' hoặc 'odd,s2' -> các shard đó (tên không có thì bỏ qua)"""
+        if calendar_type in ALL_SHARDS:
+            return self.calendar_ids()
+        names = [n.strip() for n in (calendar_type or '').split(',')]
+        return [self.shards[n] for n in dict.fromkeys(names) if n in self.shards]
+
+    # ---------------- Khoá ----------------
+    def key_for_class(self, class_info):
+        """Khoá shard của lớp từ form (class_info) - None nếu không xác định được"""
+        if self.key_kind == 'hour':
+            hour = _start_hour(class_info.get('start', ''))
+            return f"hour:{hour}" if hour is not None else None
+        if self.key_kind == 'teacher':
+            return f"teacher:{normalize_teacher_name(class_info.get('teacher', ''))}"
+        return f"program:{' '.join((class_info.get('program') or '').lower().split())}"
+
+    def key_for_event(self, event):
+        """Khoá shard của event đã có trên Google (dùng khi rebalance)"""
+        if self.key_kind == 'hour':
+            return self.key_for_class({'start': (event.get('start') or {}).get('dateTime', '')})
+        if self.key_kind == 'teacher':
+            teacher = _description_field(event, 'Teacher') or extract_teacher_from_event(event)
+            return self.key_for_class({'teacher': teacher})
+        return self.key_for_class({'program': _description_field(event, 'Program')})
+
+    def _initial_shard(self, shard_key):
+        names = self.names()
+        if self.key_kind == 'hour':
+            return names[int(shard_key.split(':', 1)[1]) % len(names)]
+        # program/teacher: shard đang có ít khoá nhất (cùng số khoá -> theo thứ tự cấu hình)
+        counts = self.store.shard_key_counts()
+        return min(names, key=lambda name: counts.get(name, 0))
+
+    def shard_for_key(self, shard_key):
+        if shard_key is None:
+            return self.default_shard
+        shard = self.store.get_shard(shard_key)
+        if shard in self.shards:
+            return shard
+        with self._assign_lock:
+            if shard is not None:
+                # Shard cũ đã bị bỏ khỏi CALENDAR_SHARDS -> gán lại
+                print(f"⚠️ Shard '{shard}' of {shard_key} is not configured, reassigning")
+                shard = self.store.assign_shard(shard_key, self._initial_shard(shard_key))
+            else:
+                shard = self.store.assign_shard(shard_key, self._initial_shard(shard_key), only_if_absent=True)
+        print(f"🧩 Shard key {shard_key} -> {shard}")
+        return shard
+
+    def route(self, class_info):
+        """Calendar cho lớp (tạo mới/cập nhật)"""
+        shard = self.shard_for_key(self.key_for_class(class_info))
+        print(f"🧩 Routed to shard {shard.upper()} (key: {self.key_kind})")
+        return self.shards[shard]
+
+    def stats(self):
+        return {
+            'key': self.key_kind,
+            'shards': self.names(),
+            'assigned_keys': self.store.shard_key_counts()
+        }
+
+
+shard_router = ShardRouter(parse_shards(CALENDAR_SHARDS))
+
+
+# ---------------- Rebalance (CLI) ----------------
+def _iter_series(calendar_id):
+    """Master + event đơn (không gồm exception - move master là chuyển cả series)"""
+    page_token = None
+    while True:
+        page = calendar_calls.execute(get_calendar_service().events().list(
+            calendarId=calendar_id, singleEvents=False, showDeleted=False,
+            maxResults=2500, pageToken=page_token
+        ))
+        for event in page.get('items', []):
+            if event.get('status') != 'cancelled' and not event.get('recurringEventId'):
+                yield event
+        page_token = page.get('nextPageToken')
+        if not page_token:
+            return
+
+
+def rebalance(shard_key, target, router=shard_router, dry_run=False):
+    """
+    Chuyển mọi lớp có khoá shard_key sang shard target khi API vẫn chạy
+    Trả về {'moved': [...], 'failed': [...]} (dry_run: chỉ liệt kê, không gán/chuyển)
+    """
+    if target not in router.shards:
+        raise ValueError(f"Unknown shard: {target} (configured: {', '.join(router.names())})")
+    if not shard_key.startswith(f"{router.key_kind}:"):
+        raise ValueError(f"Shard key must look like {router.key_kind}:<value> (CALENDAR_SHARD_KEY={router.key_kind})")
+
+    target_id = router.shards[target]
+    if not dry_run:
+        # Gán trước: lớp tạo mới trong lúc đang chuyển vào thẳng shard mới
+        router.store.assign_shard(shard_key, target)
+
+    moved, failed = [], []
+    for name, calendar_id in router.shards.items():
+        if name == target:
+            continue
+        for event in _iter_series(calendar_id):
+            if router.key_for_event(event) != shard_key:
+                continue
+            item = {'id': event['id'], 'summary': event.get('summary', ''), 'from': name, 'to': target}
+            if dry_run:
+                moved.append(item)
+                continue
+            try:
+                calendar_calls.execute(get_calendar_service().events().move(
+                    calendarId=calendar_id, eventId=event['id'], destination=target_id
+                ))
+            except HttpError as e:
+                print(f"❌ Move {event['id']} {name} -> {target} failed: {e}")
+                failed.append(dict(item, error=str(e)))
+                continue
+            extra = router.store.get(event['id'])
+            if extra is not None:
+                router.store.upsert(event['id'], dict(extra, calendar_id=target_id))
+            print(f"🚚 Moved {event['id']} ({item['summary']}) {name} -> {target}")
+            moved.append(item)
+    return {'moved': moved, 'failed': failed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calendar shard map / rebalance")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('show', help="shards + shard map")
+    assign = commands.add_parser('assign', help="gán khoá cho shard (chỉ lớp tạo mới)")
+    assign.add_argument('shard_key')
+    assign.add_argument('shard')
+    move = commands.add_parser('rebalance', help="gán khoá cho shard và chuyển các lớp đã có")
+    move.add_argument('shard_key')
+    move.add_argument('shard')
+    move.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args(argv)
+
+    router = shard_router
+    if args.command == 'show':
+        print(f"Shard key: {router.key_kind}")
+        for name, calendar_id in router.shards.items():
+            print(f"  {name}: {calendar_id}")
+        for shard_key, shard in router.store.shard_map().items():
+            print(f"  {shard_key} -> {shard}")
+    elif args.command == 'assign':
+        if args.shard not in router.shards:
+            parser.error(f"unknown shard {args.shard}")
+        router.store.assign_shard(args.shard_key, args.shard)
+        print(f"✅ {args.shard_key} -> {args.shard}")
+    else:
+        result = rebalance(args.shard_key, args.shard, router, dry_run=args.dry_run)
+        verb = "Would move" if args.dry_run else "Moved"
+        print(f"✅ {verb} {len(result['moved'])} classes to {args.shard}, {len(result['failed'])} failed")
+
+
+if __name__ == '__main__':
+    main()
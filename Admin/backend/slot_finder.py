@@ -0,0 +1,168 @@
+# backend/slot_finder.py
+"""
+Tìm khung giờ trống cho lớp học mà không cần gọi AI.
+
+Gộp các khoảng bận (của 1 giáo viên hoặc của mọi giáo viên) thành danh sách
+không chồng nhau đã sort, rồi quét từng ngày trong giờ làm việc (theo múi giờ
+của lớp) để lấy các khoảng trống đủ dài. Ưu tiên các giờ trong preferred_times,
+sau đó tới slot sớm nhất; trả về top N slot.
+"""
+import os
+import re
+from datetime import datetime, timedelta, time as dt_time
+
+import pytz
+
+from event_record import as_record
+from schedule_utils import normalize_teacher_name
+
+WORK_START_HOUR = int(os.getenv("SLOT_WORK_START_HOUR", "8"))
+WORK_END_HOUR = int(os.getenv("SLOT_WORK_END_HOUR", "18"))
+SLOT_STEP_MINUTES = int(os.getenv("SLOT_STEP_MINUTES", "30"))
+SEARCH_DAYS = int(os.getenv("SLOT_SEARCH_DAYS", "14"))
+DEFAULT_TOP_N = 3
+
+TIME_PATTERN = re.compile(r'^\s*(\d{1,2})(?::(\d{2}))?\s*$')
+
+
+def parse_preferred_times(preferred_times):
+    """
+    "09:00" | "14" | "09:00-11:00" (list hoặc chuỗi cách nhau bởi dấu phẩy)
+    -> [(phút bắt đầu, phút kết thúc)] trong ngày; giờ đơn lẻ = đúng giờ đó
+    """
+    if not preferred_times:
+        return []
+    if isinstance(preferred_times, str):
+        preferred_times = preferred_times.split(',')
+    ranges = []
+    for item in preferred_times:
+        parts = str(item).split('-')
+        minutes = []
+        for part in parts[:2]:
+            match = TIME_PATTERN.match(part)
+            if not match:
+                break
+            minutes.append(int(match.group(1)) * 60 + int(match.group(2) or 0))
+        if len(minutes) == 1:
+            ranges.append((minutes[0], minutes[0]))
+        elif len(minutes) == 2:
+            ranges.append((minutes[0], minutes[1]))
+        else:
+            print(f"⚠️ Ignoring invalid preferred time: {item}")
+    return ranges
+
+
+def merge_busy_intervals(existing_classes, teacher=None):
+    """Các khoảng bận [start_ts, end_ts) đã gộp, sort theo start"""
+    target = normalize_teacher_name(teacher) if teacher else None
+    intervals = []
+    for event in existing_classes:
+        record = as_record(event)
+        if not record.is_visible or not record.timed:
+            continue
+        if target is not None and record.teacher != target:
+            continue
+        intervals.append((record.start_ts, record.end_ts))
+    intervals.sort()
+
+    merged = []
+    for start, end in intervals:
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _is_preferred(local_start, preferred_ranges):
+    minute = local_start.hour * 60 + local_start.minute
+    return any(lo <= minute <= hi for lo, hi in preferred_ranges)
+
+
+def _day_candidates(day, tz, busy, busy_pos, duration, step):
+    """
+    Các slot trống trong giờ làm việc của 1 ngày; busy_pos là con trỏ quét
+    (các ngày đi tới theo thứ tự nên con trỏ chỉ tiến) - trả về (slots, busy_pos mới)
+    """
+    window_start = tz.localize(datetime.combine(day, dt_time(WORK_START_HOUR)))
+    window_end = tz.localize(datetime.combine(day, dt_time(0)) + timedelta(hours=WORK_END_HOUR))
+    window_start_ts, window_end_ts = window_start.timestamp(), window_end.timestamp()
+
+    # Bỏ các khoảng bận đã kết thúc trước ngày này
+    while busy_pos < len(busy) and busy[busy_pos][1] <= window_start_ts:
+        busy_pos += 1
+
+    slots = []
+    cursor = window_start_ts
+    position = busy_pos
+    while cursor + duration <= window_end_ts:
+        if position < len(busy) and busy[position][0] < cursor + duration:
+            # Slot đang xét chạm khoảng bận -> nhảy tới cuối khoảng bận (làm tròn theo step)
+            if busy[position][1] > cursor:
+                offset = busy[position][1] - window_start_ts
+                cursor = window_start_ts + -(-offset // step) * step
+            position += 1
+            continue
+        slots.append(cursor)
+        cursor += step
+    return slots, busy_pos
+
+
+def find_free_slots(existing_classes, teacher=None, duration_hours=1, preferred_times=None,
+                    timezone_name='Asia/Ho_Chi_Minh', start_from=None, days=SEARCH_DAYS,
+                    top_n=DEFAULT_TOP_N, include_weekends=False):
+    """
+    Top N khung giờ trống (dict start/end ISO theo giờ địa phương, không có offset - giống gợi ý của AI)
+    teacher=None: tránh lịch của mọi giáo viên
+    """
+    try:
+        tz = pytz.timezone(timezone_name)
+    except pytz.UnknownTimeZoneError:
+        print(f"⚠️ Unknown timezone {timezone_name}, using Asia/Ho_Chi_Minh")
+        tz = pytz.timezone('Asia/Ho_Chi_Minh')
+
+    duration = float(duration_hours) * 3600
+    step = SLOT_STEP_MINUTES * 60
+    preferred_ranges = parse_preferred_times(preferred_times)
+    busy = merge_busy_intervals(existing_classes, teacher)
+
+    now = start_from or datetime.now(tz)
+    if now.tzinfo is None:
+        now = tz.localize(now)
+    now_ts = now.timestamp()
+    first_day = now.astimezone(tz).date()
+
+    preferred, others = [], []
+    busy_pos = 0
+    for offset in range(days):
+        day = first_day + timedelta(days=offset)
+        if not include_weekends and day.weekday() >= 5:
+            continue
+        day_slots, busy_pos = _day_candidates(day, tz, busy, busy_pos, duration, step)
+        for slot_ts in day_slots:
+            if slot_ts < now_ts:
+                continue
+            local_start = datetime.fromtimestamp(slot_ts, tz)
+            if preferred_ranges and _is_preferred(local_start, preferred_ranges):
+                preferred.append(slot_ts)
+            elif len(others) < top_n:
+                others.append(slot_ts)
+        # Đủ slot tốt nhất rồi thì dừng sớm
+        if len(preferred) >= top_n or (not preferred_ranges and len(others) >= top_n):
+            break
+
+    chosen = (preferred + others)[:top_n]
+    slots = []
+    for slot_ts in chosen:
+        local_start = datetime.fromtimestamp(slot_ts, tz)
+        local_end = datetime.fromtimestamp(slot_ts + duration, tz)
+        slots.append({
+            'start': local_start.replace(tzinfo=None).isoformat(),
+            'end': local_end.replace(tzinfo=None).isoformat(),
+            'timezone': tz.zone,
+            'preferred': bool(preferred_ranges) and _is_preferred(local_start, preferred_ranges)
+        })
+    print(f"🧮 Slot finder: {len(busy)} busy intervals, {len(slots)} free slots "
+          f"for {teacher or 'all teachers'} ({duration_hours}h)")
+    return slots
@@ -0,0 +1,160 @@
+import sys
+import os
+
+# Thêm thư mục hiện tại vào path để import
+sys.path.append(os.path.dirname(__file__))
+
+import pytest
+from googleapiclient.errors import HttpError
+
+from calendar_backend import LocalCalendarBackend, MemoryEventStore, SqliteEventStore, BackendService, EventBackend
+
+CAL = 'cal-a@test'
+OTHER = 'cal-b@test'
+TZ = 'Asia/Ho_Chi_Minh'
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def backend(request, tmp_path):
+    if request.param == 'memory':
+        return LocalCalendarBackend(MemoryEventStore(), 'memory')
+    return LocalCalendarBackend(SqliteEventStore(tmp_path / 'calendar.db'), 'sqlite')
+
+
+def _body(summary, start, end, recurrence=None):
+    body = {
+        'summary': summary,
+        'start': {'dateTime': start, 'timeZone': TZ},
+        'end': {'dateTime': end, 'timeZone': TZ}
+    }
+    if recurrence:
+        body['recurrence'] = recurrence
+    return body
+
+
+def _status(error_info):
+    return error_info.value.resp.status
+
+
+def _weekly(backend, count=3):
+    return backend.insert(CAL, _body('Weekly', '2026-11-02T10:00:00+07:00', '2026-11-02T11:00:00+07:00',
+                                     [f'RRULE:FREQ=WEEKLY;COUNT={count}']))
+
+
+def test_insert_get_delete(backend):
+    event = backend.insert(CAL, _body('A', '2026-11-02T10:00:00+07:00', '2026-11-02T11:00:00+07:00'))
+    assert backend.get(CAL, event['id'])['summary'] == 'A'
+    with pytest.raises(HttpError) as error:
+        backend.insert(CAL, dict(_body('A', '2026-11-02T10:00:00+07:00', '2026-11-02T11:00:00+07:00'), id=event['id']))
+    assert _status(error) == 409
+    backend.delete(CAL, event['id'])
+    with pytest.raises(HttpError) as error:
+        backend.get(CAL, event['id'])
+    assert _status(error) == 404
+    with pytest.raises(HttpError) as error:
+        backend.delete(CAL, event['id'])
+    assert _status(error) == 410
+
+
+def test_single_events_expansion_and_window(backend):
+    master = _weekly(backend)
+    items = backend.list(CAL, singleEvents=True, orderBy='startTime')['items']
+    assert [i['id'] for i in items] == [f"{master['id']}_{d}T030000Z" for d in ('20261102', '20261109', '20261116')]
+    window = backend.list(CAL, singleEvents=True, timeMin='2026-11-05T00:00:00Z', timeMax='2026-11-12T00:00:00Z')
+    assert [i['start']['dateTime'] for i in window['items']] == ['2026-11-09T10:00:00+07:00']
+    # singleEvents=False: chỉ có master
+    assert [i['id'] for i in backend.list(CAL)['items']] == [master['id']]
+
+
+def test_instance_patch_and_delete_become_exceptions(backend):
+    master = _weekly(backend)
+    second = f"{master['id']}_20261109T030000Z"
+    third = f"{master['id']}_20261116T030000Z"
+    backend.patch(CAL, second, {'summary': 'Moved'})
+    backend.delete(CAL, third)
+    items = backend.list(CAL, singleEvents=True, orderBy='startTime')['items']
+    assert [(i['id'], i['summary']) for i in items] == [
+        (f"{master['id']}_20261102T030000Z", 'Weekly'), (second, 'Moved')
+    ]
+    with pytest.raises(HttpError) as error:
+        backend.move(CAL, second, OTHER)
+    assert _status(error) == 400
+
+
+def test_sync_token_delta(backend):
+    first = backend.list(CAL, singleEvents=True)
+    event = backend.insert(CAL, _body('A', '2026-11-02T10:00:00+07:00', '2026-11-02T11:00:00+07:00'))
+    delta = backend.list(CAL, singleEvents=True, syncToken=first['nextSyncToken'])
+    assert [i['id'] for i in delta['items']] == [event['id']]
+    backend.delete(CAL, event['id'])
+    delta = backend.list(CAL, singleEvents=True, syncToken=delta['nextSyncToken'])
+    assert [(i['id'], i['status']) for i in delta['items']] == [(event['id'], 'cancelled')]
+    with pytest.raises(HttpError) as error:
+        backend.list(CAL, syncToken='999999')
+    assert _status(error) == 410
+
+
+def test_shortening_series_cancels_dropped_instances(backend):
+    master = _weekly(backend)
+    token = backend.list(CAL, singleEvents=True)['nextSyncToken']
+    backend.patch(CAL, master['id'], {'recurrence': ['RRULE:FREQ=WEEKLY;COUNT=1']})
+    delta = backend.list(CAL, singleEvents=True, syncToken=token)['items']
+    cancelled = sorted(i['id'] for i in delta if i['status'] == 'cancelled')
+    assert cancelled == [f"{master['id']}_20261109T030000Z", f"{master['id']}_20261116T030000Z"]
+
+
+def test_move_keeps_id(backend):
+    master = _weekly(backend)
+    moved = backend.move(CAL, master['id'], OTHER)
+    assert moved['id'] == master['id']
+    assert backend.list(CAL, singleEvents=True)['items'] == []
+    assert len(backend.list(OTHER, singleEvents=True)['items']) == 3
+
+
+def test_paging(backend):
+    for day in range(1, 6):
+        backend.insert(CAL, _body(f'C{day}', f'2026-11-0{day}T10:00:00+07:00', f'2026-11-0{day}T11:00:00+07:00'))
+    first = backend.list(CAL, maxResults=3)
+    second = backend.list(CAL, maxResults=3, pageToken=first['nextPageToken'])
+    assert [i['summary'] for i in first['items'] + second['items']] == [f'C{d}' for d in range(1, 6)]
+    assert 'nextSyncToken' in second and 'nextPageToken' not in second
+
+
+def test_invalid_recurrence_is_rejected(backend):
+    with pytest.raises(HttpError) as error:
+        backend.insert(CAL, _body('Hourly', '2026-11-02T10:00:00+07:00', '2026-11-02T11:00:00+07:00',
+                                  ['RRULE:FREQ=HOURLY;COUNT=3']))
+    assert _status(error) == 400
+
+
+def test_service_batch(backend):
+    service = BackendService(backend)
+    results = {}
+    batch = service.new_batch_http_request(callback=lambda rid, resp, err: results.update({rid: (resp, err)}))
+    batch.add(service.events().insert(calendarId=CAL, body=_body('A', '2026-11-02T10:00:00+07:00',
+                                                                  '2026-11-02T11:00:00+07:00')), request_id='ok')
+    batch.add(service.events().get(calendarId=CAL, eventId='missing'), request_id='missing')
+    batch.execute()
+    assert results['ok'][1] is None and results['ok'][0]['summary'] == 'A'
+    assert results['missing'][1].resp.status == 404
+
+
+def test_incomplete_backend_fails_on_creation():
+    class Partial(EventBackend):
+        def list(self, calendar_id, **params):
+            return {}
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def test_sqlite_workers_share_sync_sequence(tmp_path):
+    # 2 worker cùng 1 file DB: seq cấp trong DB nên delta của worker này thấy ghi của worker kia
+    first = LocalCalendarBackend(SqliteEventStore(tmp_path / 'calendar.db'), 'sqlite')
+    second = LocalCalendarBackend(SqliteEventStore(tmp_path / 'calendar.db'), 'sqlite')
+    token = first.list(CAL)['nextSyncToken']
+    a = first.insert(CAL, _body('A', '2026-11-02T10:00:00+07:00', '2026-11-02T11:00:00+07:00'))
+    b = second.insert(CAL, _body('B', '2026-11-03T10:00:00+07:00', '2026-11-03T11:00:00+07:00'))
+    delta = first.list(CAL, syncToken=token)
+    assert sorted(i['id'] for i in delta['items']) == sorted([a['id'], b['id']])
+    assert delta['nextSyncToken'] == second.list(CAL)['nextSyncToken'] == str(int(token) + 2)
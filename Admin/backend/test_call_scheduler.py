@@ -0,0 +1,117 @@
+import sys
+import os
+
+# Thêm thư mục hiện tại vào path để import
+sys.path.append(os.path.dirname(__file__))
+
+import json
+
+import pytest
+from googleapiclient.errors import HttpError
+from httplib2 import Response
+
+import call_scheduler
+from call_scheduler import CallScheduler, is_idempotent
+
+URI = 'https://www.googleapis.com/calendar/v3/calendars/cal-a%40test/events'
+
+
+def _error(status):
+    return HttpError(Response({'status': status}), b'{}')
+
+
+class FakeRequest:
+    def __init__(self, method='GET', body=None, failures=0, status=503):
+        self.method = method
+        self.body = json.dumps(body) if body is not None else None
+        self.uri = URI
+        self.failures = failures
+        self.status = status
+        self.calls = 0
+
+    def execute(self, num_retries=0):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise _error(self.status)
+        return {'ok': self.calls}
+
+
+class FakeBatch:
+    def __init__(self, callback, fail_whole=None):
+        self.callback = callback
+        self.fail_whole = fail_whole
+        self.items = []
+
+    def add(self, request, request_id):
+        self.items.append((request_id, request))
+
+    def execute(self):
+        if self.fail_whole is not None and self.fail_whole(self.items):
+            raise _error(400)
+        for request_id, request in self.items:
+            try:
+                self.callback(request_id, request.execute(), None)
+            except HttpError as e:
+                self.callback(request_id, None, e)
+
+
+class FakeService:
+    def __init__(self, fail_whole=None):
+        self.fail_whole = fail_whole
+
+    def new_batch_http_request(self, callback):
+        return FakeBatch(callback, self.fail_whole)
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(call_scheduler.time, 'sleep', lambda seconds: None)
+
+
+def test_idempotent_methods():
+    assert is_idempotent(FakeRequest('GET'))
+    assert is_idempotent(FakeRequest('PATCH', {'summary': 'x'}))
+    assert is_idempotent(FakeRequest('POST', {'id': 'abc', 'summary': 'x'}))
+    assert not is_idempotent(FakeRequest('POST', {'summary': 'x'}))
+    assert not is_idempotent(FakeRequest('POST'))
+
+
+def test_insert_without_client_id_is_not_retried_on_5xx():
+    request = FakeRequest('POST', {'summary': 'x'}, failures=1)
+    with pytest.raises(HttpError):
+        CallScheduler(enforce_quota=False).execute(request)
+    assert request.calls == 1
+
+
+def test_insert_with_client_id_and_rate_limit_are_retried():
+    scheduler = CallScheduler(enforce_quota=False)
+    with_id = FakeRequest('POST', {'id': 'abc'}, failures=1)
+    assert scheduler.execute(with_id) == {'ok': 2}
+    rate_limited = FakeRequest('POST', {'summary': 'x'}, failures=1, status=429)
+    assert scheduler.execute(rate_limited) == {'ok': 2}
+
+
+def test_batch_retries_only_safe_items():
+    safe = FakeRequest('DELETE', failures=1)
+    unsafe = FakeRequest('POST', {'summary': 'x'}, failures=1)
+    results = CallScheduler(enforce_quota=False).execute_batch(FakeService(), [('safe', safe), ('unsafe', unsafe)], 50)
+    assert results['safe'] == ({'ok': 2}, None)
+    assert results['unsafe'][1].resp.status == 503 and unsafe.calls == 1
+
+
+def test_batch_reports_items_resent_after_5xx():
+    retried = set()
+    requests = [('5xx', FakeRequest('DELETE', failures=1)),
+                ('429', FakeRequest('DELETE', failures=1, status=429)),
+                ('ok', FakeRequest('DELETE'))]
+    CallScheduler(enforce_quota=False).execute_batch(FakeService(), requests, 50, retried)
+    assert retried == {'5xx'}
+
+
+def test_failed_chunk_keeps_earlier_results():
+    requests = [(str(i), FakeRequest('GET')) for i in range(4)]
+    # Lô thứ 2 (item 2, 3) lỗi 400 cả lô
+    service = FakeService(fail_whole=lambda items: items[0][0] == '2')
+    results = CallScheduler(enforce_quota=False).execute_batch(service, requests, 2)
+    assert [results[str(i)][1] is None for i in range(4)] == [True, True, False, False]
+    assert results['2'][1].resp.status == 400
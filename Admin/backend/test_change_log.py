@@ -0,0 +1,44 @@
+import sys
+import os
+
+# Thêm thư mục hiện tại vào path để import
+sys.path.append(os.path.dirname(__file__))
+
+from types import SimpleNamespace
+
+from change_log import ChangeLog
+
+
+def _records(*ids):
+    return [SimpleNamespace(id=event_id) for event_id in ids]
+
+
+def test_changes_are_scoped_to_calendars():
+    log = ChangeLog()
+    token = log.token()
+    log.record('odd', _records('a'), [])
+    log.record('even', _records('b'), ['c'])
+    log.record('odd', _records('a'), [])
+    assert log.changed_since(token, {'odd'})[0] == ['a']
+    assert log.changed_since(token, {'even'})[0] == ['b', 'c']
+    assert log.changed_since(token)[0] == ['b', 'c', 'a']
+
+
+def test_reset_only_affects_its_calendar():
+    log = ChangeLog()
+    log.record('odd', _records('a'), [])
+    token = log.token()
+    log.record('even', _records(*'bcdef'), [], reset=True)
+    assert log.stats()['entries'] == 1
+    assert log.changed_since(token, {'even'})[0] is None
+    assert log.changed_since(token, {'odd'})[0] == []
+    # Token lấy sau lần reset vẫn dùng được
+    assert log.changed_since(log.token(), {'even'})[0] == []
+
+
+def test_expired_tokens():
+    log = ChangeLog(max_entries=2)
+    token = log.token()
+    log.record('odd', _records('a', 'b', 'c'), [])
+    assert log.changed_since(token)[0] is None
+    assert log.changed_since('other-epoch.1')[0] is None
@@ -13,7 +13,7 @@ def test_with_real_data():
     from calendar_crud import list_events
     
     # Lấy events thực tế từ Google Calendar
-    real_events = list_events()
+    real_events = list(list_events())
     print(f"📅 Found {len(real_events)} real events")
     
     if len(real_events) > 0:
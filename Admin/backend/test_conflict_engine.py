@@ -0,0 +1,72 @@
+import sys
+import os
+
+# Thêm thư mục hiện tại vào path để import
+sys.path.append(os.path.dirname(__file__))
+
+from datetime import datetime, timedelta, timezone
+
+from conflict_engine import TeacherIntervalIndex
+
+BASE = datetime(2026, 11, 2, 3, 0, tzinfo=timezone.utc)
+
+
+def _event(event_id, teacher, start_hours, duration_hours):
+    start = BASE + timedelta(hours=start_hours)
+    end = start + timedelta(hours=duration_hours)
+    return {
+        'id': event_id,
+        'summary': event_id,
+        'teacher': teacher,
+        'start': {'dateTime': start.isoformat()},
+        'end': {'dateTime': end.isoformat()}
+    }
+
+
+def _range(start_hours, duration_hours):
+    start = (BASE + timedelta(hours=start_hours)).timestamp()
+    return start, start + duration_hours * 3600
+
+
+def _ids(overlaps):
+    return [[r.id for r in group] for group in overlaps]
+
+
+def test_sweep_matches_single_lookups():
+    index = TeacherIntervalIndex.from_events([
+        _event('a', 'Tom', 0, 1), _event('b', 'Tom', 2, 1), _event('c', 'Tom', 24, 3),
+        _event('d', 'Ann', 0, 5)
+    ])
+    ranges = [_range(0.5, 1), _range(1, 0.5), _range(25, 1), _range(48, 1)]
+    single = [[r.id for r in index.find_overlaps('Tom', start, end)] for start, end in ranges]
+    assert _ids(index.find_series_overlaps('Tom', ranges)) == single == [['a'], [], ['c'], []]
+
+
+def test_sweep_short_range_after_long_range():
+    # Khoảng dài đẩy con trỏ hi qua 'b'; khoảng ngắn ngay sau không được báo trùng 'b'
+    index = TeacherIntervalIndex.from_events([_event('a', 'Tom', 0, 1), _event('b', 'Tom', 5, 1)])
+    overlaps = index.find_series_overlaps('Tom', [_range(0, 8), _range(0.5, 1)])
+    assert _ids(overlaps) == [['a', 'b'], ['a']]
+
+
+def test_sweep_excludes_edited_series():
+    index = TeacherIntervalIndex()
+    instance = dict(_event('m_1', 'Tom', 0, 1), recurringEventId='m')
+    index.upsert(instance)
+    index.upsert(_event('x', 'Tom', 0, 1))
+    overlaps = index.find_series_overlaps('Tom', [_range(0, 1)], exclude_event_id='m')
+    assert _ids(overlaps) == [['x']]
+
+
+def test_remove_recomputes_max_duration():
+    index = TeacherIntervalIndex.from_events([_event('long', 'Tom', 0, 10), _event('short', 'Tom', 20, 1)])
+    index.remove('long')
+    assert index.find_overlaps('Tom', *_range(0, 30)) and len(index) == 1
+    assert index._by_teacher['tom'].max_duration == 3600
+
+
+def test_touching_ranges_do_not_conflict():
+    index = TeacherIntervalIndex.from_events([_event('a', 'Tom', 0, 1)])
+    assert index.find_overlaps('Tom', *_range(1, 1)) == []
+    assert index.check('Tom', (BASE + timedelta(minutes=30)).isoformat(),
+                       (BASE + timedelta(hours=2)).isoformat())['has_conflict']
@@ -0,0 +1,106 @@
+import sys
+import os
+
+# Thêm thư mục hiện tại vào path để import
+sys.path.append(os.path.dirname(__file__))
+
+import time
+
+import pytest
+
+from recurrence_engine import expand_series, materialize_instances, occurrences_until, clear_cache
+import recurrence_engine
+
+TZ = 'Asia/Ho_Chi_Minh'
+
+
+def _starts(rrules, start='2026-10-20T10:00:00', end='2026-10-20T11:30:00', timezone_name=TZ):
+    return [s.isoformat() for s, _ in expand_series(start, end, timezone_name, rrules)]
+
+
+def test_count():
+    assert _starts(['RRULE:FREQ=DAILY;COUNT=3']) == [
+        '2026-10-20T10:00:00+07:00', '2026-10-21T10:00:00+07:00', '2026-10-22T10:00:00+07:00'
+    ]
+
+
+def test_until_is_inclusive():
+    starts = _starts(['RRULE:FREQ=WEEKLY;UNTIL=20261103T030000Z'])
+    assert starts == ['2026-10-20T10:00:00+07:00', '2026-10-27T10:00:00+07:00', '2026-11-03T10:00:00+07:00']
+
+
+def test_weekly_byday_and_interval():
+    # 20/10/2026 là thứ Ba: buổi đầu là chính dtstart, sau đó T5, rồi cách 1 tuần
+    starts = _starts(['RRULE:FREQ=WEEKLY;INTERVAL=2;BYDAY=TU,TH;COUNT=4'])
+    assert starts == [
+        '2026-10-20T10:00:00+07:00', '2026-10-22T10:00:00+07:00',
+        '2026-11-03T10:00:00+07:00', '2026-11-05T10:00:00+07:00'
+    ]
+
+
+def test_monthly_last_friday():
+    starts = _starts(['RRULE:FREQ=MONTHLY;BYDAY=-1FR;COUNT=3'])
+    assert starts == ['2026-10-30T10:00:00+07:00', '2026-11-27T10:00:00+07:00', '2026-12-25T10:00:00+07:00']
+
+
+def test_exdate_removed_after_count():
+    # COUNT tính trước khi bỏ EXDATE (RFC 5545)
+    starts = _starts(['RRULE:FREQ=DAILY;COUNT=3', 'EXDATE;TZID=Asia/Ho_Chi_Minh:20261021T100000'])
+    assert starts == ['2026-10-20T10:00:00+07:00', '2026-10-22T10:00:00+07:00']
+
+
+def test_keeps_local_time_across_dst():
+    starts = _starts(['RRULE:FREQ=WEEKLY;COUNT=3'], '2026-10-19T09:00:00', '2026-10-19T10:00:00', 'Europe/Berlin')
+    assert starts == ['2026-10-19T09:00:00+02:00', '2026-10-26T09:00:00+01:00', '2026-11-02T09:00:00+01:00']
+
+
+def test_leap_day_rule():
+    starts = _starts(['RRULE:FREQ=YEARLY;BYMONTH=2;BYMONTHDAY=29;COUNT=2'])
+    assert starts == ['2028-02-29T10:00:00+07:00', '2032-02-29T10:00:00+07:00']
+
+
+@pytest.mark.parametrize('rrule', [
+    'RRULE:FREQ=YEARLY;COUNT=3;BYMONTH=2;BYMONTHDAY=30',
+    'RRULE:FREQ=DAILY;COUNT=3;BYMONTH=2;BYMONTHDAY=30',
+    'RRULE:FREQ=MONTHLY;BYMONTH=4;BYMONTHDAY=31',
+    'RRULE:FREQ=WEEKLY;BYMONTH=2;BYMONTHDAY=30;UNTIL=20990101T000000Z',
+])
+def test_impossible_rule_yields_nothing_quickly(rrule):
+    started = time.monotonic()
+    assert _starts([rrule]) == []
+    assert time.monotonic() - started < 1
+
+
+@pytest.mark.parametrize('rrule', ['RRULE:FREQ=HOURLY;COUNT=3', 'RRULE:COUNT=3'])
+def test_unsupported_freq_raises(rrule):
+    with pytest.raises(ValueError):
+        _starts([rrule])
+
+
+def test_unbounded_rule_is_cut_at_horizon_and_cached(monkeypatch):
+    clear_cache()
+    master = {
+        'id': 'm', 'summary': 'Weekly',
+        'start': {'dateTime': '2026-10-20T10:00:00+07:00', 'timeZone': TZ},
+        'end': {'dateTime': '2026-10-20T11:00:00+07:00', 'timeZone': TZ},
+        'recurrence': ['RRULE:FREQ=WEEKLY']
+    }
+    first = materialize_instances(master)
+    assert 50 <= len(first) <= 60
+    assert first[0]['id'] == 'm_20261020T030000Z' and first[0]['recurringEventId'] == 'm'
+
+    expansions = []
+    original = recurrence_engine.RecurrenceSet.occurrences
+    monkeypatch.setattr(recurrence_engine.RecurrenceSet, 'occurrences',
+                        lambda self, until: expansions.append(until) or original(self, until))
+    assert materialize_instances(master) == first
+    assert expansions == []
+
+
+def test_occurrences_until_includes_until():
+    from datetime import datetime
+    import pytz
+    tz = pytz.timezone(TZ)
+    start = tz.localize(datetime(2026, 10, 20, 10))
+    result = occurrences_until('FREQ=DAILY', start, datetime(2026, 10, 22, 10))
+    assert [d.day for d in result] == [20, 21, 22]
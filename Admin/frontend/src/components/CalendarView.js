@@ -521,6 +521,7 @@ export default function CalendarView({ events, onEventClick, onDateSelect, onCre
     const checkTypeText = {
       'ai_suggestions': 'AI Đề Xuất Thông Minh',
       'traditional_fast': 'Kiểm Tra Nhanh',
+      'local_suggestions': 'Kiểm Tra Nhanh + Khung Giờ Trống',
       'ai_full': 'AI Phân Tích'
     }[checkType] || 'AI Phân Tích';
     
@@ -649,7 +650,15 @@ export default function CalendarView({ events, onEventClick, onDateSelect, onCre
           newEvent.teacher,
           formatForBackend(newEvent.start, newEvent.timezone),
           formatForBackend(newEvent.end, newEvent.timezone),
-          newEvent.id
+          newEvent.id,
+          {
+            recurrence: newEvent.recurrence || "",
+            repeat_count: newEvent.repeat_count || 1,
+            byday: newEvent.byday || [],
+            bymonthday: newEvent.bymonthday || [],
+            bymonth: newEvent.bymonth || [],
+            timezone: newEvent.timezone || "Asia/Ho_Chi_Minh"
+          }
         );
 
         // XỬ LÝ KẾT QUẢ AI
@@ -1,12 +1,14 @@
 // frontend/src/pages/AdminSchedule.js
-import React, { useEffect, useState } from "react";
-import { getClasses, addClass, updateClass, deleteClass, suggestClass, getEvent } from "../services/api";
+import React, { useEffect, useRef, useState } from "react";
+import { getClassesWithVersion, getClassChanges, openClassStream, addClass, updateClass, deleteClass, suggestClass, getEvent } from "../services/api";
 import ClassTable from "../components/ClassTable";
 import ClassForm from "../components/ClassForm";
 import CalendarView from "../components/CalendarView";
 import styles from "./AdminSchedule.module.css";
 import { parseZoomInfo } from "../utils/sanitizeDescription";
 
+const eventStartTime = (event) => new Date(event.start?.dateTime || event.start?.date || 0).getTime();
+
 export default function AdminSchedule() {
   const [classes, setClasses] = useState([]);
   const [editingClass, setEditingClass] = useState(null);
@@ -17,6 +19,10 @@ export default function AdminSchedule() {
   const [error, setError] = useState(null);
   const [success, setSuccess] = useState(null);
   const [calendarFilter, setCalendarFilter] = useState('both'); // 'odd', 'even', 'both'
+  // Version của dữ liệu đang hiển thị (X-Change-Version) để chỉ tải phần thay đổi
+  const changeVersion = useRef(null);
+  // Kết nối SSE nhận thay đổi của admin khác (mở lại sau mỗi lần tải toàn bộ)
+  const classStream = useRef(null);
 
   const loadClasses = async (filter = calendarFilter) => {
     try {
@@ -24,7 +30,11 @@ export default function AdminSchedule() {
       setError(null);
       
       // ✅ THÊM PARAMETER calendar_type
-      const data = await getClasses(filter);
+      const { classes: data, version } = await getClassesWithVersion(filter);
+      changeVersion.current = version;
+      if (version) {
+        openStream(filter, version);
+      }
       
       // ✅ THÊM DEBUG CHI TIẾT RECURRENCE VÀ CALENDAR DATA
       console.log("📦 FULL API RESPONSE STRUCTURE:", data);
@@ -61,8 +71,45 @@ export default function AdminSchedule() {
     }
   };
 
+  // Sau khi thêm/sửa/xoá: chỉ tải các event đã đổi (GET /classes/changes), lỗi hoặc hết hạn -> tải lại toàn bộ
+  const syncClasses = async (filter = calendarFilter) => {
+    if (!changeVersion.current) {
+      return loadClasses(filter);
+    }
+    try {
+      const changes = await getClassChanges(changeVersion.current, filter);
+      if (changes.reset) {
+        return loadClasses(filter);
+      }
+      applyChanges(changes);
+    } catch (err) {
+      console.warn("⚠️ Delta sync failed, reloading all classes:", err.message);
+      return loadClasses(filter);
+    }
+  };
+
+  const applyChanges = (changes) => {
+    changeVersion.current = changes.version;
+    const replaced = new Set([...changes.deleted, ...changes.upserted.map((event) => event.id)]);
+    setClasses((prev) =>
+      [...prev.filter((event) => !replaced.has(event.id)), ...changes.upserted].sort(
+        (a, b) => eventStartTime(a) - eventStartTime(b)
+      )
+    );
+    console.log(`🔄 Synced ${changes.upserted.length} changed, ${changes.deleted.length} deleted classes`);
+  };
+
+  const openStream = (filter, version) => {
+    classStream.current?.close();
+    classStream.current = openClassStream(version, filter, {
+      onChanges: applyChanges,
+      onReset: () => loadClasses(filter),
+    });
+  };
+
   useEffect(() => {
     loadClasses();
+    return () => classStream.current?.close();
   }, []);
 
   const showMessage = (message, type = "error") => {
@@ -128,7 +175,7 @@ export default function AdminSchedule() {
         bymonth: data.bymonth || [],
         timezone: data.timezone || "Asia/Ho_Chi_Minh"
       });
-      await loadClasses(calendarFilter);
+      await syncClasses(calendarFilter);
       setCreatingClass(null);
       showMessage("Class added successfully!", "success");
     } catch (err) {
@@ -162,7 +209,7 @@ export default function AdminSchedule() {
         timezone: data.timezone || "Asia/Ho_Chi_Minh"
       });
 
-      await loadClasses(calendarFilter);
+      await syncClasses(calendarFilter);
       setEditingClass(null);
       showMessage("Class updated successfully!", "success");
     } catch (err) {
@@ -226,7 +273,13 @@ export default function AdminSchedule() {
       console.log("🗑️ Delete result:", result);
       
       // Reload data
-      await loadClasses(calendarFilter);
+      await syncClasses(calendarFilter);
+      
+      // Không xoá được các buổi sau -> backend chỉ xoá buổi này (fallback)
+      if (result?.fallback) {
+        showMessage("⚠️ Chỉ xóa được buổi này, các buổi sau vẫn còn: " + result.fallback_reason);
+        return;
+      }
       
       // Hiển thị thông báo thành công
       showMessage("✅ Đã xóa sự kiện thành công!", "success");
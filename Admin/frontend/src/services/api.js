@@ -50,18 +50,74 @@ apiClient.interceptors.response.use(
   }
 );
 
-export const getClasses = async (calendarId = "primary") => {
+// options: { start, end, fields } - chỉ lấy events trong khoảng thời gian / các field cần
+// -> { classes, version }: version (X-Change-Version) dùng cho getClassChanges
+export const getClassesWithVersion = async (calendarId = "primary", options = {}) => {
   try {
+    const { start, end, fields } = options;
     const res = await apiClient.get(`/classes`, {
-      params: { calendar_id: calendarId, include_recurrence: true},
+      params: {
+        calendar_id: calendarId,
+        calendar_type: calendarId,
+        include_recurrence: true,
+        start: start || undefined,
+        end: end || undefined,
+        fields: fields ? fields.join(",") : undefined,
+      },
     });
-    return res.data;
+    // Backend trả snapshot cũ khi Google Calendar lỗi/chậm
+    if (res.headers["x-data-stale"] === "true") {
+      console.warn(`⚠️ Schedule data is stale (${res.headers["x-data-age-seconds"]}s old, ${res.headers["x-data-source"]})`);
+    }
+    return { classes: res.data, version: res.headers["x-change-version"] || null };
   } catch (error) {
     console.error("Get classes error:", error);
     throw new Error(`Failed to fetch classes: ${error.message}`);
   }
 };
 
+export const getClasses = async (calendarId = "primary", options = {}) => {
+  const { classes } = await getClassesWithVersion(calendarId, options);
+  return classes;
+};
+
+// Chỉ các event thay đổi sau version -> { version, reset, upserted, deleted }
+// reset = true: version đã hết hạn, cần tải lại toàn bộ bằng getClassesWithVersion
+// options: { start, end } giống lần gọi getClassesWithVersion (event dời ra ngoài khoảng nằm trong deleted)
+export const getClassChanges = async (since, calendarType = "both", options = {}) => {
+  try {
+    const { start, end } = options;
+    const res = await apiClient.get(`/classes/changes`, {
+      params: { since, calendar_type: calendarType, start: start || undefined, end: end || undefined },
+    });
+    return res.data;
+  } catch (error) {
+    console.error("Get class changes error:", error);
+    throw new Error(`Failed to fetch class changes: ${error.message}`);
+  }
+};
+
+// Server-Sent Events: backend đẩy delta khi lịch thay đổi (kể cả do admin khác)
+// handlers: { onChanges(changes), onReset() } - EventSource tự kết nối lại và gửi Last-Event-ID để resume
+// options: { start, end } giống lần gọi getClassesWithVersion
+export const openClassStream = (since, calendarType = "both", handlers = {}, options = {}) => {
+  const params = new URLSearchParams({ calendar_type: calendarType });
+  if (since) {
+    params.set("since", since);
+  }
+  if (options.start) {
+    params.set("start", options.start);
+  }
+  if (options.end) {
+    params.set("end", options.end);
+  }
+  const source = new EventSource(`${API_URL}/classes/stream?${params}`);
+  source.addEventListener("changes", (e) => handlers.onChanges?.(JSON.parse(e.data)));
+  source.addEventListener("reset", () => handlers.onReset?.());
+  source.onerror = () => console.warn("⚠️ Class stream disconnected, reconnecting...");
+  return source;
+};
+
 export const addClass = async (data) => {
   try {
     console.log("📤 Sending class data to backend:", data);
@@ -115,12 +171,36 @@ export const deleteClass = async (id, deleteMode = 'this') => {
   }
 };
 
-export const suggestClass = async (teacher, duration_hours) => {
+// Tạo nhiều class 1 lần (vd: cả học kỳ) - mỗi item có kết quả riêng
+export const addClassesBulk = async (classes) => {
+  try {
+    const res = await apiClient.post(`/classes/bulk`, { classes }, { timeout: 60000 });
+    return res.data;
+  } catch (error) {
+    console.error("Bulk add classes error:", error);
+    throw error;
+  }
+};
+
+// Xoá nhiều class 1 lần - mỗi id có kết quả riêng
+export const deleteClassesBulk = async (eventIds) => {
+  try {
+    const res = await apiClient.delete(`/classes/bulk`, { data: { event_ids: eventIds }, timeout: 60000 });
+    return res.data;
+  } catch (error) {
+    console.error("Bulk delete classes error:", error);
+    throw error;
+  }
+};
+
+// options: { preferred_times: "09:00,14:00", top_n, timezone, use_ai }
+export const suggestClass = async (teacher, duration_hours, options = {}) => {
   try {
     const res = await apiClient.get(`/ai/suggest`, {
       params: { 
         teacher: teacher || undefined, // chỉ gửi nếu có giá trị
-        duration_hours 
+        duration_hours,
+        ...options
       },
       timeout: 30000,
     });
@@ -154,7 +234,8 @@ export const getEvent = async (eventId, calendarId = "primary") => {
   }
 };
 
-export const checkScheduleConflict = async (teacher, start, end, excludeEventId = null) => {
+// recurrence: { recurrence, repeat_count, byday, bymonthday, bymonth, timezone } - kiểm tra mọi buổi của lớp lặp lại
+export const checkScheduleConflict = async (teacher, start, end, excludeEventId = null, recurrence = {}) => {
   try {
     console.log("🔍 Checking schedule conflict...");
     
@@ -162,7 +243,8 @@ export const checkScheduleConflict = async (teacher, start, end, excludeEventId
       teacher: teacher,
       start: start,
       end: end,
-      exclude_event_id: excludeEventId
+      exclude_event_id: excludeEventId,
+      ...recurrence
     }, {
       timeout: 60000  // 🆕 60 seconds timeout
     });
@@ -180,7 +262,8 @@ export const checkScheduleConflict = async (teacher, start, end, excludeEventId
         teacher: teacher,
         start: start,
         end: end,
-        exclude_event_id: excludeEventId
+        exclude_event_id: excludeEventId,
+        ...recurrence
       }, {
         timeout: 30000
       });
@@ -196,6 +279,17 @@ export const checkScheduleConflict = async (teacher, start, end, excludeEventId
   }
 };
 
+// Gợi ý AI của 1 lần kiểm tra xung đột đã quá deadline (ai_status: "pending")
+export const getConflictAiResult = async (jobId) => {
+  try {
+    const res = await apiClient.get(`/check-conflict/ai/${jobId}`);
+    return res.data;  // { status: "pending" | "done" | "error", suggestions, ai_analysis }
+  } catch (error) {
+    console.error("Get AI conflict result error:", error);
+    throw error;
+  }
+};
+
 // 🆕 HÀM FALLBACK CỤC BỘ
 const traditionalFallbackCheck = async (teacher, start, end) => {
   // Logic check đơn giản không cần API